@@ -0,0 +1,100 @@
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from numpy import ndarray
+from sc2.ids.unit_typeid import UnitTypeId as UnitID
+
+from MapAnalyzer.utils import get_structure_footprint_points
+
+if TYPE_CHECKING:
+    from MapAnalyzer.Pather import MapAnalyzerPather
+
+# UnitTypeId value and position of a structure, which give the points it makes nonpathable
+Footprint = Tuple[int, float, float]
+
+
+class MapAnalyzerGridManager:
+    """
+    Keeps the ground and climber grids of the pather up to date across steps.
+    Only the structures that were built, destroyed, lowered or raised since the last request are
+    stamped on the grids, which are rebuilt when minerals or destructables are removed from the base grids.
+    """
+
+    def __init__(self, pather: "MapAnalyzerPather") -> None:
+        self.pather = pather
+        self._footprints: Dict[int, Footprint] = {}
+        # number of structures on each point, so overlapping footprints can be removed one by one
+        self._structure_count = np.zeros(pather.default_grid.shape, dtype=np.int16)
+        # base grid and the grid with the structures, by climber and include_destructables
+        self._grids: Dict[Tuple[bool, bool], Tuple[ndarray, ndarray]] = {}
+        self._clean_air_grid: Optional[ndarray] = None
+
+    def clear(self) -> None:
+        """Drops the grids, so they are rebuilt from the base grids on the next request."""
+        self._grids = {}
+
+    def _get_points(self, footprints: List[Footprint]) -> Tuple[ndarray, ndarray]:
+        footprints = np.array(footprints, dtype=float).reshape(-1, 3)
+        return get_structure_footprint_points(footprints[:, 1:], footprints[:, 0], self._structure_count.shape)
+
+    def _update_structures(self) -> None:
+        bot = self.pather.map_data.bot
+        structures = bot.structures.not_flying
+        structures.extend(bot.enemy_structures.not_flying)
+        footprints = {
+            s.tag: (s.type_id.value, *s.position) for s in structures
+            if (s.type_id != UnitID.SUPPLYDEPOTLOWERED or s.is_active)
+            and (s.type_id != UnitID.CREEPTUMOR or not s.is_ready)
+        }
+        if footprints == self._footprints:
+            return
+
+        # a structure that moved, like a landed command center, is removed and added again
+        removed = [fp for tag, fp in self._footprints.items() if footprints.get(tag) != fp]
+        added = [fp for tag, fp in footprints.items() if self._footprints.get(tag) != fp]
+        self._footprints = footprints
+
+        removed_xs, removed_ys = self._get_points(removed)
+        added_xs, added_ys = self._get_points(added)
+        xs = np.concatenate((removed_xs, added_xs))
+        ys = np.concatenate((removed_ys, added_ys))
+        # counting every point at once, points repeat where footprints overlap
+        changes = np.bincount(np.ravel_multi_index((xs, ys), self._structure_count.shape),
+                              weights=np.repeat([-1, 1], [len(removed_xs), len(added_xs)]),
+                              minlength=self._structure_count.size)
+        self._structure_count += changes.reshape(self._structure_count.shape).astype(np.int16)
+
+        for base, grid in self._grids.values():
+            grid[xs, ys] = np.where((base[xs, ys] != 0) & (self._structure_count[xs, ys] == 0), 1, np.inf)
+            self.pather._bump_grid_version(grid)
+
+    def get_ground_grid(self, climber: bool = False, include_destructables: bool = True) -> ndarray:
+        """
+        Ground grid with a weight of 1 on pathable points and np.inf on the rest.
+        The grid is shared across calls, copy it before making changes.
+        """
+        self.pather._update_removed_resources(include_destructables)
+        self._update_structures()
+
+        key = (climber, include_destructables)
+        entry = self._grids.get(key)
+        if entry is None:
+            base = self.pather.get_base_pathing_grid(include_destructables)
+            if climber:
+                base = np.where(self.pather.map_data.c_ext_map.climber_grid != 0, 1, base)
+            grid = np.where((base != 0) & (self._structure_count == 0), 1, np.inf).astype(np.float32)
+            entry = (base, grid)
+            self._grids[key] = entry
+        return entry[1]
+
+    def get_clean_air_grid(self) -> ndarray:
+        """
+        Air grid with a weight of 1 inside the playable area, it doesn't change during the game.
+        The grid is shared across calls, copy it before making changes.
+        """
+        if self._clean_air_grid is None:
+            clean_air_grid = np.full(self.pather.default_grid.shape, np.inf, dtype=np.float32)
+            area = self.pather.map_data.bot.game_info.playable_area
+            clean_air_grid[area.x:(area.x + area.width), area.y:(area.y + area.height)] = 1
+            self._clean_air_grid = clean_air_grid
+        return self._clean_air_grid
@@ -1,3 +1,4 @@
+import asyncio
 import math
 from itertools import chain
 from functools import lru_cache
@@ -13,7 +14,7 @@ from scipy.ndimage import binary_fill_holes, center_of_mass, generate_binary_str
 from scipy.spatial import distance
 
 from MapAnalyzer.Debugger import MapAnalyzerDebugger
-from MapAnalyzer.Pather import MapAnalyzerPather
+from MapAnalyzer.Pather import MapAnalyzerPather, PathCacheInfo
 from MapAnalyzer.Region import Region
 from MapAnalyzer.utils import get_sets_with_mutual_elements, fix_map_ramps
 
@@ -22,7 +23,7 @@ from .constants import BINARY_STRUCTURE, CORNER_MIN_DISTANCE, MAX_REGION_AREA, M
 from .decorators import progress_wrapped
 from .exceptions import CustomDeprecationWarning
 from MapAnalyzer.constructs import ChokeArea, MDRamp, VisionBlockerArea, RawChoke
-from .cext import CMapInfo, CMapChoke
+from .cext import CMapInfo, CMapChoke, DStarLitePlanner, PathStatus
 
 try:
     __version__ = get_distribution('sc2mapanalyzer')
@@ -268,7 +269,12 @@ class MapData:
 
     def pathfind(self, start: Union[Tuple[float, float], Point2], goal: Union[Tuple[float, float], Point2],
                  grid: Optional[ndarray] = None, large: bool = False, smoothing: bool = False,
-                 sensitivity: int = 1) -> Optional[List[Point2]]:
+                 sensitivity: int = 1, jps: Optional[bool] = None, max_expansions: Optional[int] = None,
+                 max_cost: Optional[float] = None, max_distance: Optional[float] = None,
+                 return_status: bool = False, any_angle: bool = False, unit_radius: Optional[float] = None,
+                 bidirectional: bool = False, as_array: bool = False
+                 ) -> Union[Optional[List[Point2]], Optional[ndarray], Tuple[Optional[List[Point2]], PathStatus],
+                            Tuple[Optional[ndarray], PathStatus]]:
         """
         :rtype: Union[List[:class:`sc2.position.Point2`], None]
         Will return the path with lowest cost (sum) given a weighted array (``grid``), ``start`` , and ``goal``.
@@ -295,23 +301,507 @@ class MapData:
         it will skip all the waypoints it can if taking the straight line forward is better
         according to the influence grid
 
+        ``jps`` selects jump point search, which only expands the points where the path can turn
+        and is much faster on grids where every pathable point has the same cost (no influence added).
+        By default it's used automatically when the grid is uniform and ``large`` is False.
+        ``True`` forces it, treating every pathable point as having the same cost, ``False`` disables it.
+
+        ``max_expansions``, ``max_cost`` and ``max_distance`` put a hard limit on how long the search can take.
+        The search stops after expanding ``max_expansions`` points, and doesn't visit points that cost more
+        than ``max_cost`` to reach or are further than ``max_distance`` from ``start`` in a straight line.
+        If a limit stops the search before it reaches ``goal``, the path leads to the point closest
+        to ``goal`` that was found instead of returning ``None``. Bounded searches don't use jump point search.
+
+        ``return_status`` returns a tuple of the path and a :class:`.PathStatus`
+        that tells whether the path reaches the goal or which limit was hit.
+
+        ``any_angle`` searches with theta*, which connects points in straight lines during the search
+        instead of smoothing the path afterwards. The path is a short list of waypoints with a clear
+        straight line between each of them, and is usually shorter than with ``smoothing``.
+        It's used only for units that aren't ``large`` and can't be combined with the limits.
+        Keep ``sensitivity`` at 1 so no waypoints are skipped.
+
+        ``unit_radius`` keeps the path away from points where a unit of that radius doesn't fit,
+        using the clearance of the grid (see :meth:`.MapData.get_clearance_grid`).
+        It's more accurate than ``large`` for units like Thors, Ultralisks and massive air units.
+        The clearance is computed once per grid and radius, and again after :meth:`.MapData.add_cost`
+        changes the grid, so changes made to the grid in some other way aren't seen.
+
+        ``bidirectional`` searches from ``start`` and ``goal`` at the same time until the searches meet.
+        The path costs the same, but long paths across the map expand fewer points.
+        It's used instead of jump point search and can't be combined with ``any_angle`` or the limits.
+
+        ``as_array`` returns the path as an ``int32`` array of shape ``(N, 2)`` instead of a list of
+        :class:`sc2.position.Point2`, already sliced with ``sensitivity``.
+        This is cheaper when only a few points of the path are used, for example the next waypoint.
+
         Example:
             >>> my_grid = self.get_pyastar_grid()
             >>> # start / goal could be any tuple / Point2
             >>> st, gl = (50,75) , (100,100)
             >>> path = self.pathfind(start=st,goal=gl,grid=my_grid, large=False, smoothing=False, sensitivity=3)
+            >>> # the same path, found without jump point search
+            >>> astar_path = self.pathfind(start=st, goal=gl, grid=my_grid, sensitivity=3, jps=False)
+            >>> # stop early, moving towards the goal
+            >>> partial_path, status = self.pathfind(start=st, goal=gl, grid=my_grid, max_expansions=100,
+            ...                                      return_status=True)
+            >>> status
+            <PathStatus.EXPANSION_LIMIT: 2>
+            >>> # a few waypoints in straight lines
+            >>> waypoints = self.pathfind(start=st, goal=gl, grid=my_grid, any_angle=True)
+            >>> # a path a thor fits through
+            >>> thor_path = self.pathfind(start=st, goal=gl, grid=my_grid, unit_radius=1.25)
+            >>> # a long path searched from both ends
+            >>> reinforcement_path = self.pathfind(start=st, goal=(150, 140), grid=my_grid, bidirectional=True)
+            >>> # only the next waypoint is needed
+            >>> next_waypoint = Point2(self.pathfind(start=st, goal=gl, grid=my_grid, sensitivity=5, as_array=True)[0])
 
         See Also:
             * :meth:`.MapData.get_pyastar_grid`
             * :meth:`.MapData.find_lowest_cost_points`
+            * :meth:`.MapData.get_clearance_grid`
 
         """
         return self.pather.pathfind(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
-                                    sensitivity=sensitivity)
+                                    sensitivity=sensitivity, jps=jps, max_expansions=max_expansions,
+                                    max_cost=max_cost, max_distance=max_distance, return_status=return_status,
+                                    any_angle=any_angle, unit_radius=unit_radius, bidirectional=bidirectional,
+                                    as_array=as_array)
+
+    def get_clearance_grid(self, grid: ndarray) -> ndarray:
+        """
+        :rtype: numpy.ndarray
+        Returns a ``float32`` array with the clearance of each point of ``grid``, the distance from the
+        center of the point to the closest nonpathable point (:class:`numpy.inf`) or the edge of the map.
+        A unit fits on a point when its radius is at most the clearance, nonpathable points have a clearance of 0.
+
+        The array is computed once and reused until :meth:`.MapData.add_cost` changes the grid,
+        don't modify it.
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> clearance = self.get_clearance_grid(my_grid)
+            >>> thor_fits = clearance[(50, 75)] >= 1.25
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+
+        """
+        return self.pather.get_clearance_grid(grid)
+
+    def set_path_cache_size(self, size: int) -> None:
+        """
+        Enables caching the results of :meth:`.MapData.pathfind` for up to ``size`` requests,
+        the least recently used ones are dropped first. ``0`` (the default) disables the cache.
+
+        Requests are the same when ``start`` and ``goal`` round to the same points and the other
+        arguments are the same, including the same ``grid`` object.
+        Changing a grid with :meth:`.MapData.add_cost` or :meth:`.MapData.add_cost_to_multiple_grids`
+        makes its cached paths unused, and noticing destroyed destructables or mineral walls clears the cache.
+        Grids that are modified in other ways should be copied or the cache cleared with
+        :meth:`.MapData.clear_path_cache`.
+
+        Useful when many units request the same paths on the same grid during a step.
+
+        Example:
+            >>> self.set_path_cache_size(256)
+            >>> my_grid = self.get_pyastar_grid()
+            >>> path = self.pathfind((50, 75), (100, 100), grid=my_grid)
+            >>> same_path = self.pathfind((50.2, 74.9), (100, 100), grid=my_grid)
+            >>> self.path_cache_info()
+            PathCacheInfo(hits=1, misses=1, maxsize=256, currsize=1)
+            >>> self.set_path_cache_size(0)
+
+        See Also:
+            * :meth:`.MapData.path_cache_info`
+            * :meth:`.MapData.clear_path_cache`
+
+        """
+        self.pather.set_path_cache_size(size)
+
+    def clear_path_cache(self) -> None:
+        """
+        Removes all the cached paths, see :meth:`.MapData.set_path_cache_size`
+
+        """
+        self.pather.clear_path_cache()
+
+    def path_cache_info(self) -> PathCacheInfo:
+        """
+        :rtype: PathCacheInfo
+        Returns a named tuple of ``hits``, ``misses``, ``maxsize`` and ``currsize`` of the path cache,
+        like ``functools.lru_cache`` does. See :meth:`.MapData.set_path_cache_size`
+
+        """
+        return self.pather.path_cache_info()
+
+    def pathfind_to_nearest(self, start: Union[Tuple[float, float], Point2],
+                            goals: List[Union[Tuple[float, float], Point2]],
+                            grid: Optional[ndarray] = None, large: bool = False, smoothing: bool = False,
+                            sensitivity: int = 1) -> Optional[Tuple[Point2, List[Point2], float]]:
+        """
+        :rtype: Union[Tuple[:class:`sc2.position.Point2`, List[:class:`sc2.position.Point2`], float], None]
+        Will find the cheapest path from ``start`` to whichever of the ``goals`` is the cheapest to reach.
+
+        Returns a tuple of the reached goal (as it was given in ``goals``), the path to it (like
+        :meth:`.MapData.pathfind` returns) and the cost of the path.
+
+        All the goals are searched for at the same time, so this is much cheaper than calling
+        :meth:`.MapData.pathfind` for each goal and comparing the results.
+
+        **IF NO** ``grid`` **has been provided**, will request a fresh grid from :class:`.Pather`
+
+        If none of the goals can be reached, will return ``None``
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> start = self.bot.townhalls[0].position
+            >>> goal, path, cost = self.pathfind_to_nearest(start=start, goals=self.base_locations, grid=my_grid)
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+            * :meth:`.MapData.find_lowest_cost_points`
+
+        """
+        return self.pather.pathfind_to_nearest(start=start, goals=goals, grid=grid, large=large, smoothing=smoothing,
+                                               sensitivity=sensitivity)
+
+    def pathfind_many(self, starts: Union[ndarray, List[Point2]], goals: Union[ndarray, List[Point2]],
+                      grid: Optional[ndarray] = None, large: bool = False,
+                      smoothing: bool = False) -> List[Optional[ndarray]]:
+        """
+        :rtype: List[Union[numpy.ndarray, None]]
+        Will return the paths with lowest cost for many ``start`` / ``goal`` pairs on the same ``grid``.
+
+        ``starts`` and ``goals`` are arrays of shape (N, 2) (or lists of points) where ``starts[i]`` is paired
+        with ``goals[i]``.
+
+        The grid is validated only once and all of the searches run in a single call to the c extension,
+        which is much cheaper than calling :meth:`.MapData.pathfind` for every pair.
+
+        Returns a list with one ``int32`` array of shape (M, 2) per pair, containing the whole path
+        (including the start point), or ``None`` if there is no path for that pair.
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> starts = np.array([[50, 75], [60, 80]])
+            >>> goals = np.array([[100, 100], [100, 100]])
+            >>> paths = self.pathfind_many(starts=starts, goals=goals, grid=my_grid)
+            >>> len(paths)
+            2
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+            * :meth:`.MapData.get_pyastar_grid`
+
+        """
+        return self.pather.pathfind_many(starts=starts, goals=goals, grid=grid, large=large, smoothing=smoothing)
+
+    def get_flow_field(self, goal: Union[Tuple[float, float], Point2], grid: Optional[ndarray] = None,
+                       large: bool = False) -> Optional[Tuple[ndarray, ndarray]]:
+        """
+        :rtype: Union[Tuple[numpy.ndarray, numpy.ndarray], None]
+        Will run a single search outwards from ``goal`` over the whole ``grid`` and return a tuple of
+
+            * a ``float32`` array with the cost of the cheapest path from each point to the goal
+              (:class:`numpy.inf` for points that can't reach the goal)
+            * a ``uint8`` array with the direction of the next step towards the goal from each point
+
+        The direction is an index into :data:`MapAnalyzer.cext.FLOW_FIELD_OFFSETS`,
+        the goal itself and points that can't reach it are marked with :data:`MapAnalyzer.cext.NO_DIRECTION`
+
+        When many units are going to the same goal, this is much cheaper than calling :meth:`.MapData.pathfind`
+        for each unit, every unit can read its next step from the field.
+
+        **IF NO** ``grid`` **has been provided**, will request a fresh grid from :class:`.Pather`
+
+        If the goal isn't pathable and no pathable point is nearby, will return ``None``
+
+        Example:
+            >>> from MapAnalyzer.cext import FLOW_FIELD_OFFSETS, NO_DIRECTION
+            >>> my_grid = self.get_pyastar_grid()
+            >>> costs, directions = self.get_flow_field(goal=(100, 100), grid=my_grid)
+            >>> unit_position = (50, 75)
+            >>> if directions[unit_position] != NO_DIRECTION:
+            ...     next_step = Point2(unit_position) + Point2(FLOW_FIELD_OFFSETS[directions[unit_position]])
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+            * :meth:`.MapData.get_pyastar_grid`
+
+        """
+        return self.pather.get_flow_field(goal=goal, grid=grid, large=large)
+
+    def reachable_within(self, start: Union[Tuple[float, float], Point2], max_cost: float,
+                         grid: Optional[ndarray] = None, large: bool = False) -> Optional[Tuple[ndarray, ndarray]]:
+        """
+        :rtype: Union[Tuple[numpy.ndarray, numpy.ndarray], None]
+        Will find every point that can be reached from ``start`` with a path that costs at most ``max_cost``
+        on ``grid``, and return a tuple of
+
+            * an ``int32`` array of shape ``(N, 2)`` with the reached points, cheapest first
+            * a ``float32`` array with the cost of the cheapest path to each of them
+
+        Costs are the same as the ones :meth:`.MapData.pathfind` sums up, so on a grid where every
+        weight is 1 the cost is the walking distance. It comes from a single search that stops at ``max_cost``,
+        which is much cheaper than calling :meth:`.MapData.pathfind` for every point of interest.
+
+        **IF NO** ``grid`` **has been provided**, will request a fresh grid from :class:`.Pather`
+
+        If the start isn't pathable and no pathable point is nearby, will return ``None``
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> # where can a stalker (speed 4.13) get to in the next 5 seconds
+            >>> points, costs = self.reachable_within(start=(50, 75), max_cost=4.13 * 5, grid=my_grid)
+            >>> reachable_grid = np.zeros(my_grid.shape, dtype=bool)
+            >>> reachable_grid[points[:, 0], points[:, 1]] = True
+
+        See Also:
+            * :meth:`.MapData.get_flow_field`
+            * :meth:`.MapData.pathfind`
+
+        """
+        return self.pather.reachable_within(start=start, max_cost=max_cost, grid=grid, large=large)
+
+    def create_planner(self, start: Union[Tuple[float, float], Point2], goal: Union[Tuple[float, float], Point2],
+                       grid: Optional[ndarray] = None, large: bool = False) -> Optional[DStarLitePlanner]:
+        """
+        :rtype: Union[:class:`.DStarLitePlanner`, None]
+        Creates an incremental planner for paths to ``goal``, for units that follow one path for a long time
+        while the grid keeps changing around them.
+
+        The planner keeps a copy of ``grid``. Give it only the points whose weights changed with
+        ``planner.update(points, weights)``, and ``planner.find_path(start)`` will repair the previous
+        search instead of starting over. ``start`` can be the current position of the unit.
+        ``find_path`` returns the complete path as an array of points, or ``None`` if the goal can't be reached.
+
+        The repair is the cheapest when the changes are close to the unit, for example when
+        influence is added around enemies that come into vision.
+
+        **IF NO** ``grid`` **has been provided**, will request a fresh grid from :class:`.Pather`
+
+        Returns ``None`` if there are no pathable points near ``start`` or ``goal``.
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> planner = self.create_planner(start=(50, 75), goal=(100, 100), grid=my_grid)
+            >>> path = planner.find_path()
+            >>> planner.update([(60, 80), (61, 80)], 50)
+            >>> new_path = planner.find_path(start=path[3])
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+
+        """
+        return self.pather.create_planner(start=start, goal=goal, grid=grid, large=large)
+
+    def pathfind_threadsafe(self, start: Union[Tuple[float, float], Point2], goal: Union[Tuple[float, float], Point2],
+                            grid: ndarray, large: bool = False, smoothing: bool = False,
+                            sensitivity: int = 1) -> Optional[List[Point2]]:
+        """
+        :rtype: Union[List[:class:`sc2.position.Point2`], None]
+        Same as :meth:`.MapData.pathfind`, but can be called from worker threads.
+
+        The search in the c extension releases the GIL, so multiple paths can be
+        calculated at the same time.
+
+        Unlike ``pathfind``, a ``grid`` is required, since creating a fresh grid reads the bot state
+        which changes on every step. Don't modify the grid while paths are being calculated on it.
+
+        Example:
+            >>> from concurrent.futures import ThreadPoolExecutor
+            >>> my_grid = self.get_pyastar_grid()
+            >>> goals = [(100, 100), (120, 60)]
+            >>> with ThreadPoolExecutor(max_workers=2) as executor:
+            ...     paths = list(executor.map(lambda gl: self.pathfind_threadsafe((50, 75), gl, my_grid), goals))
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+            * :meth:`.MapData.get_pyastar_grid`
+
+        """
+        return self.pather.pathfind_threadsafe(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
+                                               sensitivity=sensitivity)
+
+    def pathfind_async(self, start: Union[Tuple[float, float], Point2], goal: Union[Tuple[float, float], Point2],
+                       grid: Optional[ndarray] = None, large: bool = False, smoothing: bool = False,
+                       sensitivity: int = 1, jps: Optional[bool] = None, unit_radius: Optional[float] = None,
+                       bidirectional: bool = False, as_array: bool = False) -> asyncio.Future:
+        """
+        :rtype: asyncio.Future
+        Same as :meth:`.MapData.pathfind`, but returns a future to ``await`` instead of blocking the step.
+
+        The requests are calculated by a pool of worker threads, and since the search in the c extension
+        releases the GIL, many paths are calculated at the same time while the bot keeps running.
+        Requests with the same rounded ``start`` and ``goal``, ``grid`` and options made on the same game loop
+        are calculated once, and each of them gets its own copy of the path.
+
+        The ``grid`` is read by the workers while the paths are being calculated, so don't change it until
+        the futures are done. :meth:`.MapData.add_cost` made before the request is fine, it's a new request
+        afterwards. :meth:`.MapData.wait_for_paths` waits for the requests of the current game loop.
+
+        Example:
+            >>> import asyncio
+            >>> async def on_step(iteration):
+            ...     my_grid = self.get_pyastar_grid()
+            ...     paths = await asyncio.gather(*(self.pathfind_async(unit.position, (100, 100), my_grid)
+            ...                                    for unit in self.bot.units))
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+            * :meth:`.MapData.wait_for_paths`
+
+        """
+        return self.pather.pathfind_async(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
+                                          sensitivity=sensitivity, jps=jps, unit_radius=unit_radius,
+                                          bidirectional=bidirectional, as_array=as_array)
+
+    async def wait_for_paths(self) -> None:
+        """
+        Waits until the paths requested with :meth:`.MapData.pathfind_async` on the current game loop
+        are calculated, for example at the end of ``on_step`` so they are all ready before the next step.
+
+        See Also:
+            * :meth:`.MapData.pathfind_async`
+
+        """
+        await self.pather.pathing_service.join()
+
+    def pathfind_hierarchical(self, start: Union[Tuple[float, float], Point2],
+                              goal: Union[Tuple[float, float], Point2],
+                              grid: Optional[ndarray] = None, large: bool = False, smoothing: bool = False,
+                              sensitivity: int = 1, refined_segments: int = 2) -> Optional[List[Point2]]:
+        """
+        :rtype: Union[List[:class:`sc2.position.Point2`], None]
+        Faster version of :meth:`.MapData.pathfind` for long distance queries.
+
+        The route is first searched on a graph of the map chokes and ramps, where chokes that
+        border the same region are connected by their ground distance. Only the first
+        ``refined_segments`` parts of the route (from ``start`` to the first choke, from there to the next one...)
+        are searched on ``grid``, and the remaining chokes and ``goal`` are added to the path as waypoints.
+
+        The result can be used like the result of ``pathfind``, but only the refined part is a complete path.
+        Calling this again as the unit moves refines the next segments.
+
+        The choke graph is the one behind :meth:`.MapData.ground_distance`, it doesn't include structures
+        or the influence in ``grid``, those are only taken into account for the refined segments.
+        If ``start`` and ``goal`` are in the same region, or the route is blocked on ``grid``,
+        this falls back to ``pathfind``.
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> path = self.pathfind_hierarchical(start=(30, 50), goal=(140, 160), grid=my_grid)
+
+        See Also:
+            * :meth:`.MapData.pathfind`
+            * :meth:`.MapData.get_pyastar_grid`
+
+        """
+        return self.pather.pathfind_hierarchical(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
+                                                 sensitivity=sensitivity, refined_segments=refined_segments)
+
+    def ground_distance(self, a: Union[ChokeArea, Point2, Tuple[float, float]],
+                        b: Union[ChokeArea, Point2, Tuple[float, float]]) -> float:
+        """
+        :rtype: float
+        Ground distance between two chokes (including ramps and vision blockers from ``map_chokes``)
+        or ``base_locations``, from a matrix that is computed when the map is compiled.
+
+        One of ``a`` and ``b`` can also be any point on the map, then the distance is looked up
+        from the distance field of the other one.
+
+        Structures are not taken into account, but destructables and mineral walls are.
+        When they are destroyed, the distances are computed again the next time they are needed,
+        after the change was noticed by requesting a grid (or by :meth:`.MapData.refresh_ground_distances`).
+
+        Returns ``inf`` if there is no ground path between ``a`` and ``b``.
+
+        Example:
+            >>> base_a, base_b = self.base_locations[0], self.base_locations[1]
+            >>> distance = self.ground_distance(base_a, base_b)
+            >>> choke_distance = self.ground_distance(self.map_chokes[0], base_a)
+
+        See Also:
+            * :meth:`.MapData.ground_next_hop`
+            * :meth:`.MapData.pathfind_hierarchical`
+
+        """
+        return self.pather.ground_distance(a, b)
+
+    def ground_next_hop(self, a: Union[ChokeArea, Point2, Tuple[float, float]],
+                        b: Union[ChokeArea, Point2, Tuple[float, float]]) -> Optional[Union[ChokeArea, Point2]]:
+        """
+        :rtype: Union[:class:`.ChokeArea`, :class:`sc2.position.Point2`, None]
+        The next choke or base location to pass through on the ground route from ``a`` to ``b``,
+        which are chokes or ``base_locations`` like in :meth:`.MapData.ground_distance`.
+
+        When ``b`` is reached from ``a`` directly, this is ``b``, so the route can be followed
+        by calling this again with the result until ``b`` is returned.
+        Returns ``None`` if ``a`` and ``b`` are the same or not connected.
+
+        Example:
+            >>> next_area = self.ground_next_hop(self.base_locations[0], self.base_locations[-1])
+
+        See Also:
+            * :meth:`.MapData.ground_distance`
+
+        """
+        return self.pather.ground_next_hop(a, b)
+
+    def refresh_ground_distances(self) -> None:
+        """
+        Check for destroyed destructables and mineral walls and compute the ground distances again
+        if any were removed. This is done automatically when grids are requested,
+        so this is only needed when no grids are requested during the game.
+
+        See Also:
+            * :meth:`.MapData.ground_distance`
+
+        """
+        self.pather.refresh_ground_graph()
+
+    def pathfind_with_portals(self, start: Union[Tuple[float, float], Point2], goal: Union[Tuple[float, float], Point2],
+                              portals: List[Tuple[Union[Tuple[float, float], Point2], Union[Tuple[float, float], Point2],
+                                                  float]],
+                              grid: Optional[ndarray] = None, large: bool = False, smoothing: bool = False,
+                              sensitivity: int = 1) -> Optional[List[List[Point2]]]:
+        """
+        :rtype: Union[List[List[:class:`sc2.position.Point2`]], None]
+        Like :meth:`.MapData.pathfind`, but the path can also go through ``portals``.
+
+        A portal is a tuple of ``(entry, exit, cost)``, a one way shortcut from the ``entry`` point
+        to the ``exit`` point that costs ``cost`` to take, whatever the distance between them.
+        The search looks up the portals of each point directly, so adding many of them stays cheap.
+        The ``exit`` can be on an unpathable point (the middle of a building for example),
+        the path then has to leave it through another portal.
+
+        Returns a list of path segments. The path goes through a portal from the last point of
+        a segment to the first point of the next one, every segment is walked.
+
+        If no path is possible, will return ``None``
+
+        ``grid``, ``large``, ``smoothing`` and ``sensitivity`` work like in :meth:`.MapData.pathfind`,
+        each segment is smoothed and sliced on its own.
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> # a shortcut over a cliff that takes about as long as 4 steps
+            >>> portals = [((60, 75), (70, 75), 4)]
+            >>> segments = self.pathfind_with_portals(start=(50, 75), goal=(100, 100), portals=portals, grid=my_grid)
+
+        See Also:
+            * :meth:`.MapData.pathfind_with_nyduses`
+            * :meth:`.MapData.get_pyastar_grid`
+
+        """
+        return self.pather.pathfind_with_portals(start=start, goal=goal, portals=portals, grid=grid, large=large,
+                                                 smoothing=smoothing, sensitivity=sensitivity)
 
     def pathfind_with_nyduses(self, start: Union[Tuple[float, float], Point2], goal: Union[Tuple[float, float], Point2],
                  grid: Optional[ndarray] = None, large: bool = False, smoothing: bool = False,
-                 sensitivity: int = 1) -> Optional[Tuple[List[List[Point2]], Optional[List[int]]]]:
+                 sensitivity: int = 1, as_array: bool = False
+                 ) -> Optional[Tuple[Union[List[List[Point2]], List[ndarray]], Optional[List[int]]]]:
         """
         :rtype: Union[List[List[:class:`sc2.position.Point2`]], None]
         Will return the path with lowest cost (sum) given a weighted array (``grid``), ``start`` , and ``goal``.
@@ -345,6 +835,9 @@ class MapData:
         it will skip all the waypoints it can if taking the straight line forward is better
         according to the influence grid
 
+        ``as_array`` returns each path segment as an ``int32`` array of shape ``(N, 2)``
+        instead of a list of :class:`sc2.position.Point2`, like in :meth:`.MapData.pathfind`
+
         Example:
             >>> my_grid = self.get_pyastar_grid()
             >>> # start / goal could be any tuple / Point2
@@ -357,7 +850,7 @@ class MapData:
 
         """
         return self.pather.pathfind_with_nyduses(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
-                                                 sensitivity=sensitivity)
+                                                 sensitivity=sensitivity, as_array=as_array)
 
     def add_cost(self, position: Tuple[float, float], radius: float, grid: ndarray, weight: float = 100,
                  safe: bool = True,
@@ -374,11 +867,43 @@ class MapData:
 
         See Also:
             * :meth:`.MapData.add_cost_to_multiple_grids`
+            * :meth:`.MapData.add_costs`
 
         """
         return self.pather.add_cost(position=position, radius=radius, arr=grid, weight=weight, safe=safe,
                                     initial_default_weights=initial_default_weights)
 
+    def add_costs(self, positions: Union[ndarray, List[Tuple[float, float]]], radii: Union[float, ndarray],
+                  grid: ndarray, weights: Union[float, ndarray] = 100, safe: bool = True,
+                  initial_default_weights: float = 0) -> ndarray:
+        """
+        :rtype: numpy.ndarray
+
+        Like ``add_cost``, but adds the cost of many `circle-shaped` areas at once, with a center in ``positions``
+        and a radius and weight from ``radii`` and ``weights``, which can be arrays or a single value for all of them.
+
+        The points around a center that a radius can cover are computed once per radius rounded up and reused,
+        and every point of ``grid`` is changed once with the sum of the weights covering it,
+        which is much faster than calling ``add_cost`` for each unit.
+
+        ``initial_default_weights`` replaces the points with a weight of 1 before the costs are added, and with ``safe``
+        the weights below 1 are set to 1 once all the costs are added, instead of after each of them.
+
+        Example:
+            >>> my_grid = self.get_pyastar_grid()
+            >>> enemies = [(100, 100), (110, 102), (60, 80)]
+            >>> my_grid = self.add_costs(positions=enemies, radii=[7, 7, 9], grid=my_grid, weights=[20, 20, 50])
+
+        Warning:
+            When ``safe=False`` the Pather will not adjust illegal values below 1 which could result in a crash`
+
+        See Also:
+            * :meth:`.MapData.add_cost`
+
+        """
+        return self.pather.add_costs(positions=positions, radii=radii, arr=grid, weights=weights, safe=safe,
+                                     initial_default_weights=initial_default_weights)
+
     def add_cost_to_multiple_grids(
         self,
         position: Tuple[float, float],
@@ -771,6 +1296,7 @@ class MapData:
 
         self.pather.set_connectivity_graph()
         self.connectivity_graph = self.pather.connectivity_graph
+        self.pather.set_ground_graph()
 
     def _calc_grid(self) -> None:
         # converting the placement grid to our own kind of grid
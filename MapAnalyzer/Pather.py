@@ -1,16 +1,28 @@
-from typing import List, Optional, Tuple, TYPE_CHECKING
+import asyncio
+import hashlib
+import threading
+import weakref
+from collections import namedtuple, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING, Union
 
 import numpy as np
 
 from loguru import logger
 from numpy import ndarray
+from scipy.ndimage import distance_transform_edt
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
 from sc2.ids.unit_typeid import UnitTypeId as UnitID
 from sc2.position import Point2
 
 from MapAnalyzer.exceptions import OutOfBoundsException, PatherNoPointsException
+from MapAnalyzer.constructs import ChokeArea
+from MapAnalyzer.GridManager import MapAnalyzerGridManager
+from MapAnalyzer.PathingService import MapAnalyzerPathingService
 from MapAnalyzer.Region import Region
-from MapAnalyzer.utils import change_destructable_status_in_grid
-from .cext import astar_path, astar_path_with_nyduses
+from MapAnalyzer.utils import change_destructables_status_in_grid
+from .cext import (astar_path, astar_path_many, astar_path_to_nearest, astar_path_with_nyduses, astar_path_with_portals,
+                   flow_field, reachable_within, DStarLitePlanner, PathStatus)
 from .destructibles import *
 
 if TYPE_CHECKING:
@@ -40,6 +52,9 @@ def draw_circle(c, radius, shape=None):
     return rr + upper_left[0], cc + upper_left[1]
 
 
+PathCacheInfo = namedtuple("PathCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
 class MapAnalyzerPather:
     """"""
 
@@ -52,7 +67,46 @@ class MapAnalyzerPather:
         )
         self.connectivity_graph = None  # set later by MapData
 
+        # ground distances between chokes and bases, set later by MapData
+        # and rebuilt when destructables or mineral walls are removed from the grid
+        self.ground_graph_nodes: List[Tuple[int, int]] = []
+        self.ground_distance_matrix: Optional[ndarray] = None
+        self.ground_next_hop_matrix: Optional[ndarray] = None
+        self.ground_distance_fields: Optional[ndarray] = None
+        self.ground_graph_outdated = True
+        self._ground_route_costs: Optional[ndarray] = None
+        self._ground_graph_areas: List[Union[ChokeArea, Point2]] = []
+        self._ground_graph_keys: Dict = {}
+        self._region_ground_nodes: Dict[Region, List[int]] = {}
+
+        # opt-in cache of pathfind results, disabled while the size is 0
+        # grids are identified by id and a version that add_cost bumps
+        self._path_cache: OrderedDict = OrderedDict()
+        self._path_cache_size = 0
+        self._path_cache_hits = 0
+        self._path_cache_misses = 0
+        self._path_cache_lock = threading.Lock()
+        self._grid_versions: Dict[int, int] = {}
+
+        # data computed from a grid, like its clearance or the grids with the cells too narrow
+        # for a unit_radius blocked, rebuilt when add_cost bumps the grid version
+        self._grid_data: Dict[int, Tuple[int, Dict[Any, Any]]] = {}
+        # guards the grid data and versions, pathfind runs on the worker threads of pathfind_async
+        self._grid_data_lock = threading.Lock()
+        # nearest pathable point of every point, by the layout of nonpathable points
+        # so the grids of each frame share it until something is built or destroyed
+        self._nearest_pathable_cache: OrderedDict = OrderedDict()
+        self._nearest_pathable_lock = threading.Lock()
+
+        # offsets of the points around a position that add_costs checks, by radius rounded up
+        self._disk_stencils: Dict[int, ndarray] = {}
+
+        # worker threads for pathfind_async, started on the first request
+        self.pathing_service = MapAnalyzerPathingService(self)
+
         self._set_default_grids()
+        # ground and climber grids with the structures on them, kept up to date across steps
+        self.grid_manager = MapAnalyzerGridManager(self)
         self.terrain_height = self.map_data.terrain_height.copy().T
 
     def _set_default_grids(self):
@@ -76,11 +130,13 @@ class MapAnalyzerPather:
         # set rocks and mineral walls to pathable in the beginning
         # these will be set nonpathable when updating grids for the destructables
         # that still exist
+        blocking_destructables = []
         for dest in self.map_data.bot.destructables:
             self.destructables_included[dest.position] = dest
             if "unbuildable" not in dest.name.lower() and "acceleration" not in dest.name.lower():
-                change_destructable_status_in_grid(self.default_grid, dest, 0)
-                change_destructable_status_in_grid(self.default_grid_nodestr, dest, 1)
+                blocking_destructables.append(dest)
+        change_destructables_status_in_grid(self.default_grid, blocking_destructables, 0)
+        change_destructables_status_in_grid(self.default_grid_nodestr, blocking_destructables, 1)
 
         # set each geyser as non pathable, these don't update during the game
         for geyser in self.map_data.bot.vespene_geyser:
@@ -130,37 +186,8 @@ class MapAnalyzerPather:
                     paths.append(newpath)
         return paths
 
-    def _add_non_pathables_ground(self, grid: ndarray, include_destructables: bool = True) -> ndarray:
-        ret_grid = grid.copy()
-        nonpathables = self.map_data.bot.structures.not_flying
-        nonpathables.extend(self.map_data.bot.enemy_structures.not_flying)
-        nonpathables = nonpathables.filter(
-            lambda x: (x.type_id != UnitID.SUPPLYDEPOTLOWERED or x.is_active)
-                      and (x.type_id != UnitID.CREEPTUMOR or not x.is_ready))
-
-        for obj in nonpathables:
-            size = 1
-            if obj.type_id in buildings_2x2:
-                size = 2
-            elif obj.type_id in buildings_3x3:
-                size = 3
-            elif obj.type_id in buildings_5x5:
-                size = 5
-            left_bottom = obj.position.offset((-size / 2, -size / 2))
-            x_start = int(left_bottom[0])
-            y_start = int(left_bottom[1])
-            x_end = int(x_start + size)
-            y_end = int(y_start + size)
-
-            ret_grid[x_start:x_end, y_start:y_end] = 0
-
-            # townhall sized buildings should have their corner spots pathable
-            if size == 5:
-                ret_grid[x_start, y_start] = 1
-                ret_grid[x_start, y_end - 1] = 1
-                ret_grid[x_end - 1, y_start] = 1
-                ret_grid[x_end - 1, y_end - 1] = 1
-
+    def _update_removed_resources(self, include_destructables: bool = True) -> None:
+        # mineral fields and destructables that are gone become pathable on the default grids
         if len(self.minerals_included) != self.map_data.bot.mineral_field.amount:
 
             new_positions = set(m.position for m in self.map_data.bot.mineral_field)
@@ -172,9 +199,6 @@ class MapAnalyzerPather:
                 x2 = x1 - 1
                 y = int(mf_position[1])
 
-                ret_grid[x1, y] = 1
-                ret_grid[x2, y] = 1
-
                 self.default_grid[x1, y] = 1
                 self.default_grid[x2, y] = 1
 
@@ -182,20 +206,22 @@ class MapAnalyzerPather:
                 self.default_grid_nodestr[x2, y] = 1
 
                 del self.minerals_included[mf_position]
+                self.ground_graph_outdated = True
+                self.grid_manager.clear()
+                self.clear_path_cache()
 
         if include_destructables and len(self.destructables_included) != self.map_data.bot.destructables.amount:
             new_positions = set(d.position for d in self.map_data.bot.destructables)
             old_dest_positions = set(self.destructables_included)
             missing_positions = old_dest_positions - new_positions
 
-            for dest_position in missing_positions:
-                dest = self.destructables_included[dest_position]
-                change_destructable_status_in_grid(ret_grid, dest, 1)
-                change_destructable_status_in_grid(self.default_grid, dest, 1)
+            if missing_positions:
+                missing = [self.destructables_included.pop(dest_position) for dest_position in missing_positions]
+                change_destructables_status_in_grid(self.default_grid, missing, 1)
 
-                del self.destructables_included[dest_position]
-
-        return ret_grid
+                self.ground_graph_outdated = True
+                self.grid_manager.clear()
+                self.clear_path_cache()
 
     def find_eligible_point(self, point: Tuple[float, float], grid: np.ndarray, terrain_height: np.ndarray, max_distance: float) -> Optional[Tuple[int, int]]:
         """
@@ -205,15 +231,32 @@ class MapAnalyzerPather:
         To make sure that we don't accidentally for example offer a point that is on low ground when the
         first target was on high ground, we first try to find a point that maintains the terrain height.
         After that we check for points on other terrain heights.
+        The closest pathable point of every point is looked up from an index kept per layout of
+        nonpathable points, so the disk around the point is only searched when that one is on another level.
         """
         point = (int(point[0]), int(point[1]))
 
         if grid[point] == np.inf:
-            target_height = terrain_height[point]
+            target_height = int(terrain_height[point])
+            nearest = self._get_nearest_pathable(grid)
+            if nearest is not None:
+                candidate = (int(nearest[0][point]), int(nearest[1][point]))
+                # the index is stale if the grid was changed without add_cost, search the disk then
+                if grid[candidate] < np.inf:
+                    # no pathable point is closer than the candidate
+                    if (candidate[0] - point[0]) ** 2 + (candidate[1] - point[1]) ** 2 > max_distance ** 2:
+                        return None
+                    # the closest pathable point overall is also the closest one on the same level,
+                    # the disk is only searched when it is on another level
+                    if abs(int(terrain_height[candidate]) - target_height) < 8:
+                        return candidate
+
             disk = tuple(draw_circle(point, max_distance, shape=grid.shape))
             # Using 8 for the threshold in case there is some variance on the same level
             # Proper levels have a height difference of 16
-            same_height_cond = np.logical_and(np.abs(terrain_height[disk] - target_height) < 8, grid[disk] < np.inf)
+            same_height_cond = np.logical_and(
+                np.abs(terrain_height[disk].astype(int) - target_height) < 8, grid[disk] < np.inf
+            )
 
             if np.any(same_height_cond):
                 possible_points = np.column_stack((disk[0][same_height_cond], disk[1][same_height_cond]))
@@ -261,17 +304,11 @@ class MapAnalyzerPather:
 
     def get_climber_grid(self, default_weight: float = 1, include_destructables: bool = True) -> ndarray:
         """Grid for units like reaper / colossus """
-        grid = self.get_base_pathing_grid(include_destructables)
-        grid = np.where(self.map_data.c_ext_map.climber_grid != 0, 1, grid)
-        grid = self._add_non_pathables_ground(grid=grid, include_destructables=include_destructables)
-        grid = np.where(grid != 0, default_weight, np.inf).astype(np.float32)
-        return grid
+        grid = self.grid_manager.get_ground_grid(climber=True, include_destructables=include_destructables)
+        return self._weighted_copy(grid, default_weight)
 
     def get_clean_air_grid(self, default_weight: float = 1) -> ndarray:
-        clean_air_grid = np.zeros(shape=self.default_grid.shape).astype(np.float32)
-        area = self.map_data.bot.game_info.playable_area
-        clean_air_grid[area.x:(area.x + area.width), area.y:(area.y + area.height)] = 1
-        return np.where(clean_air_grid == 1, default_weight, np.inf).astype(np.float32)
+        return self._weighted_copy(self.grid_manager.get_clean_air_grid(), default_weight)
 
     def get_air_vs_ground_grid(self, default_weight: float) -> ndarray:
         grid = self.get_pyastar_grid(default_weight=default_weight, include_destructables=True)
@@ -286,16 +323,324 @@ class MapAnalyzerPather:
         return grid
 
     def get_pyastar_grid(self, default_weight: float = 1, include_destructables: bool = True) -> ndarray:
-        grid = self.get_base_pathing_grid(include_destructables)
-        grid = self._add_non_pathables_ground(grid=grid, include_destructables=include_destructables)
+        grid = self.grid_manager.get_ground_grid(climber=False, include_destructables=include_destructables)
+        return self._weighted_copy(grid, default_weight)
 
-        grid = np.where(grid != 0, default_weight, np.inf).astype(np.float32)
-        return grid
+    @staticmethod
+    def _weighted_copy(grid: ndarray, default_weight: float) -> ndarray:
+        # the managed grids have a weight of 1 on every pathable point
+        if default_weight == 1:
+            return grid.copy()
+        return np.where(grid != np.inf, default_weight, np.inf).astype(np.float32)
+
+    def set_path_cache_size(self, size: int) -> None:
+        with self._path_cache_lock:
+            self._path_cache_size = max(size, 0)
+            while len(self._path_cache) > self._path_cache_size:
+                self._path_cache.popitem(last=False)
+
+    def clear_path_cache(self) -> None:
+        with self._path_cache_lock:
+            self._path_cache.clear()
+
+    def path_cache_info(self) -> PathCacheInfo:
+        return PathCacheInfo(self._path_cache_hits, self._path_cache_misses, self._path_cache_size,
+                             len(self._path_cache))
+
+    def _bump_grid_version(self, grid: ndarray) -> None:
+        with self._grid_data_lock:
+            if not self._path_cache_size and id(grid) not in self._grid_data:
+                return
+            grid_id = id(grid)
+            if grid_id not in self._grid_versions:
+                # forget the version when the grid is gone, the id can be reused by a new grid
+                weakref.finalize(grid, self._grid_versions.pop, grid_id, None)
+            self._grid_versions[grid_id] = self._grid_versions.get(grid_id, 0) + 1
+
+    def _get_grid_data(self, grid: ndarray) -> Dict[Any, Any]:
+        grid_id = id(grid)
+        with self._grid_data_lock:
+            version = self._grid_versions.get(grid_id, 0)
+            entry = self._grid_data.get(grid_id)
+            if entry is None or entry[0] != version:
+                if entry is None:
+                    # forget the data when the grid is gone, the id can be reused by a new grid
+                    weakref.finalize(grid, self._grid_data.pop, grid_id, None)
+                entry = (version, {})
+                self._grid_data[grid_id] = entry
+            return entry[1]
+
+    def _get_grid_value(self, grid: ndarray, key: Any, compute: Callable[[], Any]) -> Any:
+        # the value is computed without holding the lock, the data of an older version
+        # of the grid is no longer reachable, so a value computed while add_cost ran is dropped with it
+        data = self._get_grid_data(grid)
+        with self._grid_data_lock:
+            if key in data:
+                return data[key]
+        value = compute()
+        with self._grid_data_lock:
+            return data.setdefault(key, value)
+
+    def get_clearance_grid(self, grid: ndarray) -> ndarray:
+        def compute_clearance() -> ndarray:
+            # distance from each cell center to the closest edge of a nonpathable cell,
+            # the border of the grid is padded so the edge of the map counts as nonpathable
+            pathable = np.pad(grid < np.inf, 1, constant_values=False)
+            clearance = distance_transform_edt(pathable)[1:-1, 1:-1] - 0.5
+            return np.maximum(clearance, 0).astype(np.float32)
+
+        return self._get_grid_value(grid, "clearance", compute_clearance)
+
+    def _get_unit_radius_grid(self, grid: ndarray, unit_radius: float) -> ndarray:
+        # radii are rounded up to 1/8 so units of similar size share the grid
+        radius = np.ceil(unit_radius * 8) / 8
+        return self._get_grid_value(
+            grid, ("unit_radius", radius),
+            lambda: np.where(self.get_clearance_grid(grid) >= radius, grid, np.inf).astype(np.float32)
+        )
+
+    def _get_nearest_pathable(self, grid: ndarray) -> Optional[ndarray]:
+        return self._get_grid_value(grid, "nearest_pathable", lambda: self._compute_nearest_pathable(grid))
+
+    def _compute_nearest_pathable(self, grid: ndarray) -> Optional[ndarray]:
+        nonpathable = grid == np.inf
+        if nonpathable.all():
+            return None
+        key = (grid.shape, hashlib.blake2b(np.packbits(nonpathable).tobytes(), digest_size=16).digest())
+        with self._nearest_pathable_lock:
+            nearest = self._nearest_pathable_cache.get(key)
+        if nearest is None:
+            # row and column of the closest pathable point for every point
+            nearest = distance_transform_edt(nonpathable, return_distances=False, return_indices=True)
+        with self._nearest_pathable_lock:
+            self._nearest_pathable_cache[key] = nearest
+            self._nearest_pathable_cache.move_to_end(key)
+            if len(self._nearest_pathable_cache) > 4:
+                self._nearest_pathable_cache.popitem(last=False)
+        return nearest
 
     def pathfind(self, start: Tuple[float, float], goal: Tuple[float, float], grid: Optional[ndarray] = None,
                  large: bool = False,
                  smoothing: bool = False,
-                 sensitivity: int = 1) -> Optional[List[Point2]]:
+                 sensitivity: int = 1,
+                 jps: Optional[bool] = None,
+                 max_expansions: Optional[int] = None,
+                 max_cost: Optional[float] = None,
+                 max_distance: Optional[float] = None,
+                 return_status: bool = False,
+                 any_angle: bool = False,
+                 unit_radius: Optional[float] = None,
+                 bidirectional: bool = False,
+                 as_array: bool = False
+                 ) -> Union[Optional[List[Point2]], Optional[ndarray], Tuple[Optional[List[Point2]], PathStatus],
+                            Tuple[Optional[ndarray], PathStatus]]:
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if unit_radius:
+            grid = self._get_unit_radius_grid(grid, unit_radius)
+
+        limits = (max_expansions, max_cost, max_distance)
+        if not self._path_cache_size or start is None or goal is None:
+            path, status = self._pathfind(start, goal, grid, large, smoothing, sensitivity, jps, limits, any_angle,
+                                          bidirectional, as_array)
+            return (path, status) if return_status else path
+
+        key = ((round(start[0]), round(start[1])), (round(goal[0]), round(goal[1])),
+               id(grid), self._grid_versions.get(id(grid), 0), large, smoothing, sensitivity, jps, limits, any_angle,
+               bidirectional, as_array)
+        with self._path_cache_lock:
+            entry = self._path_cache.get(key)
+            # the grid reference makes sure the id wasn't reused by another grid
+            if entry is not None and entry[0]() is grid:
+                self._path_cache.move_to_end(key)
+                self._path_cache_hits += 1
+                if entry[1] is None:
+                    path = None
+                else:
+                    path = entry[1].copy() if as_array else list(entry[1])
+                return (path, entry[2]) if return_status else path
+            self._path_cache_misses += 1
+
+        path, status = self._pathfind(start, goal, grid, large, smoothing, sensitivity, jps, limits, any_angle,
+                                      bidirectional, as_array)
+
+        with self._path_cache_lock:
+            if self._path_cache_size:
+                if path is None:
+                    cached_path = None
+                else:
+                    cached_path = path.copy() if as_array else tuple(path)
+                self._path_cache[key] = (weakref.ref(grid), cached_path, status)
+                self._path_cache.move_to_end(key)
+                while len(self._path_cache) > self._path_cache_size:
+                    self._path_cache.popitem(last=False)
+
+        return (path, status) if return_status else path
+
+    def _pathfind(self, start: Tuple[float, float], goal: Tuple[float, float], grid: ndarray,
+                  large: bool, smoothing: bool, sensitivity: int, jps: Optional[bool],
+                  limits: Tuple[Optional[int], Optional[float], Optional[float]], any_angle: bool,
+                  bidirectional: bool = False, as_array: bool = False
+                  ) -> Tuple[Union[Optional[List[Point2]], Optional[ndarray]], PathStatus]:
+        if start is not None and goal is not None:
+            start = round(start[0]), round(start[1])
+            start = self.find_eligible_point(start, grid, self.terrain_height, 10)
+            goal = round(goal[0]), round(goal[1])
+            goal = self.find_eligible_point(goal, grid, self.terrain_height, 10)
+        else:
+            logger.warning(PatherNoPointsException(start=start, goal=goal))
+            return None, PathStatus.UNREACHABLE
+
+        # find_eligible_point didn't find any pathable nodes nearby
+        if start is None or goal is None:
+            return None, PathStatus.UNREACHABLE
+
+        max_expansions, max_cost, max_distance = limits
+        path, status = astar_path(grid, start, goal, large, smoothing, jps, max_expansions=max_expansions,
+                                  max_cost=max_cost, max_distance=max_distance, return_status=True,
+                                  any_angle=any_angle, bidirectional=bidirectional, sensitivity=sensitivity)
+
+        if path is not None:
+            # the extension already sliced the path
+            return (path if as_array else list(map(Point2, path))), status
+        else:
+            logger.debug(f"No Path found s{start}, g{goal}")
+            return None, status
+
+    @staticmethod
+    def _apply_sensitivity(path: ndarray, sensitivity: int) -> List[Point2]:
+        # Remove the starting point from the path.
+        # Make sure the goal node is the last node even if we are
+        # skipping points
+        complete_path = list(map(Point2, path))
+        skipped_path = complete_path[0:-1:sensitivity]
+        if skipped_path:
+            skipped_path.pop(0)
+
+        skipped_path.append(complete_path[-1])
+
+        return skipped_path
+
+    def pathfind_to_nearest(self, start: Tuple[float, float], goals: List[Tuple[float, float]],
+                            grid: Optional[ndarray] = None,
+                            large: bool = False,
+                            smoothing: bool = False,
+                            sensitivity: int = 1) -> Optional[Tuple[Point2, List[Point2], float]]:
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if start is None or not goals:
+            logger.warning(PatherNoPointsException(start=start, goal=goals))
+            return None
+
+        start = round(start[0]), round(start[1])
+        start = self.find_eligible_point(start, grid, self.terrain_height, 10)
+
+        # the goals that don't have any pathable nodes nearby are left out
+        eligible_goals = []
+        goal_indices = []
+        for i, goal in enumerate(goals):
+            goal = self.find_eligible_point((round(goal[0]), round(goal[1])), grid, self.terrain_height, 10)
+            if goal is not None:
+                eligible_goals.append(goal)
+                goal_indices.append(i)
+
+        if start is None or not eligible_goals:
+            return None
+
+        result = astar_path_to_nearest(grid, start, np.array(eligible_goals), large, smoothing)
+
+        if result is not None:
+            goal_index, path, cost = result
+            return Point2(goals[goal_indices[goal_index]]), self._apply_sensitivity(path, sensitivity), cost
+        else:
+            logger.debug(f"No Path found s{start}, g{goals}")
+            return None
+
+    def pathfind_many(self, starts: ndarray, goals: ndarray, grid: Optional[ndarray] = None,
+                      large: bool = False,
+                      smoothing: bool = False) -> List[Optional[ndarray]]:
+        """
+        Find paths for many start and goal pairs at once. starts and goals are sequences of points
+        or arrays of shape (N, 2). All the searches run in a single call to the c extension.
+        Returns a list with the complete int32 path array (start included) for each pair,
+        or None for pairs that don't have a path.
+        """
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        starts = np.round(np.asarray(starts, dtype=float).reshape((-1, 2))).astype(int)
+        goals = np.round(np.asarray(goals, dtype=float).reshape((-1, 2))).astype(int)
+        if starts.shape != goals.shape:
+            raise ValueError(f"Got {starts.shape[0]} starts but {goals.shape[0]} goals.")
+
+        results: List[Optional[ndarray]] = [None] * starts.shape[0]
+        query_indices = []
+        eligible_starts = []
+        eligible_goals = []
+        for i in range(starts.shape[0]):
+            start = self.find_eligible_point(starts[i], grid, self.terrain_height, 10)
+            goal = self.find_eligible_point(goals[i], grid, self.terrain_height, 10)
+
+            # find_eligible_point didn't find any pathable nodes nearby
+            if start is None or goal is None:
+                continue
+
+            query_indices.append(i)
+            eligible_starts.append(start)
+            eligible_goals.append(goal)
+
+        if query_indices:
+            paths = astar_path_many(grid, np.array(eligible_starts), np.array(eligible_goals), large, smoothing)
+            for i, path in zip(query_indices, paths):
+                results[i] = path
+
+        return results
+
+    def get_flow_field(self, goal: Tuple[float, float], grid: Optional[ndarray] = None,
+                       large: bool = False) -> Optional[Tuple[ndarray, ndarray]]:
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if goal is None:
+            logger.warning(PatherNoPointsException(start=None, goal=goal))
+            return None
+
+        goal = round(goal[0]), round(goal[1])
+        goal = self.find_eligible_point(goal, grid, self.terrain_height, 10)
+
+        # find_eligible_point didn't find any pathable nodes nearby
+        if goal is None:
+            return None
+
+        return flow_field(grid, goal, large)
+
+    def reachable_within(self, start: Tuple[float, float], max_cost: float, grid: Optional[ndarray] = None,
+                         large: bool = False) -> Optional[Tuple[ndarray, ndarray]]:
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if start is None:
+            logger.warning(PatherNoPointsException(start=start, goal=None))
+            return None
+
+        start = round(start[0]), round(start[1])
+        start = self.find_eligible_point(start, grid, self.terrain_height, 10)
+
+        # find_eligible_point didn't find any pathable nodes nearby
+        if start is None:
+            return None
+
+        return reachable_within(grid, start, max_cost, large)
+
+    def create_planner(self, start: Tuple[float, float], goal: Tuple[float, float], grid: Optional[ndarray] = None,
+                       large: bool = False) -> Optional[DStarLitePlanner]:
         if grid is None:
             logger.warning("Using the default pyastar grid as no grid was provided.")
             grid = self.get_pyastar_grid()
@@ -313,29 +658,291 @@ class MapAnalyzerPather:
         if start is None or goal is None:
             return None
 
-        path = astar_path(grid, start, goal, large, smoothing)
+        return DStarLitePlanner(grid, start, goal, large)
 
-        if path is not None:
-            # Remove the starting point from the path.
-            # Make sure the goal node is the last node even if we are
-            # skipping points
-            complete_path = list(map(Point2, path))
-            skipped_path = complete_path[0:-1:sensitivity]
-            if skipped_path:
-                skipped_path.pop(0)
+    def pathfind_threadsafe(self, start: Tuple[float, float], goal: Tuple[float, float], grid: ndarray,
+                            large: bool = False,
+                            smoothing: bool = False,
+                            sensitivity: int = 1) -> Optional[List[Point2]]:
+        """
+        Same as pathfind, but safe to call from worker threads, for example from a ThreadPoolExecutor.
+        The grid is required since building a default grid reads the bot state and updates the cached grids.
+        The search in the c extension runs without the GIL and reads the grid in place,
+        so the grid shouldn't be modified until the call returns.
+        """
+        if grid is None:
+            raise ValueError("pathfind_threadsafe requires a grid, get one with get_pyastar_grid beforehand")
+
+        return self.pathfind(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
+                             sensitivity=sensitivity)
+
+    def pathfind_async(self, start: Tuple[float, float], goal: Tuple[float, float], grid: Optional[ndarray] = None,
+                       large: bool = False,
+                       smoothing: bool = False,
+                       sensitivity: int = 1,
+                       jps: Optional[bool] = None,
+                       unit_radius: Optional[float] = None,
+                       bidirectional: bool = False,
+                       as_array: bool = False) -> asyncio.Future:
+        """
+        Same as pathfind, but the path is calculated by the worker threads of the pathing service.
+        The default grid and the grid fitted to unit_radius are made here, on the event loop,
+        since building them reads the bot state and updates the cached grids.
+        """
+        if start is None or goal is None:
+            logger.warning(PatherNoPointsException(start=start, goal=goal))
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            return future
+
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if unit_radius:
+            grid = self._get_unit_radius_grid(grid, unit_radius)
+
+        return self.pathing_service.submit(start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
+                                           sensitivity=sensitivity, jps=jps, bidirectional=bidirectional,
+                                           as_array=as_array)
+
+    def set_ground_graph(self) -> None:
+        """
+        Graph of ground distances between the chokes and base locations of the map.
+        Every choke and base gets a node on a pathable point near its center and a distance field
+        over the ground grid, so the ground distance from any point to a node is a lookup.
+        Nodes that border the same region are connected, and the next hop on the shortest
+        route between any two nodes is precomputed for hierarchical pathfinding.
+        Structures are left out of this grid, they are only considered when refining a path.
+        """
+        grid = np.where(self.default_grid != 0, 1, np.inf).astype(np.float32)
+
+        keys = []
+        nodes = []
+        node_regions = []
+        fields = []
+        areas = [(choke, choke.center, set(choke.regions)) for choke in self.map_data.map_chokes]
+        for region in self.map_data.regions.values():
+            areas.extend((base, base, {region}) for base in region.bases)
+
+        for key, center, regions in areas:
+            node = self.find_eligible_point(center, grid, self.terrain_height, 10)
+            if node is None:
+                continue
+            keys.append(key)
+            nodes.append((int(node[0]), int(node[1])))
+            node_regions.append(regions)
+            fields.append(flow_field(grid, node, False)[0])
+
+        fields = np.stack(fields) if fields else np.zeros((0, *grid.shape), dtype=np.float32)
+        # the distance between nodes i and j is the field of j at the node i
+        distances = fields[:, [n[0] for n in nodes], [n[1] for n in nodes]].T.astype(np.float64)
+        # the fields only differ by floating point errors in opposite directions
+        distances = np.minimum(distances, distances.T)
+
+        # edge costs, 0 for nodes that aren't connected directly
+        edges = np.zeros((len(nodes), len(nodes)))
+        region_nodes = {}
+        for i in range(len(nodes)):
+            for region in node_regions[i]:
+                region_nodes.setdefault(region, []).append(i)
+            for j in range(i + 1, len(nodes)):
+                if node_regions[i] & node_regions[j] and distances[i, j] < np.inf:
+                    # keep connected nodes on the same spot apart from missing edges
+                    edges[i, j] = edges[j, i] = max(distances[i, j], 1e-3)
+
+        # the predecessor of i on the route from j is the next hop from i towards j
+        route_costs, predecessors = shortest_path(csr_matrix(edges), directed=False, return_predecessors=True)
+
+        self.ground_graph_nodes = nodes
+        self.ground_distance_matrix = distances
+        self.ground_next_hop_matrix = predecessors.T
+        self._ground_route_costs = route_costs
+        self.ground_distance_fields = fields
+        self._ground_graph_areas = keys
+        self._ground_graph_keys = {key: i for i, key in enumerate(keys)}
+        self._region_ground_nodes = region_nodes
+        self.ground_graph_outdated = False
+
+    def refresh_ground_graph(self) -> None:
+        # removes the destroyed destructables and mineral walls from the default grid
+        self._update_removed_resources()
+        if self.ground_graph_outdated:
+            self.set_ground_graph()
+
+    def _get_ground_graph_node(self, key: Union[ChokeArea, Tuple[float, float]]) -> Optional[int]:
+        if self.ground_graph_outdated:
+            self.set_ground_graph()
+        if isinstance(key, tuple):
+            key = Point2(key)
+        return self._ground_graph_keys.get(key)
+
+    def ground_distance(self, a: Union[ChokeArea, Tuple[float, float]],
+                        b: Union[ChokeArea, Tuple[float, float]]) -> float:
+        a_node = self._get_ground_graph_node(a)
+        b_node = self._get_ground_graph_node(b)
+        if a_node is not None and b_node is not None:
+            return float(self.ground_distance_matrix[a_node, b_node])
+
+        # a point can be looked up from the distance field of the other node
+        if a_node is not None:
+            node, point = a_node, b
+        elif b_node is not None:
+            node, point = b_node, a
+        else:
+            raise ValueError(f"Either {a} or {b} should be a choke or a base location")
+
+        point = round(point[0]), round(point[1])
+        if not (0 <= point[0] < self.default_grid.shape[0] and 0 <= point[1] < self.default_grid.shape[1]):
+            raise OutOfBoundsException(point)
+        return float(self.ground_distance_fields[node][point])
+
+    def ground_next_hop(self, a: Union[ChokeArea, Tuple[float, float]],
+                        b: Union[ChokeArea, Tuple[float, float]]) -> Optional[Union[ChokeArea, Point2]]:
+        a_node = self._get_ground_graph_node(a)
+        b_node = self._get_ground_graph_node(b)
+        if a_node is None or b_node is None:
+            raise ValueError(f"Both {a} and {b} should be chokes or base locations")
+
+        next_node = self.ground_next_hop_matrix[a_node, b_node]
+        if next_node < 0:
+            return None
+        return self._ground_graph_areas[next_node]
+
+    def _ground_graph_links(self, point: Tuple[int, int]) -> Tuple[ndarray, ndarray]:
+        # points inside a region connect to the nodes of that region,
+        # other points (on ramps for example) to the closest few nodes
+        region = self.map_data.in_region_p(point)
+        costs = self.ground_distance_fields[:, point[0], point[1]]
+        if region is not None and region in self._region_ground_nodes:
+            indices = np.array(self._region_ground_nodes[region])
+        else:
+            indices = np.argsort(costs)[:3]
+        return indices, costs[indices]
+
+    def _find_ground_route(self, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+        """
+        Returns the choke and base nodes to pass through on the way from start to goal,
+        or None if both are in the same region or the ground graph doesn't connect them.
+        """
+        start_region = self.map_data.in_region_p(start)
+        if start_region is not None and start_region is self.map_data.in_region_p(goal):
+            return None
+
+        start_indices, start_costs = self._ground_graph_links(start)
+        goal_indices, goal_costs = self._ground_graph_links(goal)
+        if len(start_indices) == 0 or len(goal_indices) == 0:
+            return None
+
+        totals = (start_costs[:, np.newaxis] + self._ground_route_costs[np.ix_(start_indices, goal_indices)]
+                  + goal_costs[np.newaxis, :])
+        best = np.argmin(totals)
+        if totals.flat[best] == np.inf:
+            return None
+
+        node = start_indices[best // len(goal_indices)]
+        last_node = goal_indices[best % len(goal_indices)]
+
+        route = [self.ground_graph_nodes[node]]
+        while node != last_node:
+            node = self.ground_next_hop_matrix[node, last_node]
+            route.append(self.ground_graph_nodes[node])
+        return route
+
+    def pathfind_hierarchical(self, start: Tuple[float, float], goal: Tuple[float, float],
+                              grid: Optional[ndarray] = None,
+                              large: bool = False,
+                              smoothing: bool = False,
+                              sensitivity: int = 1,
+                              refined_segments: int = 2) -> Optional[List[Point2]]:
+        if refined_segments < 1:
+            raise ValueError(f"refined_segments must be at least 1, but got {refined_segments}")
+
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if start is not None and goal is not None:
+            start = round(start[0]), round(start[1])
+            start = self.find_eligible_point(start, grid, self.terrain_height, 10)
+            goal = round(goal[0]), round(goal[1])
+            goal = self.find_eligible_point(goal, grid, self.terrain_height, 10)
+        else:
+            logger.warning(PatherNoPointsException(start=start, goal=goal))
+            return None
 
-            skipped_path.append(complete_path[-1])
+        # find_eligible_point didn't find any pathable nodes nearby
+        if start is None or goal is None:
+            return None
 
-            return skipped_path
+        if self.ground_graph_outdated:
+            self.set_ground_graph()
+
+        route = self._find_ground_route(start, goal)
+        if route is None:
+            return self.pathfind(start, goal, grid, large, smoothing, sensitivity)
+
+        waypoints = [start, *route, goal]
+        segments = []
+        # scan the grid once for all the segments
+        min_weight = float(grid.min())
+        for segment_start, segment_goal in zip(waypoints[:refined_segments], waypoints[1:refined_segments + 1]):
+            segment = astar_path(grid, segment_start, segment_goal, large, smoothing, min_weight=min_weight)
+            if segment is None:
+                # the route is blocked on this grid, by structures for example
+                return self.pathfind(start, goal, grid, large, smoothing, sensitivity)
+            segments.append(segment if not segments else segment[1:])
+
+        path = self._apply_sensitivity(np.concatenate(segments), sensitivity)
+        path.extend(Point2(waypoint) for waypoint in waypoints[refined_segments + 1:])
+        return path
+
+    def pathfind_with_portals(self, start: Tuple[float, float], goal: Tuple[float, float],
+                              portals: List[Tuple[Tuple[float, float], Tuple[float, float], float]],
+                              grid: Optional[ndarray] = None,
+                              large: bool = False,
+                              smoothing: bool = False,
+                              sensitivity: int = 1) -> Optional[List[List[Point2]]]:
+        if grid is None:
+            logger.warning("Using the default pyastar grid as no grid was provided.")
+            grid = self.get_pyastar_grid()
+
+        if start is not None and goal is not None:
+            start = round(start[0]), round(start[1])
+            start = self.find_eligible_point(start, grid, self.terrain_height, 10)
+            goal = round(goal[0]), round(goal[1])
+            goal = self.find_eligible_point(goal, grid, self.terrain_height, 10)
         else:
+            logger.warning(PatherNoPointsException(start=start, goal=goal))
+            return None
+
+        # find_eligible_point didn't find any pathable nodes nearby
+        if start is None or goal is None:
+            return None
+
+        portals = [((round(entry[0]), round(entry[1])), (round(exit[0]), round(exit[1])), cost)
+                   for entry, exit, cost in portals]
+        paths = astar_path_with_portals(grid, start, goal, portals, large, smoothing)
+        if paths is None:
             logger.debug(f"No Path found s{start}, g{goal}")
             return None
 
+        returned_path = [self._apply_sensitivity(paths[0], sensitivity)]
+        for segment in paths[1:]:
+            # Keep the portal exit, that is where the unit comes out
+            segment_path = list(map(Point2, segment))
+            skipped_path = segment_path[0:-1:sensitivity]
+            skipped_path.append(segment_path[-1])
+            returned_path.append(skipped_path)
+        return returned_path
+
     def pathfind_with_nyduses(self, start: Tuple[float, float], goal: Tuple[float, float],
                               grid: Optional[ndarray] = None,
                               large: bool = False,
                               smoothing: bool = False,
-                              sensitivity: int = 1) -> Optional[Tuple[List[List[Point2]], Optional[List[int]]]]:
+                              sensitivity: int = 1,
+                              as_array: bool = False
+                              ) -> Optional[Tuple[Union[List[List[Point2]], List[ndarray]], Optional[List[int]]]]:
         if grid is None:
             logger.warning("Using the default pyastar grid as no grid was provided.")
             grid = self.get_pyastar_grid()
@@ -359,41 +966,27 @@ class MapAnalyzerPather:
         paths = astar_path_with_nyduses(grid, start, goal,
                                         nydus_positions,
                                         large, smoothing)
-        if paths is not None:
-            returned_path = []
-            nydus_tags = None
-            if len(paths) == 1:
-                path = list(map(Point2, paths[0]))
-                skipped_path = path[0:-1:sensitivity]
-                if skipped_path:
-                    skipped_path.pop(0)
-                skipped_path.append(path[-1])
-                returned_path.append(skipped_path)
-            else:
-                first_path = list(map(Point2, paths[0]))
-                first_skipped_path = first_path[0:-1:sensitivity]
-                if first_skipped_path:
-                    first_skipped_path.pop(0)
-                first_skipped_path.append(first_path[-1])
-                returned_path.append(first_skipped_path)
-
-                enter_nydus_unit = nydus_units.filter(lambda x: x.position.rounded == first_path[-1]).first
-                enter_nydus_tag = enter_nydus_unit.tag
-
-                second_path = list(map(Point2, paths[1]))
-                exit_nydus_unit = nydus_units.filter(lambda x: x.position.rounded == second_path[0]).first
-                exit_nydus_tag = exit_nydus_unit.tag
-                nydus_tags = [enter_nydus_tag, exit_nydus_tag]
-
-                second_skipped_path = second_path[0:-1:sensitivity]
-                second_skipped_path.append(second_path[-1])
-                returned_path.append(second_skipped_path)
-
-            return returned_path, nydus_tags
-        else:
+        if paths is None:
             logger.debug(f"No Path found s{start}, g{goal}")
             return None
 
+        # the first segment starts where the unit is, so its start is dropped,
+        # the second one starts at the nydus the unit comes out from, which is kept
+        first_path = np.concatenate((paths[0][sensitivity:-1:sensitivity], paths[0][-1:]))
+        returned_path = [first_path]
+        nydus_tags = None
+        if len(paths) > 1:
+            second_path = np.concatenate((paths[1][:-1:sensitivity], paths[1][-1:]))
+            returned_path.append(second_path)
+
+            enter_nydus_unit = nydus_units.filter(lambda x: x.position.rounded == Point2(paths[0][-1])).first
+            exit_nydus_unit = nydus_units.filter(lambda x: x.position.rounded == Point2(paths[1][0])).first
+            nydus_tags = [enter_nydus_unit.tag, exit_nydus_unit.tag]
+
+        if not as_array:
+            returned_path = [list(map(Point2, path)) for path in returned_path]
+        return returned_path, nydus_tags
+
     def add_cost(
         self,
         position: Tuple[float, float],
@@ -408,6 +1001,7 @@ class MapAnalyzerPather:
         arr: ndarray = self._add_disk_to_grid(
             position, arr, disk, weight, safe, initial_default_weights
         )
+        self._bump_grid_version(arr)
 
         return arr
 
@@ -429,9 +1023,80 @@ class MapAnalyzerPather:
             arrays[i] = self._add_disk_to_grid(
                 position, arrays[i], disk, weight, safe, initial_default_weights
             )
+            self._bump_grid_version(arrays[i])
 
         return arrays
 
+    def add_costs(
+        self,
+        positions: ndarray,
+        radii: Union[float, ndarray],
+        arr: ndarray,
+        weights: Union[float, ndarray] = 100,
+        safe: bool = True,
+        initial_default_weights: float = 0,
+    ) -> ndarray:
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        radii = np.broadcast_to(np.asarray(radii, dtype=float), len(positions))
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), len(positions))
+        if len(positions) == 0:
+            return arr
+
+        xs, ys, point_weights = [], [], []
+        # disks are grouped by their radius rounded up, which picks the stencil of points checked around them
+        stencil_sizes = np.ceil(radii).astype(int)
+        for size in np.unique(stencil_sizes):
+            group = stencil_sizes == size
+            corners = np.floor(positions[group]).astype(int)
+            stencil = self._get_disk_stencil(size)
+            points_x = corners[:, 0, None] + stencil[:, 0]
+            points_y = corners[:, 1, None] + stencil[:, 1]
+            # the same points as draw_circle, closer to the position than the radius and inside the grid
+            in_disk = ((points_x - positions[group, 0, None]) ** 2 + (points_y - positions[group, 1, None]) ** 2
+                       <= radii[group, None] ** 2)
+            in_disk &= (points_x >= 0) & (points_x < arr.shape[0]) & (points_y >= 0) & (points_y < arr.shape[1])
+            # if we don't touch any cell origins due to a small radius, add at least the cell
+            # the given position is in
+            empty = ~np.any(in_disk, axis=1) & np.all((positions[group] >= 0) & (positions[group] < arr.shape), axis=1)
+            in_disk[empty] = np.all(stencil == 0, axis=1)
+
+            xs.append(points_x[in_disk])
+            ys.append(points_y[in_disk])
+            point_weights.append(np.broadcast_to(weights[group, None], in_disk.shape)[in_disk])
+
+        # every point is changed once, with the sum of the weights of the disks covering it
+        indices = np.ravel_multi_index((np.concatenate(xs), np.concatenate(ys)), arr.shape)
+        covered = np.flatnonzero(np.bincount(indices, minlength=arr.size))
+        added = np.bincount(indices, weights=np.concatenate(point_weights), minlength=arr.size)[covered]
+        points = np.unravel_index(covered, arr.shape)
+
+        values = arr[points]
+        if initial_default_weights > 0:
+            values = np.where(values == 1, initial_default_weights, values)
+
+        values = values + added
+        if safe and np.any(values < 1):
+            logger.warning(
+                "You are attempting to set weights that are below 1. falling back to the minimum (1)"
+            )
+            values = np.where(values < 1, 1, values)
+
+        arr[points] = values
+        self._bump_grid_version(arr)
+
+        return arr
+
+    def _get_disk_stencil(self, size: int) -> ndarray:
+        stencil = self._disk_stencils.get(size)
+        if stencil is None:
+            # offsets from the point a position is in to the points a disk with a radius of at most size
+            # can cover, wherever the position is inside its point
+            offsets = np.argwhere(np.ones((2 * size + 2, 2 * size + 2), dtype=bool)) - size
+            closest = offsets - np.clip(offsets, 0, 1)
+            stencil = offsets[np.sum(closest ** 2, axis=1) <= size ** 2]
+            self._disk_stencils[size] = stencil
+        return stencil
+
     @staticmethod
     def _add_disk_to_grid(
         position: Tuple[float, float],
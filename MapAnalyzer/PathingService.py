@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING, Union
+
+from numpy import ndarray
+from sc2.position import Point2
+
+if TYPE_CHECKING:
+    from MapAnalyzer.Pather import MapAnalyzerPather
+
+
+class MapAnalyzerPathingService:
+    """
+    Runs pathfinding requests on a pool of worker threads, so awaiting a path doesn't block the step.
+    The search in the c extension releases the GIL, so the workers calculate paths at the same time.
+    Requests with the same arguments on the same game loop are calculated once and share the result.
+    """
+
+    def __init__(self, pather: "MapAnalyzerPather", max_workers: Optional[int] = None) -> None:
+        self.pather = pather
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._game_loop: Optional[int] = None
+        # requests of the current game loop, by their rounded points, grid and options
+        self._requests: Dict[tuple, Tuple[ndarray, asyncio.Future]] = {}
+
+    def submit(self, start: Tuple[float, float], goal: Tuple[float, float], grid: ndarray,
+               large: bool = False,
+               smoothing: bool = False,
+               sensitivity: int = 1,
+               jps: Optional[bool] = None,
+               bidirectional: bool = False,
+               as_array: bool = False) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        game_loop = self.pather.map_data.bot.state.game_loop
+        if game_loop != self._game_loop:
+            # requests of earlier steps keep running, but new ones aren't merged with them
+            self._game_loop = game_loop
+            self._requests = {}
+
+        start = round(start[0]), round(start[1])
+        goal = round(goal[0]), round(goal[1])
+        key = (start, goal, id(grid), self.pather._grid_versions.get(id(grid), 0), large, smoothing, sensitivity,
+               jps, bidirectional, as_array)
+        request = self._requests.get(key)
+        if request is None:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="MapAnalyzerPather")
+            shared = loop.run_in_executor(self._executor, partial(
+                self.pather.pathfind, start=start, goal=goal, grid=grid, large=large, smoothing=smoothing,
+                sensitivity=sensitivity, jps=jps, bidirectional=bidirectional, as_array=as_array))
+            # the grid is kept with the request so its id can't be reused during the game loop
+            request = (grid, shared)
+            self._requests[key] = request
+
+        future = loop.create_future()
+        request[1].add_done_callback(partial(self._set_copied_result, future))
+        return future
+
+    @staticmethod
+    def _set_copied_result(future: asyncio.Future, shared: asyncio.Future) -> None:
+        if future.cancelled():
+            return
+        if shared.cancelled():
+            future.cancel()
+        elif shared.exception() is not None:
+            future.set_exception(shared.exception())
+        else:
+            # every caller gets its own copy of the path, so changing one doesn't change the others
+            path: Union[Optional[List[Point2]], Optional[ndarray]] = shared.result()
+            if path is not None:
+                path = path.copy() if isinstance(path, ndarray) else list(path)
+            future.set_result(path)
+
+    async def join(self) -> None:
+        """
+        Waits until the requests of the current game loop are calculated.
+        """
+        requests = [shared for _, shared in self._requests.values()]
+        if requests:
+            await asyncio.wait(requests)
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._requests = {}
@@ -1 +1,4 @@
-from .wrapper import astar_path, astar_path_with_nyduses, CMapInfo, CMapChoke
+from .wrapper import (astar_path, astar_path_many, astar_path_to_nearest, astar_path_with_nyduses,
+                      astar_path_with_portals, flow_field,
+                      memory_stats, reachable_within, release_memory, resize_arenas,
+                      CMapInfo, CMapChoke, DStarLitePlanner, PathStatus, FLOW_FIELD_OFFSETS, NO_DIRECTION)
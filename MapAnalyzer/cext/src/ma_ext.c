@@ -2,6 +2,7 @@
 #include <Python.h>
 #include <stdint.h>
 #include <stdlib.h>
+#include <string.h>
 #include <numpy/arrayobject.h>
 #include <math.h>
 
@@ -46,17 +47,30 @@ enum NodeStatus {
 };
 
 /*
-Memory management in the extension atm happens in a fixed
-size region which is allocated when the module is loaded.
-The memory is handled with an arena allocator.
+Memory management in the extension happens with arena allocators.
 The idea basically is to have a buffer large enough that
 we can put stuff we need on there and then just reset
 a number in the buffer once in the end of the function.
+
+The memory of an arena comes in chunks. When the current chunk runs out of space,
+a new chunk of at least chunk_size bytes is added in front of it, so the arena can keep growing.
+base, size and used always refer to the current chunk.
+out_of_memory is set when an allocation fails. Functions that run out of memory return NULL
+(or -1 where they return a path length), and the exported functions check the flag
+to tell that apart from a search that didn't find anything.
 */
+typedef struct MemoryChunk {
+    struct MemoryChunk *previous;
+    size_t size;
+} MemoryChunk;
+
 typedef struct MemoryArena {
     uint8_t *base;
     size_t size;
     size_t used;
+    size_t chunk_size;
+    MemoryChunk *chunk;
+    int out_of_memory;
 } MemoryArena;
 
 /*
@@ -70,10 +84,11 @@ TempAllocation alloc = StartTemporaryAllocation(&state.function_arena);
 EndTemporaryAllocation(alloc);
 
 This way the arena is reset to the state where it was before
-the allocation.
+the allocation, and chunks added in between are released.
 */
 typedef struct TempAllocation {
     MemoryArena *arena;
+    MemoryChunk *chunk;
     size_t previously_used;
 } TempAllocation;
 
@@ -93,6 +108,7 @@ on there. They grow themselves if in danger of going above
 capacity. They operate in a designated memory arena so
 you can have stuff that lasts for the duration of a function
 or stuff with a more limited lifetime.
+Initializing or pushing returns NULL if the arena can't grow.
 */
 typedef struct VecInt {
     int size;
@@ -142,6 +158,10 @@ typedef struct ChokeList {
 /*
 function_arena is meant to hold things that tend to last for the entire function
 temp_arena is for temporary things that need some memory but can be thrown out soon after
+
+The shared state is only used by get_map_data which runs once per map while holding the GIL.
+Its arenas get their first chunk when they are first used and can be released or resized from python.
+Pathfinding functions create their own arenas for each call so they can run on multiple threads.
 */
 typedef struct ExtensionState { 
     MemoryArena function_arena;
@@ -150,21 +170,135 @@ typedef struct ExtensionState {
 
 ExtensionState state;
 
-static void InitializeMemoryArena(MemoryArena *arena, size_t total_size, uint8_t *base)
+#define DEFAULT_FUNCTION_ARENA_SIZE (8*1024*1024)
+#define DEFAULT_TEMP_ARENA_SIZE (2*1024*1024)
+
+/*
+Bytes currently held by all arenas, the most that has been held at once
+and the number of chunks. Chunks can be added by searches running without the GIL,
+so the numbers are only changed while holding memory_stats_lock.
+*/
+typedef struct MemoryStats {
+    size_t current;
+    size_t peak;
+    size_t chunks;
+} MemoryStats;
+
+static MemoryStats memory_stats_state;
+static PyThread_type_lock memory_stats_lock;
+
+static MemoryChunk* AllocateMemoryChunk(size_t size)
+{
+    MemoryChunk *chunk = (MemoryChunk*)malloc(sizeof(MemoryChunk) + size);
+    if (!chunk)
+    {
+        return NULL;
+    }
+    chunk->previous = NULL;
+    chunk->size = size;
+
+    PyThread_acquire_lock(memory_stats_lock, WAIT_LOCK);
+    memory_stats_state.current += size;
+    memory_stats_state.chunks++;
+    if (memory_stats_state.current > memory_stats_state.peak)
+    {
+        memory_stats_state.peak = memory_stats_state.current;
+    }
+    PyThread_release_lock(memory_stats_lock);
+
+    return chunk;
+}
+
+static void FreeMemoryChunk(MemoryChunk *chunk)
+{
+    PyThread_acquire_lock(memory_stats_lock, WAIT_LOCK);
+    memory_stats_state.current -= chunk->size;
+    memory_stats_state.chunks--;
+    PyThread_release_lock(memory_stats_lock);
+
+    free(chunk);
+}
+
+static void UseMemoryChunk(MemoryArena *arena, MemoryChunk *chunk, size_t used)
+{
+    arena->chunk = chunk;
+    arena->base = chunk ? (uint8_t*)(chunk + 1) : NULL;
+    arena->size = chunk ? chunk->size : 0;
+    arena->used = used;
+}
+
+/*
+Add a new chunk that has room for at least min_size bytes.
+Returns 0 if the memory couldn't be allocated.
+*/
+static int AddMemoryChunk(MemoryArena *arena, size_t min_size)
+{
+    size_t size = arena->chunk_size > min_size ? arena->chunk_size : min_size;
+    MemoryChunk *chunk = AllocateMemoryChunk(size);
+    if (!chunk)
+    {
+        return 0;
+    }
+
+    chunk->previous = arena->chunk;
+    UseMemoryChunk(arena, chunk, 0);
+    return 1;
+}
+
+/*
+Release the chunks added after keep, which becomes the current chunk again.
+keep can be NULL to release every chunk.
+*/
+static void ReleaseMemoryChunksAfter(MemoryArena *arena, MemoryChunk *keep)
+{
+    while (arena->chunk && arena->chunk != keep)
+    {
+        MemoryChunk *previous = arena->chunk->previous;
+        FreeMemoryChunk(arena->chunk);
+        arena->chunk = previous;
+    }
+    UseMemoryChunk(arena, arena->chunk, 0);
+}
+
+/*
+Set up an arena that gets its first chunk of chunk_size bytes when it's first used.
+*/
+static void InitializeMemoryArena(MemoryArena *arena, size_t chunk_size)
+{
+    arena->chunk_size = chunk_size;
+    arena->out_of_memory = 0;
+    UseMemoryChunk(arena, NULL, 0);
+}
+
+/*
+Allocate a standalone arena, for example for a single pathfinding call.
+Returns 0 if the memory couldn't be allocated.
+Has to be released with FreeMemoryArena.
+*/
+static int CreateMemoryArena(MemoryArena *arena, size_t total_size)
 {
-    arena->base = base;
-    arena->size = total_size;
-    arena->used = 0;
+    InitializeMemoryArena(arena, total_size);
+    return AddMemoryChunk(arena, total_size);
+}
+
+static void FreeMemoryArena(MemoryArena *arena)
+{
+    ReleaseMemoryChunksAfter(arena, NULL);
 }
 
 /*
 This should be called in the end of the functions that get
 exported to python for the buffers we used
-so they get reset
+so they get reset. The first chunk is kept for the next call.
 */
 static void ClearMemoryArena(MemoryArena *arena)
 {
-    arena->used = 0;
+    MemoryChunk *first = arena->chunk;
+    while (first && first->previous)
+    {
+        first = first->previous;
+    }
+    ReleaseMemoryChunksAfter(arena, first);
 }
 
 /*
@@ -175,9 +309,17 @@ arr[0] = 1;
 ...
 
 Each allocation saves its size in front so we can refer to it later.
+If the current chunk is full, a new chunk is added.
+Returns NULL and sets out_of_memory if that fails.
 */
 static void* PushToMemoryArena(MemoryArena *arena, size_t size)
 {
+    if (arena->used + size + HEADER_SIZE > arena->size && !AddMemoryChunk(arena, size + HEADER_SIZE))
+    {
+        arena->out_of_memory = 1;
+        return NULL;
+    }
+
     uint8_t *location = arena->base + arena->used;
     size_t *size_info = (size_t *)location;
     *size_info = size;
@@ -189,26 +331,12 @@ static void* PushToMemoryArena(MemoryArena *arena, size_t size)
     return location;
 }
 
-static void RemoveFromMemoryArena(MemoryArena *arena, uint8_t *base)
-{
-    if (base)
-    {
-        size_t * ptr_cast = (size_t *)base;
-        ptr_cast--;
-        size_t allocation_size = *ptr_cast;
-
-        if (arena->base + arena->used == base + allocation_size)
-        {
-            arena->used -= (allocation_size + HEADER_SIZE);
-        }
-    }
-}
-
 /*
 In case we need more space we first try to grow the allocation in place
-if this was the last thing added. If it was not, we move
+if this was the last thing added and the chunk has room for it. If not, we move
 the entire thing to a new location and leave the old thing in place.
 It will get removed later on when the buffer gets reset.
+Returns NULL if the new location can't be allocated, the old allocation stays as it was.
 */
 static void* ReallocInMemoryArena(MemoryArena *arena, uint8_t *current_base, size_t new_size)
 {
@@ -222,7 +350,8 @@ static void* ReallocInMemoryArena(MemoryArena *arena, uint8_t *current_base, siz
         ptr_cast--;
         size_t cur_size = *ptr_cast;
 
-        if (current_base + cur_size == arena->base + arena->used)
+        if (current_base + cur_size == arena->base + arena->used &&
+            arena->used - cur_size + new_size <= arena->size)
         {
             *ptr_cast = new_size;
 
@@ -232,7 +361,10 @@ static void* ReallocInMemoryArena(MemoryArena *arena, uint8_t *current_base, siz
         else
         {
             void *new_base = PushToMemoryArena(arena, new_size);
-            memcpy(new_base, current_base, cur_size);
+            if (new_base)
+            {
+                memcpy(new_base, current_base, cur_size);
+            }
             return new_base;
         }
     }
@@ -242,6 +374,7 @@ static TempAllocation StartTemporaryAllocation(MemoryArena *arena)
 {
     TempAllocation temp_alloc = {
         .arena = arena,
+        .chunk = arena->chunk,
         .previously_used = arena->used
     };
 
@@ -250,6 +383,15 @@ static TempAllocation StartTemporaryAllocation(MemoryArena *arena)
 
 static void EndTemporaryAllocation(TempAllocation temp)
 {
+    if (!temp.chunk)
+    {
+        //The arena had no memory before, keep the first chunk around for the next allocation
+        ClearMemoryArena(temp.arena);
+    }
+    else if (temp.arena->chunk != temp.chunk)
+    {
+        ReleaseMemoryChunksAfter(temp.arena, temp.chunk);
+    }
     temp.arena->used = temp.previously_used;
 }
 
@@ -257,6 +399,10 @@ static void EndTemporaryAllocation(TempAllocation temp)
 static VecInt* InitVecInt(MemoryArena *arena, int capacity)
 {
     VecInt* vec = (VecInt*)PushToMemoryArena(arena, sizeof(VecInt) + capacity*sizeof(int));
+    if (!vec)
+    {
+        return NULL;
+    }
     uint8_t *base = (uint8_t*)vec;
     base += sizeof(VecInt);
     vec->items = (int*)base; 
@@ -278,6 +424,10 @@ static VecInt* PushToVecInt(VecInt* vec, int new)
     {
         size_t new_size = sizeof(VecInt) + 2*vec->capacity*sizeof(int);
         VecInt* return_vec = (VecInt*)ReallocInMemoryArena(vec->arena, (uint8_t*)vec, new_size);
+        if (!return_vec)
+        {
+            return NULL;
+        }
 
         uint8_t *base = (uint8_t*)return_vec;
         base += sizeof(VecInt);
@@ -293,6 +443,10 @@ static VecInt* PushToVecInt(VecInt* vec, int new)
 static VecFloat* InitVecFloat(MemoryArena *arena, int capacity)
 {
     VecFloat* vec = (VecFloat*)PushToMemoryArena(arena, sizeof(VecFloat) + capacity*sizeof(float));
+    if (!vec)
+    {
+        return NULL;
+    }
     uint8_t *base = (uint8_t*)vec;
     base += sizeof(VecFloat);
     vec->items = (float*)base; 
@@ -314,6 +468,10 @@ static VecFloat* PushToVecFloat(VecFloat* vec, float new)
     {
         size_t new_size = sizeof(VecFloat) + 2*vec->capacity*sizeof(float);
         VecFloat* return_vec = (VecFloat*)ReallocInMemoryArena(vec->arena, (uint8_t*)vec, new_size);
+        if (!return_vec)
+        {
+            return NULL;
+        }
 
         uint8_t *base = (uint8_t*)return_vec;
         base += sizeof(VecFloat);
@@ -329,6 +487,10 @@ static VecFloat* PushToVecFloat(VecFloat* vec, float new)
 static VecIntLine* InitVecIntLine(MemoryArena *arena, int capacity)
 {
     VecIntLine* vec = (VecIntLine*)PushToMemoryArena(arena, sizeof(VecIntLine) + capacity*sizeof(IntLine));
+    if (!vec)
+    {
+        return NULL;
+    }
     uint8_t *base = (uint8_t*)vec;
     base += sizeof(VecIntLine);
     vec->items = (IntLine*)base; 
@@ -350,6 +512,10 @@ static VecIntLine* PushToVecIntLine(VecIntLine* vec, IntLine new)
     {
         size_t new_size = sizeof(VecIntLine) + 2*vec->capacity*sizeof(IntLine);
         VecIntLine* return_vec = (VecIntLine*)ReallocInMemoryArena(vec->arena, (uint8_t*)vec, new_size);
+        if (!return_vec)
+        {
+            return NULL;
+        }
 
         uint8_t *base = (uint8_t*)return_vec;
         base += sizeof(VecIntLine);
@@ -366,6 +532,10 @@ static VecIntLine* PushToVecIntLine(VecIntLine* vec, IntLine new)
 static VecChoke* InitVecChoke(MemoryArena *arena, int capacity)
 {
     VecChoke* vec = (VecChoke*)PushToMemoryArena(arena, sizeof(VecChoke) + capacity*sizeof(Choke));
+    if (!vec)
+    {
+        return NULL;
+    }
     uint8_t *base = (uint8_t*)vec;
     base += sizeof(VecChoke);
     vec->items = (Choke*)base; 
@@ -387,6 +557,10 @@ static VecChoke* PushToVecChoke(VecChoke* vec, Choke new)
     {
         size_t new_size = sizeof(VecChoke) + 2*vec->capacity*sizeof(Choke);
         VecChoke* return_vec = (VecChoke*)ReallocInMemoryArena(vec->arena, (uint8_t*)vec, new_size);
+        if (!return_vec)
+        {
+            return NULL;
+        }
 
         uint8_t *base = (uint8_t*)return_vec;
         base += sizeof(VecChoke);
@@ -418,7 +592,6 @@ typedef struct Node {
     int idx;
     float cost;
     int path_length;
-    uint8_t is_nydus;
 } Node;
 
 /*
@@ -514,10 +687,12 @@ static void queue_push_or_update(PriorityQueue *queue, Node node)
     Node* nodes = queue->nodes;
     if (queue->index_map[node.idx] != -1)
     {
+        //The cost can also increase in incremental searches, so the node may need to move either way
         int idx = queue->index_map[node.idx];
         queue->nodes[idx].cost = node.cost;
         queue->nodes[idx].path_length = node.path_length;
         queue_up(queue, idx);
+        queue_down(queue, queue->index_map[node.idx]);
     }
     else
     {
@@ -535,10 +710,39 @@ static Node queue_pop(PriorityQueue* queue)
     queue->index_map[node.idx] = -1;
     queue->nodes[0] = queue->nodes[queue->size - 1];
     --queue->size;
+    if (queue->size > 0)
+    {
+        //The last node moved to the top, queue_down only updates its index if it moves further
+        queue->index_map[queue->nodes[0].idx] = 0;
+    }
     queue_down(queue, 0);
     return node;
 }
 
+/*
+Remove a node from anywhere in the queue, if it's in the queue.
+*/
+static void queue_remove(PriorityQueue *queue, int node_idx)
+{
+    int index = queue->index_map[node_idx];
+    if (index == -1)
+    {
+        return;
+    }
+
+    queue->index_map[node_idx] = -1;
+    --queue->size;
+
+    if (index != queue->size)
+    {
+        queue->nodes[index] = queue->nodes[queue->size];
+        queue->index_map[queue->nodes[index].idx] = index;
+        int moved_node = queue->nodes[index].idx;
+        queue_up(queue, index);
+        queue_down(queue, queue->index_map[moved_node]);
+    }
+}
+
 static Node queue_top(PriorityQueue *queue)
 {
     return queue->nodes[0];
@@ -547,8 +751,16 @@ static Node queue_top(PriorityQueue *queue)
 static PriorityQueue* queue_create(MemoryArena *arena, int max_size)
 {
     PriorityQueue* queue = (PriorityQueue*) PushToMemoryArena(arena, sizeof(PriorityQueue));
+    if (!queue)
+    {
+        return NULL;
+    }
     queue->nodes = (Node*) PushToMemoryArena(arena, max_size*sizeof(Node));
     queue->index_map = (int*) PushToMemoryArena(arena, max_size*sizeof(int));
+    if (!queue->nodes || !queue->index_map)
+    {
+        return NULL;
+    }
     queue->size = 0;
 
     for (int i = 0; i < max_size; ++i)
@@ -559,6 +771,140 @@ static PriorityQueue* queue_create(MemoryArena *arena, int max_size)
     return queue;
 }
 
+/*
+Search buffers are kept between pathfinding calls so they don't have to be
+reinitialized for the whole grid each time. Each search increases the generation,
+and a node's cost and queue index only count if its stamp matches the current generation.
+Nodes are initialized with search_touch the first time a search looks at them,
+so a short search only costs time for the nodes it reaches.
+
+Buffers are taken from a pool with AcquireSearchBuffers and given back with ReleaseSearchBuffers,
+both need the GIL. In between a single search can use them without the GIL.
+*/
+typedef struct SearchBuffers {
+    int node_count;
+    uint32_t generation;
+    uint32_t *stamps;
+    float *costs;
+    int *paths;
+    PriorityQueue queue;
+    MemoryChunk *chunk;
+    struct SearchBuffers *next_free;
+} SearchBuffers;
+
+//How many unused buffers to keep around, more are needed only when searching on several threads at once
+#define MAX_POOLED_SEARCH_BUFFERS 4
+
+static SearchBuffers *search_buffer_pool = NULL;
+static int pooled_search_buffers = 0;
+
+static void FreeSearchBuffers(SearchBuffers *search)
+{
+    FreeMemoryChunk(search->chunk);
+}
+
+/*
+Get buffers for a grid with node_count nodes, reusing pooled buffers of the same size.
+Returns NULL if the memory couldn't be allocated.
+*/
+static SearchBuffers* AcquireSearchBuffers(int node_count)
+{
+    for (SearchBuffers **link = &search_buffer_pool; *link; link = &(*link)->next_free)
+    {
+        if ((*link)->node_count == node_count)
+        {
+            SearchBuffers *search = *link;
+            *link = search->next_free;
+            --pooled_search_buffers;
+            return search;
+        }
+    }
+
+    size_t per_node = sizeof(uint32_t) + sizeof(float) + 2*sizeof(int) + sizeof(Node);
+    MemoryChunk *chunk = AllocateMemoryChunk(sizeof(SearchBuffers) + (size_t)node_count*per_node);
+    if (!chunk)
+    {
+        return NULL;
+    }
+
+    uint8_t *memory = (uint8_t*)(chunk + 1);
+    SearchBuffers *search = (SearchBuffers*)memory;
+    memory += sizeof(SearchBuffers);
+    search->queue.nodes = (Node*)memory;
+    memory += node_count*sizeof(Node);
+    search->stamps = (uint32_t*)memory;
+    memory += node_count*sizeof(uint32_t);
+    search->costs = (float*)memory;
+    memory += node_count*sizeof(float);
+    search->paths = (int*)memory;
+    memory += node_count*sizeof(int);
+    search->queue.index_map = (int*)memory;
+
+    memset(search->stamps, 0, node_count*sizeof(uint32_t));
+    search->node_count = node_count;
+    search->generation = 0;
+    search->queue.size = 0;
+    search->chunk = chunk;
+    search->next_free = NULL;
+    return search;
+}
+
+static void ReleaseSearchBuffers(SearchBuffers *search)
+{
+    if (pooled_search_buffers >= MAX_POOLED_SEARCH_BUFFERS)
+    {
+        //Make room for the most recent grid size, older buffers are likely for a previous map
+        SearchBuffers **link = &search_buffer_pool;
+        while ((*link)->next_free)
+        {
+            link = &(*link)->next_free;
+        }
+        FreeSearchBuffers(*link);
+        *link = NULL;
+        --pooled_search_buffers;
+    }
+
+    search->next_free = search_buffer_pool;
+    search_buffer_pool = search;
+    ++pooled_search_buffers;
+}
+
+static void FreeSearchBufferPool(void)
+{
+    while (search_buffer_pool)
+    {
+        SearchBuffers *next = search_buffer_pool->next_free;
+        FreeSearchBuffers(search_buffer_pool);
+        search_buffer_pool = next;
+    }
+    pooled_search_buffers = 0;
+}
+
+/*
+Start a new search, which makes every node uninitialized.
+*/
+static void StartSearch(SearchBuffers *search)
+{
+    ++search->generation;
+    if (search->generation == 0)
+    {
+        //The stamps wrapped around, so old stamps could match again
+        memset(search->stamps, 0, search->node_count*sizeof(uint32_t));
+        search->generation = 1;
+    }
+    search->queue.size = 0;
+}
+
+static inline void search_touch(SearchBuffers *search, int idx)
+{
+    if (search->stamps[idx] != search->generation)
+    {
+        search->stamps[idx] = search->generation;
+        search->costs[idx] = HUGE_VALF;
+        search->queue.index_map[idx] = -1;
+    }
+}
+
 static inline float find_min(float *arr, int length)
 {
     float minimum = HUGE_VALF;
@@ -569,6 +915,52 @@ static inline float find_min(float *arr, int length)
     return minimum;
 }
 
+/*
+Get a view of the weights from any object supporting the buffer protocol,
+such as a numpy array. The weights are used in place without copying, so they have to be
+C-contiguous float32 values with h*w items. Sets a python exception and returns NULL otherwise.
+The view has to be released with PyBuffer_Release. Needs the GIL.
+*/
+static float* get_weights_buffer(PyObject *weights_object, int h, int w, Py_buffer *view)
+{
+    if (PyObject_GetBuffer(weights_object, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) != 0)
+    {
+        return NULL;
+    }
+
+    const char *format = view->format ? view->format : "B";
+    if (format[0] == '@' || format[0] == '=' || format[0] == '<')
+    {
+        ++format;
+    }
+
+    if (view->itemsize != sizeof(float) || strcmp(format, "f") != 0)
+    {
+        PyBuffer_Release(view);
+        PyErr_SetString(PyExc_TypeError, "weights must be a C-contiguous float32 array");
+        return NULL;
+    }
+
+    if (view->len != (Py_ssize_t)h*w*(Py_ssize_t)sizeof(float))
+    {
+        PyBuffer_Release(view);
+        PyErr_Format(PyExc_ValueError, "weights must have %d items but got %zd", h*w, view->len / view->itemsize);
+        return NULL;
+    }
+
+    return (float*)view->buf;
+}
+
+/*
+Minimum weight to use as the heuristic baseline.
+Callers that already know the minimum of the grid pass it in, anything below 1 means unknown
+and the grid is scanned.
+*/
+static inline float weight_baseline_or_min(float *weights, int length, float min_weight)
+{
+    return min_weight >= 1 ? min_weight : find_min(weights, length);
+}
+
 /*
 Calculate the estimated cost of moving to a point along a grid.
 Baseline should be the minimum weight in the grid so the
@@ -595,130 +987,201 @@ enum Directions {
     DOWN_RIGHT = 7
 };
 
+//Used in direction fields for nodes that don't have a next step
+#define NO_DIRECTION 255
+
+static const float nbr_step_costs[8] = { SQRT2, 1.0f, SQRT2, 1.0f, 1.0f, SQRT2, 1.0f, SQRT2 };
+
 /*
-Run the astar algorithm. The resulting path is saved in paths
-so each node knows the previous node and the path can be traced back.
-Returns the path length.
+The directions are ordered so that the opposite of direction d is 7 - d
 */
-static int run_pathfind(MemoryArena *arena, float *weights, int* paths, int w, int h, int start, int goal, int large)
+static inline int opposite_direction(int direction)
 {
-    float weight_baseline = find_min(weights, w*h);
-    
-    int path_length = -1;
-
-    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
+    return 7 - direction;
+}
 
-    PriorityQueue *nodes_to_visit = queue_create(arena, w*h);
+/*
+Indices of the 8 neighbours of a node, -1 for neighbours outside the grid
+*/
+static inline void get_neighbour_indices(int idx, int w, int h, int *nbrs)
+{
+    int row = idx / w;
+    int col = idx % w;
+
+    nbrs[UP_LEFT] = (row > 0 && col > 0) ? idx - w - 1 : -1;
+    nbrs[UP] = (row > 0) ? idx - w : -1;
+    nbrs[UP_RIGHT] = (row > 0 && col + 1 < w) ? idx - w + 1 : -1;
+    nbrs[LEFT] = (col > 0) ? idx - 1 : -1;
+    nbrs[RIGHT] = (col + 1 < w) ? idx + 1 : -1;
+    nbrs[DOWN_LEFT] = (row + 1 < h && col > 0) ? idx + w - 1 : -1;
+    nbrs[DOWN] = (row + 1 < h) ? idx + w : -1;
+    nbrs[DOWN_RIGHT] = (row + 1 < h && col + 1 < w) ? idx + w + 1 : -1;
+}
 
-    Node start_node = { start, 0.0f, 1 };
-    float *costs = (float*) PushToMemoryArena(arena, w*h*sizeof(float));
+/*
+Find the neighbours of a node and whether a unit can move to them from the node.
+Diagonal moves need both of the straight neighbours next to them to be pathable.
+Large units also need some room on either side when moving straight.
+*/
+static inline void get_neighbours(float *weights, int w, int h, int idx, int large, int *nbrs, uint8_t *nbr_fits)
+{
+    get_neighbour_indices(idx, w, h, nbrs);
 
-    for (int i = 0; i < w*h; ++i)
+    for (int i = 0; i < 8; ++i)
     {
-        costs[i] = HUGE_VALF;
+        nbr_fits[i] = (nbrs[i] != -1 && weights[nbrs[i]] < HUGE_VALF) ? 1 : 0;
     }
-    
-    costs[start] = 0;
-
-    queue_push_or_update(nodes_to_visit, start_node);
-
-    int nbrs[8];
-    uint8_t nbr_fits[8];
-    float nbr_costs[8] = { SQRT2, 1.0f, SQRT2, 1.0f, 1.0f, SQRT2, 1.0f, SQRT2 };
 
-    while (nodes_to_visit->size > 0)
+    if (large)
     {
-        Node cur = queue_pop(nodes_to_visit);
-        if (cur.idx == goal)
+        if (nbr_fits[UP])
         {
-            path_length = cur.path_length;
-            break;
+            float up_left_weight = (nbrs[UP_LEFT] != -1) ? weights[nbrs[UP_LEFT]] : HUGE_VALF;
+            float up_right_weight = (nbrs[UP_RIGHT] != -1) ? weights[nbrs[UP_RIGHT]] : HUGE_VALF;
+
+            nbr_fits[UP] = (up_left_weight < HUGE_VALF || up_right_weight < HUGE_VALF) ? 1 : 0;
         }
 
-        int row = cur.idx / w;
-        int col = cur.idx % w;
+        if (nbr_fits[LEFT])
+        {
+            float up_left_weight = (nbrs[UP_LEFT] != -1) ? weights[nbrs[UP_LEFT]] : HUGE_VALF;
+            float down_left_weight = (nbrs[DOWN_LEFT] != -1) ? weights[nbrs[DOWN_LEFT]] : HUGE_VALF;
 
-        nbrs[UP_LEFT] = (row > 0 && col > 0) ? cur.idx - w - 1 : -1;
-        nbrs[UP] = (row > 0) ? cur.idx - w : -1;
-        nbrs[UP_RIGHT] = (row > 0 && col + 1 < w) ? cur.idx - w + 1 : -1;
-        nbrs[LEFT] = (col > 0) ? cur.idx - 1 : -1;
-        nbrs[RIGHT] = (col + 1 < w) ? cur.idx + 1 : -1;
-        nbrs[DOWN_LEFT] = (row + 1 < h && col > 0) ? cur.idx + w - 1 : -1;
-        nbrs[DOWN] = (row + 1 < h) ? cur.idx + w : -1;
-        nbrs[DOWN_RIGHT] = (row + 1 < h && col + 1 < w) ? cur.idx + w + 1 : -1;
+            nbr_fits[LEFT] = (up_left_weight < HUGE_VALF || down_left_weight < HUGE_VALF) ? 1 : 0;
+        }
 
-        for (int i = 0; i < 8; ++i)
+        if (nbr_fits[RIGHT])
         {
-            nbr_fits[i] = (nbrs[i] != -1 && weights[nbrs[i]] < HUGE_VALF) ? 1 : 0;
+            float down_right_weight = (nbrs[DOWN_RIGHT] != -1) ? weights[nbrs[DOWN_RIGHT]] : HUGE_VALF;
+            float up_right_weight = (nbrs[UP_RIGHT] != -1) ? weights[nbrs[UP_RIGHT]] : HUGE_VALF;
+
+            nbr_fits[RIGHT] = (down_right_weight < HUGE_VALF || up_right_weight < HUGE_VALF) ? 1 : 0;
         }
 
-        if (large)
+        if (nbr_fits[DOWN])
         {
-            if (nbr_fits[UP])
-            {
-                float up_left_weight = (nbrs[UP_LEFT] != -1) ? weights[nbrs[UP_LEFT]] : HUGE_VALF;
-                float up_right_weight = (nbrs[UP_RIGHT] != -1) ? weights[nbrs[UP_RIGHT]] : HUGE_VALF;
+            float down_left_weight = (nbrs[DOWN_LEFT] != -1) ? weights[nbrs[DOWN_LEFT]] : HUGE_VALF;
+            float down_right_weight = (nbrs[DOWN_RIGHT] != -1) ? weights[nbrs[DOWN_RIGHT]] : HUGE_VALF;
 
-                nbr_fits[UP] = (up_left_weight < HUGE_VALF || up_right_weight < HUGE_VALF) ? 1 : 0;
-            }
+            nbr_fits[DOWN] = (down_left_weight < HUGE_VALF || down_right_weight < HUGE_VALF) ? 1 : 0;
+        }
+    }
+    
+    if (nbr_fits[UP_LEFT])
+    {
+        float up_weight = weights[nbrs[UP]];
+        float left_weight = weights[nbrs[LEFT]];
 
-            if (nbr_fits[LEFT])
-            {
-                float up_left_weight = (nbrs[UP_LEFT] != -1) ? weights[nbrs[UP_LEFT]] : HUGE_VALF;
-                float down_left_weight = (nbrs[DOWN_LEFT] != -1) ? weights[nbrs[DOWN_LEFT]] : HUGE_VALF;
+        nbr_fits[UP_LEFT] = (up_weight < HUGE_VALF && left_weight < HUGE_VALF) ? 1 : 0;
+    }
 
-                nbr_fits[LEFT] = (up_left_weight < HUGE_VALF || down_left_weight < HUGE_VALF) ? 1 : 0;
-            }
+    if (nbr_fits[UP_RIGHT])
+    {
+        float up_weight = weights[nbrs[UP]];
+        float right_weight = weights[nbrs[RIGHT]];
 
-            if (nbr_fits[RIGHT])
-            {
-                float down_right_weight = (nbrs[DOWN_RIGHT] != -1) ? weights[nbrs[DOWN_RIGHT]] : HUGE_VALF;
-                float up_right_weight = (nbrs[UP_RIGHT] != -1) ? weights[nbrs[UP_RIGHT]] : HUGE_VALF;
+        nbr_fits[UP_RIGHT] = (up_weight < HUGE_VALF && right_weight < HUGE_VALF) ? 1 : 0;
+    }
 
-                nbr_fits[RIGHT] = (down_right_weight < HUGE_VALF || up_right_weight < HUGE_VALF) ? 1 : 0;
-            }
+    if (nbr_fits[DOWN_LEFT])
+    {
+        float down_weight = weights[nbrs[DOWN]];
+        float left_weight = weights[nbrs[LEFT]];
 
-            if (nbr_fits[DOWN])
-            {
-                float down_left_weight = (nbrs[DOWN_LEFT] != -1) ? weights[nbrs[DOWN_LEFT]] : HUGE_VALF;
-                float down_right_weight = (nbrs[DOWN_RIGHT] != -1) ? weights[nbrs[DOWN_RIGHT]] : HUGE_VALF;
+        nbr_fits[DOWN_LEFT] = (down_weight < HUGE_VALF && left_weight < HUGE_VALF) ? 1 : 0;
+    }
 
-                nbr_fits[DOWN] = (down_left_weight < HUGE_VALF || down_right_weight < HUGE_VALF) ? 1 : 0;
-            }
-        }
-        
-        if (nbr_fits[UP_LEFT])
-        {
-            float up_weight = weights[nbrs[UP]];
-            float left_weight = weights[nbrs[LEFT]];
+    if (nbr_fits[DOWN_RIGHT])
+    {
+        float down_weight = weights[nbrs[DOWN]];
+        float right_weight = weights[nbrs[RIGHT]];
 
-            nbr_fits[UP_LEFT] = (up_weight < HUGE_VALF && left_weight < HUGE_VALF) ? 1 : 0;
-        }
+        nbr_fits[DOWN_RIGHT] = (down_weight < HUGE_VALF && right_weight < HUGE_VALF) ? 1 : 0;
+    }
+}
 
-        if (nbr_fits[UP_RIGHT])
-        {
-            float up_weight = weights[nbrs[UP]];
-            float right_weight = weights[nbrs[RIGHT]];
+//Outcomes of a search, the values match PathStatus on the python side
+#define SEARCH_FOUND 0
+#define SEARCH_UNREACHABLE 1
+#define SEARCH_EXPANSION_LIMIT 2
+#define SEARCH_COST_LIMIT 3
+#define SEARCH_DISTANCE_LIMIT 4
 
-            nbr_fits[UP_RIGHT] = (up_weight < HUGE_VALF && right_weight < HUGE_VALF) ? 1 : 0;
-        }
+/*
+Limits for a bounded search.
+max_expansions is the number of nodes that can be expanded, 0 for no limit.
+Nodes that cost more than max_cost to reach or are further than max_distance
+from the start in a straight line aren't visited.
+*/
+typedef struct SearchLimits {
+    int max_expansions;
+    float max_cost;
+    float max_distance;
+} SearchLimits;
 
-        if (nbr_fits[DOWN_LEFT])
-        {
-            float down_weight = weights[nbrs[DOWN]];
-            float left_weight = weights[nbrs[LEFT]];
+/*
+Run the astar algorithm. The resulting path is saved in the paths of the search buffers
+so each node knows the previous node and the path can be traced back.
+Returns the path length.
+limits can be NULL for an unbounded search. Otherwise the node the path ends at is saved
+in end_node and the outcome of the search in status. If a limit stops the search
+before the goal is reached, the path ends at the expanded node closest to the goal.
+*/
+static int run_pathfind(SearchBuffers *search, float *weights, int w, int h, int start, int goal, int large,
+                        float weight_baseline, const SearchLimits *limits, int *end_node, int *status)
+{
+    int path_length = -1;
+    int search_status = SEARCH_UNREACHABLE;
+    int expansions = 0;
+    int skipped_by_cost = 0;
+    int skipped_by_distance = 0;
+    int closest_node = start;
+    int closest_path_length = 1;
+    float closest_distance = distance_heuristic(start % w, start / w, goal % w, goal / w, 1.0f);
+
+    StartSearch(search);
+    PriorityQueue *nodes_to_visit = &search->queue;
+    float *costs = search->costs;
+    int *paths = search->paths;
+
+    Node start_node = { start, 0.0f, 1 };
+    search_touch(search, start);
+    costs[start] = 0;
+
+    queue_push_or_update(nodes_to_visit, start_node);
+
+    int nbrs[8];
+    uint8_t nbr_fits[8];
 
-            nbr_fits[DOWN_LEFT] = (down_weight < HUGE_VALF && left_weight < HUGE_VALF) ? 1 : 0;
+    while (nodes_to_visit->size > 0)
+    {
+        Node cur = queue_pop(nodes_to_visit);
+        if (cur.idx == goal)
+        {
+            path_length = cur.path_length;
+            search_status = SEARCH_FOUND;
+            break;
         }
 
-        if (nbr_fits[DOWN_RIGHT])
+        if (limits)
         {
-            float down_weight = weights[nbrs[DOWN]];
-            float right_weight = weights[nbrs[RIGHT]];
+            float goal_distance = distance_heuristic(cur.idx % w, cur.idx / w, goal % w, goal / w, 1.0f);
+            if (goal_distance < closest_distance)
+            {
+                closest_distance = goal_distance;
+                closest_node = cur.idx;
+                closest_path_length = cur.path_length;
+            }
 
-            nbr_fits[DOWN_RIGHT] = (down_weight < HUGE_VALF && right_weight < HUGE_VALF) ? 1 : 0;
+            if (limits->max_expansions > 0 && expansions >= limits->max_expansions)
+            {
+                search_status = SEARCH_EXPANSION_LIMIT;
+                break;
+            }
+            ++expansions;
         }
-        
+
+        get_neighbours(weights, w, h, cur.idx, large, nbrs, nbr_fits);
 
         float heuristic_cost;
         float cur_cost = costs[cur.idx];
@@ -727,12 +1190,26 @@ static int run_pathfind(MemoryArena *arena, float *weights, int* paths, int w, i
         {
             if (nbr_fits[i])
             {
-                float new_cost = cur_cost + weights[nbrs[i]] * nbr_costs[i];
+                float new_cost = cur_cost + weights[nbrs[i]] * nbr_step_costs[i];
+                search_touch(search, nbrs[i]);
             
                 //Small threshold to not update when the difference is just due to floating point inaccuracy
                 if (new_cost + 0.03f < costs[nbrs[i]])
                 {
-                    
+                    if (limits)
+                    {
+                        if (new_cost > limits->max_cost)
+                        {
+                            skipped_by_cost = 1;
+                            continue;
+                        }
+                        if (euclidean_distance(nbrs[i] % w, nbrs[i] / w, start % w, start / w) > limits->max_distance)
+                        {
+                            skipped_by_distance = 1;
+                            continue;
+                        }
+                    }
+
                     heuristic_cost = distance_heuristic(nbrs[i] % w, nbrs[i] / w, goal % w, goal / w, weight_baseline);
                     
                     float estimated_cost = new_cost + heuristic_cost;
@@ -745,671 +1222,2414 @@ static int run_pathfind(MemoryArena *arena, float *weights, int* paths, int w, i
             }
         }
     }
-    
-    EndTemporaryAllocation(temp_alloc);
-
-    return path_length;
-}
 
-static inline uint8_t is_nydus_node(int *nydus_nodes, int nydus_count, int node, int map_width)
-{
-    for (int i = 0; i < nydus_count; ++i)
+    if (limits)
     {
-        int nydus_x = nydus_nodes[i] % map_width;
-        int nydus_y = nydus_nodes[i] / map_width;
-        int node_x = node % map_width;
-        int node_y = node / map_width;
+        if (search_status == SEARCH_UNREACHABLE && (skipped_by_cost || skipped_by_distance))
+        {
+            //The goal might be reachable without the limits
+            search_status = skipped_by_cost ? SEARCH_COST_LIMIT : SEARCH_DISTANCE_LIMIT;
+        }
 
-        //Nydus networks are 3x3 buildings
-        if (abs(node_x - nydus_x) <= 1 && abs(node_y - nydus_y) <= 1) return 1;
+        *status = search_status;
+        *end_node = goal;
+        if (search_status != SEARCH_FOUND && search_status != SEARCH_UNREACHABLE)
+        {
+            *end_node = closest_node;
+            path_length = closest_path_length;
+        }
     }
 
-    return 0;
+    return path_length;
 }
 
-typedef struct NydusInfo {
-    float distance_heuristic_to_nydus;
-    int closest_nydus_index;
-    uint8_t can_enter_nydus;
-    uint8_t point_belongs_to_nydus;
-} NydusInfo;
-
-static inline NydusInfo get_node_nydus_info(int *nydus_nodes, int nydus_count, int node, int map_width, float baseline)
+static inline float search_cost(SearchBuffers *search, int idx)
 {
-    float min_dist = HUGE_VALF;
-    NydusInfo info = { 0 };
-    for (int i = 0; i < nydus_count; ++i)
-    {
-        int nydus_x = nydus_nodes[i] % map_width;
-        int nydus_y = nydus_nodes[i] / map_width;
-        int node_x = node % map_width;
-        int node_y = node / map_width;
-        float dist = distance_heuristic(node_x, node_y, nydus_x, nydus_y, baseline);
-
-        if (dist < min_dist)
-        {
-            min_dist = dist;
-            info.distance_heuristic_to_nydus = dist;
-            info.closest_nydus_index = nydus_nodes[i];
-            if (abs(node_x - nydus_x) <= 1 && abs(node_y - nydus_y) <= 1)
-            {
-                info.point_belongs_to_nydus = 1;
-                info.can_enter_nydus = 1;
-                break;
-            }
-            else if (abs(node_x - nydus_x) <= 2 && abs(node_y - nydus_y) <= 2)
-            {
-                info.can_enter_nydus = 1;
-            }
-        } 
-    }
-    return info;
+    return search->stamps[idx] == search->generation ? search->costs[idx] : HUGE_VALF;
 }
 
-typedef struct NydusPath
+static inline float bidirectional_potential(int idx, int w, int start_x, int start_y, int goal_x, int goal_y, float baseline)
 {
-    int path_length;
-    int nydus_used_index;
-} NydusPath;
+    return 0.5f*(distance_heuristic(idx % w, idx / w, goal_x, goal_y, baseline)
+                 - distance_heuristic(idx % w, idx / w, start_x, start_y, baseline));
+}
+
 /*
-Run the astar algorithm. The resulting path is saved in paths
-so each node knows the previous node and the path can be traced back.
-Returns the path length.
+Run astar from both ends at the same time until the searches meet.
+The forward search uses the costs and paths of forward, the backward search those of backward,
+where a path points to the next node towards the goal.
+Both searches use the average of the heuristics to the goal and to the start so they agree on the costs,
+and the search stops when no path through the unexpanded nodes can be cheaper than the best one found.
+Returns the path from start to goal or NULL if there is none.
 */
-static int run_pathfind_with_nydus(MemoryArena *arena, float *weights, int* paths, int w, int h, int start, int goal, int large, int* nydus_nodes, int nydus_count)
+static VecInt* run_pathfind_bidirectional(MemoryArena *arena, SearchBuffers *forward, SearchBuffers *backward, float *weights,
+                                          int w, int h, int start, int goal, int large, float weight_baseline)
 {
-    float weight_baseline = find_min(weights, w*h);
-    
-    int path_length = -1;
-
-    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
-
-    PriorityQueue *nodes_to_visit = queue_create(arena, w*h);
-
-    Node start_node = { start, 0.0f, 1 };
-    float *costs = (float*) PushToMemoryArena(arena, w*h*sizeof(float));
-
-    for (int i = 0; i < w*h; ++i)
-    {
-        costs[i] = HUGE_VALF;
-    }
-    
-    costs[start] = 0;
-
-    queue_push_or_update(nodes_to_visit, start_node);
+    StartSearch(forward);
+    StartSearch(backward);
+
+    int start_x = start % w;
+    int start_y = start / w;
+    int goal_x = goal % w;
+    int goal_y = goal / w;
+
+    //The forward key of a node is its cost plus potential, the backward key its cost minus potential
+    search_touch(forward, start);
+    forward->costs[start] = 0;
+    float start_potential = bidirectional_potential(start, w, start_x, start_y, goal_x, goal_y, weight_baseline);
+    Node start_node = { start, start_potential, 1 };
+    queue_push_or_update(&forward->queue, start_node);
+
+    search_touch(backward, goal);
+    backward->costs[goal] = 0;
+    float goal_potential = bidirectional_potential(goal, w, start_x, start_y, goal_x, goal_y, weight_baseline);
+    Node goal_node = { goal, -goal_potential, 1 };
+    queue_push_or_update(&backward->queue, goal_node);
+
+    float best_cost = start == goal ? 0.0f : HUGE_VALF;
+    int meeting_node = start == goal ? start : -1;
 
     int nbrs[8];
     uint8_t nbr_fits[8];
-    float nbr_costs[8] = { SQRT2, 1.0f, SQRT2, 1.0f, 1.0f, SQRT2, 1.0f, SQRT2 };
-
-    NydusInfo closest_nydus_to_goal = get_node_nydus_info(nydus_nodes, nydus_count, goal, w, weight_baseline);
+    int prev_nbrs[8];
+    uint8_t prev_nbr_fits[8];
 
-    int *nydus_nbrs = PushToMemoryArena(arena, max_int(1, nydus_count - 1)*sizeof(int));
-
-    while (nodes_to_visit->size > 0)
+    while (forward->queue.size > 0 && backward->queue.size > 0)
     {
-        Node cur = queue_pop(nodes_to_visit);
-        if (cur.idx == goal)
+        if (queue_top(&forward->queue).cost + queue_top(&backward->queue).cost + 0.03f >= best_cost)
         {
-            path_length = cur.path_length;
             break;
         }
 
-        int row = cur.idx / w;
-        int col = cur.idx % w;
-
-        if (cur.is_nydus)
+        if (forward->queue.size <= backward->queue.size)
         {
-            int j = 0;
-            for (int i = 0; i < nydus_count; ++i)
+            Node cur = queue_pop(&forward->queue);
+            float cur_cost = forward->costs[cur.idx];
+            get_neighbours(weights, w, h, cur.idx, large, nbrs, nbr_fits);
+
+            for (int i = 0; i < 8; ++i)
             {
-                if (nydus_nodes[i] != cur.idx)
+                if (!nbr_fits[i]) continue;
+
+                int nbr = nbrs[i];
+                float new_cost = cur_cost + weights[nbr] * nbr_step_costs[i];
+                search_touch(forward, nbr);
+
+                //Small threshold to not update when the difference is just due to floating point inaccuracy
+                if (new_cost + 0.03f < forward->costs[nbr])
                 {
-                    nydus_nbrs[j] = nydus_nodes[i];
-                    j++;
+                    float potential = bidirectional_potential(nbr, w, start_x, start_y, goal_x, goal_y, weight_baseline);
+                    Node new_node = { nbr, new_cost + potential, cur.path_length + 1 };
+                    queue_push_or_update(&forward->queue, new_node);
+
+                    forward->costs[nbr] = new_cost;
+                    forward->paths[nbr] = cur.idx;
+
+                    float total_cost = new_cost + search_cost(backward, nbr);
+                    if (total_cost < best_cost)
+                    {
+                        best_cost = total_cost;
+                        meeting_node = nbr;
+                    }
                 }
             }
-            
-            //Giving 8 places units can get out from a nydus on foot
-            //There may be some cases where some big unit like an ultralisk
-            //can't really fit and we should do proper checks
-            nbrs[UP_LEFT] = (row > 1 && col > 1) ? cur.idx - 2*w - 2 : -1;
-            nbrs[UP] = (row > 1) ? cur.idx - 2*w : -1;
-            nbrs[UP_RIGHT] = (row > 1 && col + 2 < w) ? cur.idx - 2*w + 2 : -1;
-            nbrs[LEFT] = (col > 1) ? cur.idx - 2 : -1;
-            nbrs[RIGHT] = (col + 2 < w) ? cur.idx + 2 : -1;
-            nbrs[DOWN_LEFT] = (row + 2 < h && col > 1) ? cur.idx + 2*w - 2 : -1;
-            nbrs[DOWN] = (row + 2 < h) ? cur.idx + 2*w : -1;
-            nbrs[DOWN_RIGHT] = (row + 2 < h && col + 2 < w) ? cur.idx + 2*w + 2 : -1;
-            
-            for (int i = 0; i < 8; ++i)
-            {
-                nbr_fits[i] = (nbrs[i] != -1 && weights[nbrs[i]] < HUGE_VALF) ? 1 : 0;
-            }
         }
         else
         {
-            nbrs[UP_LEFT] = (row > 0 && col > 0) ? cur.idx - w - 1 : -1;
-            nbrs[UP] = (row > 0) ? cur.idx - w : -1;
-            nbrs[UP_RIGHT] = (row > 0 && col + 1 < w) ? cur.idx - w + 1 : -1;
-            nbrs[LEFT] = (col > 0) ? cur.idx - 1 : -1;
-            nbrs[RIGHT] = (col + 1 < w) ? cur.idx + 1 : -1;
-            nbrs[DOWN_LEFT] = (row + 1 < h && col > 0) ? cur.idx + w - 1 : -1;
-            nbrs[DOWN] = (row + 1 < h) ? cur.idx + w : -1;
-            nbrs[DOWN_RIGHT] = (row + 1 < h && col + 1 < w) ? cur.idx + w + 1 : -1;
+            Node cur = queue_pop(&backward->queue);
+            float cur_cost = backward->costs[cur.idx];
+            get_neighbour_indices(cur.idx, w, h, nbrs);
 
             for (int i = 0; i < 8; ++i)
             {
-                nbr_fits[i] = (nbrs[i] != -1 && weights[nbrs[i]] < HUGE_VALF) ? 1 : 0;
-            }
+                int prev = nbrs[i];
+                if (prev == -1 || weights[prev] >= HUGE_VALF) continue;
 
-            if (large)
-            {
-                if (nbr_fits[UP])
-                {
-                    float up_left_weight = (nbrs[UP_LEFT] != -1) ? weights[nbrs[UP_LEFT]] : HUGE_VALF;
-                    float up_right_weight = (nbrs[UP_RIGHT] != -1) ? weights[nbrs[UP_RIGHT]] : HUGE_VALF;
-                    nbr_fits[UP] = (up_left_weight < HUGE_VALF || up_right_weight < HUGE_VALF) ? 1 : 0;
-                }
+                //Going from prev to cur is a step in the opposite direction
+                int direction = opposite_direction(i);
+                float new_cost = cur_cost + weights[cur.idx] * nbr_step_costs[direction];
+                search_touch(backward, prev);
 
-                if (nbr_fits[LEFT])
+                if (new_cost + 0.03f < backward->costs[prev])
                 {
-                    float up_left_weight = (nbrs[UP_LEFT] != -1) ? weights[nbrs[UP_LEFT]] : HUGE_VALF;
-                    float down_left_weight = (nbrs[DOWN_LEFT] != -1) ? weights[nbrs[DOWN_LEFT]] : HUGE_VALF;
+                    get_neighbours(weights, w, h, prev, large, prev_nbrs, prev_nbr_fits);
+                    if (!prev_nbr_fits[direction]) continue;
 
-                    nbr_fits[LEFT] = (up_left_weight < HUGE_VALF || down_left_weight < HUGE_VALF) ? 1 : 0;
-                }
+                    float potential = bidirectional_potential(prev, w, start_x, start_y, goal_x, goal_y, weight_baseline);
+                    Node new_node = { prev, new_cost - potential, cur.path_length + 1 };
+                    queue_push_or_update(&backward->queue, new_node);
 
-                if (nbr_fits[RIGHT])
-                {
-                    float down_right_weight = (nbrs[DOWN_RIGHT] != -1) ? weights[nbrs[DOWN_RIGHT]] : HUGE_VALF;
-                    float up_right_weight = (nbrs[UP_RIGHT] != -1) ? weights[nbrs[UP_RIGHT]] : HUGE_VALF;
+                    backward->costs[prev] = new_cost;
+                    backward->paths[prev] = cur.idx;
 
-                    nbr_fits[RIGHT] = (down_right_weight < HUGE_VALF || up_right_weight < HUGE_VALF) ? 1 : 0;
+                    float total_cost = new_cost + search_cost(forward, prev);
+                    if (total_cost < best_cost)
+                    {
+                        best_cost = total_cost;
+                        meeting_node = prev;
+                    }
                 }
+            }
+        }
+    }
 
-                if (nbr_fits[DOWN])
-                {
-                    float down_left_weight = (nbrs[DOWN_LEFT] != -1) ? weights[nbrs[DOWN_LEFT]] : HUGE_VALF;
-                    float down_right_weight = (nbrs[DOWN_RIGHT] != -1) ? weights[nbrs[DOWN_RIGHT]] : HUGE_VALF;
+    if (meeting_node == -1)
+    {
+        return NULL;
+    }
 
-                    nbr_fits[DOWN] = (down_left_weight < HUGE_VALF || down_right_weight < HUGE_VALF) ? 1 : 0;
-                }
-            }
-            
-            if (nbr_fits[UP_LEFT])
-            {
-                float up_weight = weights[nbrs[UP]];
-                float left_weight = weights[nbrs[LEFT]];
+    int forward_length = 1;
+    for (int idx = meeting_node; idx != start; idx = forward->paths[idx])
+    {
+        ++forward_length;
+    }
 
-                nbr_fits[UP_LEFT] = (up_weight < HUGE_VALF && left_weight < HUGE_VALF) ? 1 : 0;
-            }
+    VecInt *path = InitVecInt(arena, forward_length + 16);
+    if (!path)
+    {
+        return NULL;
+    }
+    path->size = forward_length;
+    int idx = meeting_node;
+    for (int i = forward_length - 1; i >= 0; --i)
+    {
+        path->items[i] = idx;
+        idx = i > 0 ? forward->paths[idx] : idx;
+    }
 
-            if (nbr_fits[UP_RIGHT])
-            {
-                float up_weight = weights[nbrs[UP]];
-                float right_weight = weights[nbrs[RIGHT]];
+    for (idx = meeting_node; idx != goal; )
+    {
+        idx = backward->paths[idx];
+        path = PushToVecInt(path, idx);
+        if (!path)
+        {
+            return NULL;
+        }
+    }
 
-                nbr_fits[UP_RIGHT] = (up_weight < HUGE_VALF && right_weight < HUGE_VALF) ? 1 : 0;
-            }
+    return path;
+}
 
-            if (nbr_fits[DOWN_LEFT])
+/*
+Check whether the grid has the same weight on every pathable node.
+Jump point search only gives optimal paths on such grids.
+*/
+static int is_uniform_grid(float *weights, int length)
+{
+    float uniform_weight = HUGE_VALF;
+    for (int i = 0; i < length; ++i)
+    {
+        if (weights[i] < HUGE_VALF)
+        {
+            if (uniform_weight == HUGE_VALF)
             {
-                float down_weight = weights[nbrs[DOWN]];
-                float left_weight = weights[nbrs[LEFT]];
-
-                nbr_fits[DOWN_LEFT] = (down_weight < HUGE_VALF && left_weight < HUGE_VALF) ? 1 : 0;
+                uniform_weight = weights[i];
             }
-
-            if (nbr_fits[DOWN_RIGHT])
+            else if (weights[i] != uniform_weight)
             {
-                float down_weight = weights[nbrs[DOWN]];
-                float right_weight = weights[nbrs[RIGHT]];
-
-                nbr_fits[DOWN_RIGHT] = (down_weight < HUGE_VALF && right_weight < HUGE_VALF) ? 1 : 0;
+                return 0;
             }
         }
-        
-        float cur_cost = costs[cur.idx];
+    }
+    return 1;
+}
 
-        //Scaling the steps into and from nyduses with 4
-        //Going into a nydus and getting out should take a bit more time than a single step on the grid
+static inline int jps_walkable(float *weights, int w, int h, int x, int y)
+{
+    return x >= 0 && x < w && y >= 0 && y < h && weights[y*w + x] < HUGE_VALF;
+}
 
-        for (int i = 0; i < 8; ++i)
+/*
+Move from (x, y) in the direction (dx, dy) until a jump point is found.
+The move to (x, y) itself should already be known to be valid.
+Diagonal moves can't cut corners, so only straight moves can have forced neighbours
+and a diagonal jump stops when one of its straight jumps finds something.
+Returns the index of the jump point or -1 if the line ends in an obstacle.
+*/
+static int jump(float *weights, int w, int h, int x, int y, int dx, int dy, int goal)
+{
+    while (jps_walkable(weights, w, h, x, y))
+    {
+        int idx = y*w + x;
+        if (idx == goal)
         {
-            if (nbr_fits[i])
-            {
-                float new_cost;
-                if (cur.is_nydus)
-                {
-                    new_cost = cur_cost + 4*weights[nbrs[i]] * nbr_costs[i];
-                }
-                else
-                {
-                    new_cost = cur_cost + weights[nbrs[i]] * nbr_costs[i];
-                }
-            
-                //Small threshold to not update when the difference is just due to floating point inaccuracy
-                if (new_cost + 0.03f < costs[nbrs[i]])
-                {
-                    
-                    float heuristic_cost = distance_heuristic(nbrs[i] % w, nbrs[i] / w, goal % w, goal / w, weight_baseline);
-                    
-                    if (nydus_count > 0)
-                    {
-                        NydusInfo closest_nydus = get_node_nydus_info(nydus_nodes, nydus_count, nbrs[i], w, weight_baseline);
-
-                        float heuristic_via_nydus = 4*weight_baseline + closest_nydus.distance_heuristic_to_nydus + closest_nydus_to_goal.distance_heuristic_to_nydus;
-                        heuristic_cost = heuristic_cost < heuristic_via_nydus ? heuristic_cost : heuristic_via_nydus;
-                    }
+            return idx;
+        }
 
-                    float estimated_cost = new_cost + heuristic_cost;
-                    Node new_node = { nbrs[i], estimated_cost, cur.path_length + 1, 0};
-                    queue_push_or_update(nodes_to_visit, new_node);
+        if (dx != 0 && dy != 0)
+        {
+            if (jump(weights, w, h, x + dx, y, dx, 0, goal) != -1 || jump(weights, w, h, x, y + dy, 0, dy, goal) != -1)
+            {
+                return idx;
+            }
 
-                    costs[nbrs[i]] = new_cost;
-                    paths[nbrs[i]] = cur.idx;
-                }    
+            if (!jps_walkable(weights, w, h, x + dx, y) || !jps_walkable(weights, w, h, x, y + dy))
+            {
+                return -1;
             }
         }
-
-        if (cur.is_nydus)
+        else if (dx != 0)
         {
-            for (int i = 0; i < nydus_count - 1; ++i)
+            if ((jps_walkable(weights, w, h, x, y - 1) && !jps_walkable(weights, w, h, x - dx, y - 1))
+                || (jps_walkable(weights, w, h, x, y + 1) && !jps_walkable(weights, w, h, x - dx, y + 1)))
             {
-                float new_cost = cur_cost + 4*weight_baseline;
-                int nydus_nbr = nydus_nbrs[i];
-                //Small threshold to not update when the difference is just due to floating point inaccuracy
-                if (new_cost + 0.03f < costs[nydus_nbr])
-                {
-                    float heuristic_cost = distance_heuristic(nydus_nbr % w, nydus_nbr / w, goal % w, goal / w, weight_baseline);
-                    float heuristic_via_nydus = 4*weight_baseline + closest_nydus_to_goal.distance_heuristic_to_nydus;
-                    heuristic_cost = heuristic_cost < heuristic_via_nydus ? heuristic_cost : heuristic_via_nydus;
-                    
-                    float estimated_cost = new_cost + heuristic_cost;
-                    Node new_node = { nydus_nbr, estimated_cost, cur.path_length + 1, 1};
-                    queue_push_or_update(nodes_to_visit, new_node);
-
-                    costs[nydus_nbr] = new_cost;
-                    paths[nydus_nbr] = cur.idx;
-                }    
-
+                return idx;
             }
         }
         else
         {
-            NydusInfo closest_nydus = get_node_nydus_info(nydus_nodes, nydus_count, cur.idx, w, weight_baseline);
-                    
-            if (nydus_count > 0 && closest_nydus.can_enter_nydus)
+            if ((jps_walkable(weights, w, h, x - 1, y) && !jps_walkable(weights, w, h, x - 1, y - dy))
+                || (jps_walkable(weights, w, h, x + 1, y) && !jps_walkable(weights, w, h, x + 1, y - dy)))
             {
-                float heuristic_via_nydus = 4*weight_baseline + closest_nydus_to_goal.distance_heuristic_to_nydus;
-                
-                float new_cost = cur_cost + 4*weights[cur.idx];
-                
-                if (new_cost + 0.03f < costs[closest_nydus.closest_nydus_index])
-                {
-                    float estimated_cost = new_cost + heuristic_via_nydus;
-                    Node nydus_node = { closest_nydus.closest_nydus_index, estimated_cost, cur.path_length + 1, 1};
-
-                    queue_push_or_update(nodes_to_visit, nydus_node);
-                    
-                    costs[closest_nydus.closest_nydus_index] = new_cost;
-                    paths[closest_nydus.closest_nydus_index] = cur.idx;
-                }
+                return idx;
             }
         }
+
+        x += dx;
+        y += dy;
     }
-    
-    EndTemporaryAllocation(temp_alloc);
 
-    return path_length;
+    return -1;
 }
 
 /*
-Estimating a straight line weight over multiple nodes.
-Used in path smoothing where we remove nodes if we can jump
-ahead some nodes in a straight line with a lower cost.
+Find the directions a jump point search should continue to from a node
+that was reached from parent. The start node has no parent and
+continues to all of its neighbours.
+Directions are saved as (dx, dy) pairs and their count is returned.
 */
-static float calculate_line_weight(MemoryArena *arena, float* weights, int w, int x0, int y0, int x1, int y1)
+static int jps_successor_directions(float *weights, int w, int h, int idx, int parent, int *directions)
 {
-    float flight_distance = euclidean_distance(x0, y0, x1, y1);
-    
-    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
+    int x = idx % w;
+    int y = idx / w;
+    int count = 0;
 
-    VecInt *line_coords = InitVecInt(arena, (int)flight_distance*2);
-
-    int step_constant = 5;
-    float step_constant_inverse = (float) 1 / step_constant;
+    if (parent == -1)
+    {
+        int nbrs[8];
+        uint8_t nbr_fits[8];
+        get_neighbours(weights, w, h, idx, 0, nbrs, nbr_fits);
+        for (int i = 0; i < 8; ++i)
+        {
+            if (nbr_fits[i])
+            {
+                directions[2*count] = nbrs[i] % w - x;
+                directions[2*count + 1] = nbrs[i] / w - y;
+                ++count;
+            }
+        }
+        return count;
+    }
 
-    int dots = step_constant*(int)flight_distance;
+    int dx = x - parent % w;
+    int dy = y - parent / w;
+    dx = (dx > 0) - (dx < 0);
+    dy = (dy > 0) - (dy < 0);
 
-    float dir_vec[2] = { (x1 - x0) / flight_distance, (y1 - y0) / flight_distance };
+    if (dx != 0 && dy != 0)
+    {
+        int next_x_walkable = jps_walkable(weights, w, h, x + dx, y);
+        int next_y_walkable = jps_walkable(weights, w, h, x, y + dy);
 
-    for (int i = 0; i < dots; ++i)
+        if (next_y_walkable)
+        {
+            directions[2*count] = 0;
+            directions[2*count + 1] = dy;
+            ++count;
+        }
+        if (next_x_walkable)
+        {
+            directions[2*count] = dx;
+            directions[2*count + 1] = 0;
+            ++count;
+        }
+        if (next_x_walkable && next_y_walkable)
+        {
+            directions[2*count] = dx;
+            directions[2*count + 1] = dy;
+            ++count;
+        }
+    }
+    else
     {
-        int current_x = (int)(x0 + dir_vec[0]*i*step_constant_inverse);
-        int current_y = (int)(y0 + dir_vec[1]*i*step_constant_inverse);
+        //Perpendicular directions to the movement
+        int px = dy;
+        int py = dx;
+        int next_walkable = jps_walkable(weights, w, h, x + dx, y + dy);
 
-        int added_already = 0;
-        for (int j = 0; j < line_coords->size; ++j)
+        for (int side = -1; side <= 1; side += 2)
         {
-            if (line_coords->items[j] == w*current_y + current_x)
+            int side_x = side*px;
+            int side_y = side*py;
+
+            if (jps_walkable(weights, w, h, x + side_x, y + side_y))
             {
-                added_already = 1;
+                directions[2*count] = side_x;
+                directions[2*count + 1] = side_y;
+                ++count;
+
+                if (next_walkable)
+                {
+                    directions[2*count] = dx + side_x;
+                    directions[2*count + 1] = dy + side_y;
+                    ++count;
+                }
             }
         }
 
-        if (!added_already)
+        if (next_walkable)
         {
-            line_coords = PushToVecInt(line_coords, w*current_y + current_x);
+            directions[2*count] = dx;
+            directions[2*count + 1] = dy;
+            ++count;
         }
     }
 
-    float norm = 0.0f;
-    if (line_coords->size > 0)
-    {
-        norm = flight_distance / line_coords->size; 
+    return count;
+}
+
+/*
+Run jump point search. Only valid for grids where every pathable node has the same weight
+and for units that aren't large.
+Only jump points are expanded, and once the goal is found the straight segments
+between them are filled in so the paths look the same as after run_pathfind.
+Returns the path length.
+*/
+static int run_pathfind_jps(SearchBuffers *search, float *weights, int w, int h, int start, int goal,
+                            float weight_baseline)
+{
+    int path_length = -1;
+
+    StartSearch(search);
+    PriorityQueue *nodes_to_visit = &search->queue;
+    float *costs = search->costs;
+    int *paths = search->paths;
+
+    Node start_node = { start, 0.0f, 1 };
+    search_touch(search, start);
+    costs[start] = 0;
+    paths[start] = -1;
+
+    queue_push_or_update(nodes_to_visit, start_node);
+
+    int directions[16];
+    int goal_x = goal % w;
+    int goal_y = goal / w;
+
+    while (nodes_to_visit->size > 0)
+    {
+        Node cur = queue_pop(nodes_to_visit);
+        if (cur.idx == goal)
+        {
+            path_length = 1;
+            break;
+        }
+
+        int cur_x = cur.idx % w;
+        int cur_y = cur.idx / w;
+        float cur_cost = costs[cur.idx];
+        int direction_count = jps_successor_directions(weights, w, h, cur.idx,
+                                                       cur.idx == start ? -1 : paths[cur.idx], directions);
+
+        for (int i = 0; i < direction_count; ++i)
+        {
+            int dx = directions[2*i];
+            int dy = directions[2*i + 1];
+            int jump_point = jump(weights, w, h, cur_x + dx, cur_y + dy, dx, dy, goal);
+
+            if (jump_point == -1)
+            {
+                continue;
+            }
+
+            int jump_x = jump_point % w;
+            int jump_y = jump_point / w;
+            float new_cost = cur_cost + distance_heuristic(cur_x, cur_y, jump_x, jump_y, weight_baseline);
+            search_touch(search, jump_point);
+
+            if (new_cost + 0.03f < costs[jump_point])
+            {
+                float estimated_cost = new_cost + distance_heuristic(jump_x, jump_y, goal_x, goal_y, weight_baseline);
+                Node new_node = { jump_point, estimated_cost, 0 };
+                queue_push_or_update(nodes_to_visit, new_node);
+
+                costs[jump_point] = new_cost;
+                paths[jump_point] = cur.idx;
+            }
+        }
+    }
+
+    if (path_length > 0)
+    {
+        //Fill in the nodes between jump points
+        int current_node = goal;
+        while (current_node != start)
+        {
+            int parent = paths[current_node];
+            int dx = parent % w - current_node % w;
+            int dy = parent / w - current_node / w;
+            int steps = max_int(abs(dx), abs(dy));
+            int step = ((dy > 0) - (dy < 0))*w + ((dx > 0) - (dx < 0));
+
+            for (int i = 0; i < steps; ++i)
+            {
+                paths[current_node] = current_node + step;
+                current_node += step;
+            }
+            path_length += steps;
+        }
     }
 
+    return path_length;
+}
+
+/*
+Cost of moving in a straight line between two nodes, or HUGE_VALF if the line is blocked.
+The line is walked like a Bresenham line, every node it enters has to be pathable and diagonal steps
+can't cut corners, same as in the regular search. Like calculate_line_weight, the cost is the sum
+of the entered weights scaled so a line over uniform weights costs its length times the weight.
+*/
+static float line_of_sight_cost(float *weights, int w, int from, int to)
+{
+    int x = from % w;
+    int y = from / w;
+    int x1 = to % w;
+    int y1 = to / w;
+    int dx = abs(x1 - x);
+    int dy = abs(y1 - y);
+    int sx = x < x1 ? 1 : -1;
+    int sy = y < y1 ? 1 : -1;
+    int steps = max_int(dx, dy);
+    int error = dx - dy;
     float weight_sum = 0.0f;
-    for (int i = 0; i < line_coords->size; ++i)
+
+    for (int i = 0; i < steps; ++i)
     {
-        weight_sum += weights[line_coords->items[i]];
-        if(weight_sum >= HUGE_VALF) break;
+        int error2 = 2*error;
+        int step_x = error2 > -dy;
+        int step_y = error2 < dx;
+
+        if (step_x && step_y && (weights[w*y + x + sx] == HUGE_VALF || weights[w*(y + sy) + x] == HUGE_VALF))
+        {
+            return HUGE_VALF;
+        }
+        if (step_x)
+        {
+            error -= dy;
+            x += sx;
+        }
+        if (step_y)
+        {
+            error += dx;
+            y += sy;
+        }
+
+        float weight = weights[w*y + x];
+        if (weight == HUGE_VALF)
+        {
+            return HUGE_VALF;
+        }
+        weight_sum += weight;
     }
 
-    EndTemporaryAllocation(temp_alloc);
+    return steps > 0 ? weight_sum * euclidean_distance(from % w, from / w, x1, y1) / steps : 0.0f;
+}
 
-    return weight_sum*norm;
+/*
+Walk the straight line from start to goal like line_of_sight_cost does.
+If every step fits on the grid and enters a node with the minimum weight, no path can be cheaper,
+so the nodes on the line are returned as the path. Otherwise returns NULL and the grid has to be searched.
+*/
+static VecInt* straight_line_path(MemoryArena *arena, float *weights, int w, int h, int start, int goal, int large,
+                                  float weight_baseline)
+{
+    int x = start % w;
+    int y = start / w;
+    int x1 = goal % w;
+    int y1 = goal / w;
+    int dx = abs(x1 - x);
+    int dy = abs(y1 - y);
+    int sx = x < x1 ? 1 : -1;
+    int sy = y < y1 ? 1 : -1;
+    int steps = max_int(dx, dy);
+    int error = dx - dy;
+
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+
+    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
+    //The path has room for every node on the line, so only creating it can fail
+    VecInt *path = InitVecInt(arena, steps + 1);
+    if (!path)
+    {
+        return NULL;
+    }
+    path = PushToVecInt(path, start);
+
+    for (int i = 0; i < steps; ++i)
+    {
+        int error2 = 2*error;
+        int cur = w*y + x;
+        if (error2 > -dy)
+        {
+            error -= dy;
+            x += sx;
+        }
+        if (error2 < dx)
+        {
+            error += dx;
+            y += sy;
+        }
+        int next = w*y + x;
+
+        get_neighbours(weights, w, h, cur, large, nbrs, nbr_fits);
+        int fits = 0;
+        for (int j = 0; j < 8; ++j)
+        {
+            if (nbrs[j] == next)
+            {
+                fits = nbr_fits[j];
+                break;
+            }
+        }
+
+        if (!fits || weights[next] > weight_baseline)
+        {
+            EndTemporaryAllocation(temp_alloc);
+            return NULL;
+        }
+        path = PushToVecInt(path, next);
+    }
+
+    return path;
 }
 
-static VecInt* create_smoothed_path(MemoryArena *arena, float *weights, VecInt *complete_path, int start_index, int end_index, int w)
+/*
+A node is closed once it has been expanded: it has a cost but isn't in the queue anymore.
+*/
+static inline int search_closed(SearchBuffers *search, int idx)
 {
-    int path_length = end_index - start_index;
+    return search->stamps[idx] == search->generation && search->queue.index_map[idx] == -1
+           && search->costs[idx] < HUGE_VALF;
+}
+
+/*
+Run theta*, an any-angle version of astar. A node's parent can be any node it has a
+straight line of sight to, so the path is a list of waypoints instead of neighbouring nodes.
+Nodes try to connect straight to the parent of the node that reached them.
+With lazy set, which is only exact on grids where every pathable node has the same weight,
+the line is assumed to be clear and is checked only when the node is expanded. If it's blocked
+or costs more than assumed, the node is attached to its best expanded neighbour instead.
+Otherwise the line is checked right away and compared to the step from the node that reached it.
+Only for units that aren't large. The waypoints can be traced back from the goal through paths.
+Returns the number of waypoints.
+*/
+static int run_pathfind_any_angle(SearchBuffers *search, float *weights, int w, int h, int start, int goal,
+                                  int lazy, float weight_baseline)
+{
+    int path_length = -1;
+
+    StartSearch(search);
+    PriorityQueue *nodes_to_visit = &search->queue;
+    float *costs = search->costs;
+    int *paths = search->paths;
+
+    Node start_node = { start, 0.0f, 1 };
+    search_touch(search, start);
+    costs[start] = 0;
+    paths[start] = start;
+
+    queue_push_or_update(nodes_to_visit, start_node);
+
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+    int goal_x = goal % w;
+    int goal_y = goal / w;
+
+    while (nodes_to_visit->size > 0)
+    {
+        Node cur = queue_pop(nodes_to_visit);
+        get_neighbours(weights, w, h, cur.idx, 0, nbrs, nbr_fits);
+
+        int parent = paths[cur.idx];
+        if (lazy && cur.idx != start)
+        {
+            float line_cost = line_of_sight_cost(weights, w, parent, cur.idx);
+            float best_cost = costs[parent] + line_cost;
+
+            if (best_cost > costs[cur.idx] + 0.03f)
+            {
+                //The assumed line isn't available, take the best expanded neighbour
+                for (int i = 0; i < 8; ++i)
+                {
+                    if (nbr_fits[i] && search_closed(search, nbrs[i]))
+                    {
+                        float nbr_cost = costs[nbrs[i]] + weights[cur.idx] * nbr_step_costs[i];
+                        if (nbr_cost < best_cost)
+                        {
+                            best_cost = nbr_cost;
+                            parent = nbrs[i];
+                        }
+                    }
+                }
+                paths[cur.idx] = parent;
+            }
+            costs[cur.idx] = best_cost;
+        }
+
+        if (cur.idx == goal)
+        {
+            path_length = 1;
+            for (int node = goal; node != start; node = paths[node])
+            {
+                ++path_length;
+            }
+            break;
+        }
+
+        //Neighbours try to connect straight to the parent of this node
+        int line_parent = cur.idx == start ? start : paths[cur.idx];
+        int parent_x = line_parent % w;
+        int parent_y = line_parent / w;
+
+        for (int i = 0; i < 8; ++i)
+        {
+            if (!nbr_fits[i])
+            {
+                continue;
+            }
+
+            int nbr = nbrs[i];
+            search_touch(search, nbr);
+            if (search_closed(search, nbr))
+            {
+                continue;
+            }
+
+            int nbr_x = nbr % w;
+            int nbr_y = nbr / w;
+            int new_parent = line_parent;
+            float new_cost;
+
+            if (lazy)
+            {
+                new_cost = costs[line_parent] + weights[nbr] * euclidean_distance(parent_x, parent_y, nbr_x, nbr_y);
+            }
+            else
+            {
+                new_cost = costs[cur.idx] + weights[nbr] * nbr_step_costs[i];
+                new_parent = cur.idx;
+
+                if (line_parent != cur.idx)
+                {
+                    float line_cost = costs[line_parent] + line_of_sight_cost(weights, w, line_parent, nbr);
+                    if (line_cost <= new_cost)
+                    {
+                        new_cost = line_cost;
+                        new_parent = line_parent;
+                    }
+                }
+            }
+
+            if (new_cost + 0.03f < costs[nbr])
+            {
+                float estimated_cost = new_cost + weight_baseline * euclidean_distance(nbr_x, nbr_y, goal_x, goal_y);
+                Node new_node = { nbr, estimated_cost, 0 };
+                queue_push_or_update(nodes_to_visit, new_node);
+
+                costs[nbr] = new_cost;
+                paths[nbr] = new_parent;
+            }
+        }
+    }
+
+    return path_length;
+}
+
+/*
+Run astar towards the closest of multiple goals.
+The heuristic is the minimum of the heuristics to each goal so it remains consistent,
+and the search stops at the first goal that gets popped from the queue.
+The reached goal and the cost of the path are saved in reached_goal and path_cost.
+Returns the path length, or -1 if no goal was reached or the arena ran out of memory.
+*/
+static int run_pathfind_multi_goal(MemoryArena *arena, float *weights, int* paths, int w, int h, int start,
+                                   int *goals, int goal_count, int large, float weight_baseline,
+                                   int *reached_goal, float *path_cost)
+{
+    int path_length = -1;
+
+    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
+
+    PriorityQueue *nodes_to_visit = queue_create(arena, w*h);
+    uint8_t *is_goal = (uint8_t*) PushToMemoryArena(arena, w*h*sizeof(uint8_t));
+    float *costs = (float*) PushToMemoryArena(arena, w*h*sizeof(float));
+    if (!nodes_to_visit || !is_goal || !costs)
+    {
+        EndTemporaryAllocation(temp_alloc);
+        return -1;
+    }
+
+    for (int i = 0; i < goal_count; ++i)
+    {
+        is_goal[goals[i]] = 1;
+    }
+
+    Node start_node = { start, 0.0f, 1 };
+
+    for (int i = 0; i < w*h; ++i)
+    {
+        costs[i] = HUGE_VALF;
+    }
     
-    int start = complete_path->items[start_index];
-    int goal = complete_path->items[end_index - 1];
+    costs[start] = 0;
 
-    VecInt *smoothed_path = InitVecInt(arena, path_length);
-    smoothed_path = PushToVecInt(smoothed_path, start);
-    int current_node = goal;
+    queue_push_or_update(nodes_to_visit, start_node);
 
-    float segment_total_weight = weights[goal] * distance_heuristic(goal % w, goal / w, current_node % w, current_node / w, 1.0f);
-    for (int i = 1; i < path_length - 1; ++i)
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+
+    while (nodes_to_visit->size > 0)
     {
-        int current_node = complete_path->items[start_index + i];
-        int next_node = complete_path->items[start_index + i + 1];
-        float step_weight = weights[next_node] * distance_heuristic(current_node % w, current_node / w, next_node % w, next_node / w, 1.0f);
-        segment_total_weight += step_weight;
+        Node cur = queue_pop(nodes_to_visit);
+        if (is_goal[cur.idx])
+        {
+            path_length = cur.path_length;
+            *reached_goal = cur.idx;
+            *path_cost = costs[cur.idx];
+            break;
+        }
 
-        int last_added_new_path_node = smoothed_path->items[smoothed_path->size - 1];
-        int x0 = last_added_new_path_node % w;
-        int y0 = last_added_new_path_node / w;
-        int x1 = next_node % w;
-        int y1 = next_node / w;
+        get_neighbours(weights, w, h, cur.idx, large, nbrs, nbr_fits);
+
+        float cur_cost = costs[cur.idx];
+
+        for (int i = 0; i < 8; ++i)
+        {
+            if (nbr_fits[i])
+            {
+                float new_cost = cur_cost + weights[nbrs[i]] * nbr_step_costs[i];
+            
+                //Small threshold to not update when the difference is just due to floating point inaccuracy
+                if (new_cost + 0.03f < costs[nbrs[i]])
+                {
+                    float heuristic_cost = HUGE_VALF;
+                    for (int j = 0; j < goal_count; ++j)
+                    {
+                        float goal_heuristic = distance_heuristic(nbrs[i] % w, nbrs[i] / w, goals[j] % w, goals[j] / w, weight_baseline);
+                        heuristic_cost = min_float(heuristic_cost, goal_heuristic);
+                    }
+                    
+                    float estimated_cost = new_cost + heuristic_cost;
+                    Node new_node = { nbrs[i], estimated_cost, cur.path_length + 1};
+                    queue_push_or_update(nodes_to_visit, new_node);
+
+                    costs[nbrs[i]] = new_cost;
+                    paths[nbrs[i]] = cur.idx;
+                }    
+            }
+        }
+    }
+    
+    EndTemporaryAllocation(temp_alloc);
+
+    return path_length;
+}
+
+/*
+Run dijkstra outwards from the goal over the whole grid.
+costs gets the cost of the cheapest path from each node to the goal
+and directions the direction of the next step on that path.
+Moving between nodes costs the same as in run_pathfind, so following the
+directions gives the same costs as pathfinding to the goal.
+Returns 0 if the queue couldn't be allocated.
+*/
+static int run_dijkstra_field(MemoryArena *arena, float *weights, int w, int h, int goal, int large, float *costs, uint8_t *directions)
+{
+    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
+
+    PriorityQueue *nodes_to_visit = queue_create(arena, w*h);
+    if (!nodes_to_visit)
+    {
+        EndTemporaryAllocation(temp_alloc);
+        return 0;
+    }
+
+    for (int i = 0; i < w*h; ++i)
+    {
+        costs[i] = HUGE_VALF;
+        directions[i] = NO_DIRECTION;
+    }
+
+    costs[goal] = 0;
+
+    Node goal_node = { goal, 0.0f, 1 };
+    queue_push_or_update(nodes_to_visit, goal_node);
+
+    int nbrs[8];
+    int prev_nbrs[8];
+    uint8_t prev_nbr_fits[8];
+
+    while (nodes_to_visit->size > 0)
+    {
+        Node cur = queue_pop(nodes_to_visit);
+        float cur_cost = costs[cur.idx];
+
+        get_neighbour_indices(cur.idx, w, h, nbrs);
+
+        for (int i = 0; i < 8; ++i)
+        {
+            int prev = nbrs[i];
+            if (prev == -1 || weights[prev] >= HUGE_VALF) continue;
+
+            //Going from prev to cur is a step in the opposite direction
+            int direction = opposite_direction(i);
+            float new_cost = cur_cost + weights[cur.idx] * nbr_step_costs[direction];
+
+            if (new_cost < costs[prev])
+            {
+                get_neighbours(weights, w, h, prev, large, prev_nbrs, prev_nbr_fits);
+                if (!prev_nbr_fits[direction]) continue;
+
+                Node new_node = { prev, new_cost, cur.path_length + 1 };
+                queue_push_or_update(nodes_to_visit, new_node);
+
+                costs[prev] = new_cost;
+                directions[prev] = (uint8_t)direction;
+            }
+        }
+    }
+
+    EndTemporaryAllocation(temp_alloc);
+    return 1;
+}
+
+/*
+Run dijkstra outwards from start until every node within max_cost has been reached.
+The reached nodes are pushed to reached in order of their cost, which is left in the costs of the search buffers.
+Moving between nodes costs the same as in run_pathfind.
+Only the reached nodes and their neighbours are touched, so small budgets are cheap on big grids.
+*/
+static VecInt* run_reachable(MemoryArena *arena, SearchBuffers *search, float *weights, int w, int h, int start, int large,
+                             float max_cost)
+{
+    StartSearch(search);
+    PriorityQueue *nodes_to_visit = &search->queue;
+    float *costs = search->costs;
+
+    Node start_node = { start, 0.0f, 1 };
+    search_touch(search, start);
+    costs[start] = 0;
+
+    queue_push_or_update(nodes_to_visit, start_node);
+
+    VecInt *reached = InitVecInt(arena, 256);
+    if (!reached)
+    {
+        return NULL;
+    }
+
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+
+    while (nodes_to_visit->size > 0)
+    {
+        Node cur = queue_pop(nodes_to_visit);
+        reached = PushToVecInt(reached, cur.idx);
+        if (!reached)
+        {
+            return NULL;
+        }
+
+        get_neighbours(weights, w, h, cur.idx, large, nbrs, nbr_fits);
+
+        float cur_cost = costs[cur.idx];
+
+        for (int i = 0; i < 8; ++i)
+        {
+            if (nbr_fits[i])
+            {
+                float new_cost = cur_cost + weights[nbrs[i]] * nbr_step_costs[i];
+                search_touch(search, nbrs[i]);
+
+                if (new_cost <= max_cost && new_cost < costs[nbrs[i]])
+                {
+                    Node new_node = { nbrs[i], new_cost, cur.path_length + 1 };
+                    queue_push_or_update(nodes_to_visit, new_node);
+
+                    costs[nbrs[i]] = new_cost;
+                }
+            }
+        }
+    }
+
+    return reached;
+}
+
+/*
+State of an incremental D* Lite search. The search runs backwards from the goal,
+so g and rhs are the costs from each node to the goal and a moving start
+only needs the key modifier km to be updated.
+The planner keeps its own copy of the weights which is updated with the changed nodes.
+*/
+typedef struct DStarLite {
+    MemoryArena arena;
+    int w;
+    int h;
+    int large;
+    int start;
+    int goal;
+    float km;
+    float *weights;
+    float *g;
+    float *rhs;
+    PriorityQueue *queue;
+} DStarLite;
+
+/*
+Weights are at least 1, so the heuristic stays consistent even when the weights change.
+*/
+static inline float dstar_heuristic(DStarLite *planner, int a, int b)
+{
+    int w = planner->w;
+    return distance_heuristic(a % w, a / w, b % w, b / w, 1.0f);
+}
+
+static inline float dstar_key(DStarLite *planner, int idx)
+{
+    return min_float(planner->g[idx], planner->rhs[idx]) + dstar_heuristic(planner, planner->start, idx) + planner->km;
+}
+
+static void dstar_update_node(DStarLite *planner, int idx)
+{
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+
+    if (idx != planner->goal)
+    {
+        float rhs = HUGE_VALF;
+        //Blocked nodes can't be passed through, the start is the only one that can be in one
+        if (planner->weights[idx] < HUGE_VALF || idx == planner->start)
+        {
+            get_neighbours(planner->weights, planner->w, planner->h, idx, planner->large, nbrs, nbr_fits);
+            for (int i = 0; i < 8; ++i)
+            {
+                if (nbr_fits[i])
+                {
+                    rhs = min_float(rhs, planner->g[nbrs[i]] + planner->weights[nbrs[i]] * nbr_step_costs[i]);
+                }
+            }
+        }
+        planner->rhs[idx] = rhs;
+    }
+
+    if (planner->g[idx] != planner->rhs[idx])
+    {
+        Node node = { idx, dstar_key(planner, idx), 0 };
+        queue_push_or_update(planner->queue, node);
+    }
+    else
+    {
+        queue_remove(planner->queue, idx);
+    }
+}
+
+/*
+Update the nodes that can move to idx.
+*/
+static void dstar_update_predecessors(DStarLite *planner, int idx)
+{
+    int nbrs[8];
+    get_neighbour_indices(idx, planner->w, planner->h, nbrs);
+
+    for (int i = 0; i < 8; ++i)
+    {
+        if (nbrs[i] != -1)
+        {
+            dstar_update_node(planner, nbrs[i]);
+        }
+    }
+}
+
+/*
+Process the inconsistent nodes until the cost of the start is known.
+The queue only compares the first part of the D* Lite keys, so nodes with
+the same key as the start are processed too instead of breaking the tie.
+The same small threshold as in astar covers floating point inaccuracy in the keys.
+*/
+static void dstar_compute_path(DStarLite *planner)
+{
+    PriorityQueue *queue = planner->queue;
+    int start = planner->start;
+
+    while (queue->size > 0
+           && (queue->nodes[0].cost < dstar_key(planner, start) + 0.03f || planner->rhs[start] != planner->g[start]))
+    {
+        Node top = queue->nodes[0];
+        int idx = top.idx;
+        float new_key = dstar_key(planner, idx);
+
+        if (top.cost < new_key)
+        {
+            Node node = { idx, new_key, 0 };
+            queue_push_or_update(queue, node);
+        }
+        else if (planner->g[idx] > planner->rhs[idx])
+        {
+            planner->g[idx] = planner->rhs[idx];
+            queue_remove(queue, idx);
+            dstar_update_predecessors(planner, idx);
+        }
+        else
+        {
+            planner->g[idx] = HUGE_VALF;
+            dstar_update_node(planner, idx);
+            dstar_update_predecessors(planner, idx);
+        }
+    }
+}
+
+/*
+Follow the cheapest moves from the start to the goal.
+Returns NULL if the goal can't be reached or the arena ran out of memory.
+*/
+static VecInt* dstar_trace_path(DStarLite *planner)
+{
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+
+    if (planner->g[planner->start] >= HUGE_VALF && planner->start != planner->goal)
+    {
+        return NULL;
+    }
+
+    VecInt *path = InitVecInt(&planner->arena, 64);
+    if (!path)
+    {
+        return NULL;
+    }
+    int current_node = planner->start;
+    path = PushToVecInt(path, current_node);
+
+    for (int steps = 0; current_node != planner->goal; ++steps)
+    {
+        if (steps >= planner->w * planner->h)
+        {
+            return NULL;
+        }
+
+        get_neighbours(planner->weights, planner->w, planner->h, current_node, planner->large, nbrs, nbr_fits);
+
+        int next_node = -1;
+        float next_cost = HUGE_VALF;
+        for (int i = 0; i < 8; ++i)
+        {
+            if (nbr_fits[i])
+            {
+                float cost = planner->g[nbrs[i]] + planner->weights[nbrs[i]] * nbr_step_costs[i];
+                if (cost < next_cost)
+                {
+                    next_cost = cost;
+                    next_node = nbrs[i];
+                }
+            }
+        }
+
+        if (next_node == -1)
+        {
+            return NULL;
+        }
+
+        current_node = next_node;
+        path = PushToVecInt(path, current_node);
+        if (!path)
+        {
+            return NULL;
+        }
+    }
+
+    return path;
+}
+
+/*
+A portal is an extra edge from an entry cell to an exit cell with a fixed cost,
+like walking into a nydus network and coming out of another one.
+*/
+typedef struct Portal {
+    int entry;
+    int exit;
+    float cost;
+} Portal;
+
+/*
+Portals sorted by entry cell. first_portal has the position of the first portal
+leaving each cell or -1, so the portals of a node are found without scanning them all.
+min_cost_to_goal is the lowest cost of using a portal and then heading straight to the goal,
+which keeps the heuristic admissible when portals are shortcuts.
+*/
+typedef struct PortalTable {
+    Portal *portals;
+    int count;
+    int *first_portal;
+    float min_cost_to_goal;
+} PortalTable;
+
+static int compare_portal_entries(const void *a, const void *b)
+{
+    int entry_a = ((const Portal*)a)->entry;
+    int entry_b = ((const Portal*)b)->entry;
+    return (entry_a > entry_b) - (entry_a < entry_b);
+}
+
+/*
+Build the lookup table for count portals given as arrays of entry indices, exit indices and costs.
+Returns 0 if the arena ran out of memory.
+*/
+static int create_portal_table(MemoryArena *arena, PortalTable *table, int w, int h, int *entries, int *exits, float *costs,
+                               int count, int goal, float weight_baseline)
+{
+    table->count = count;
+    table->min_cost_to_goal = HUGE_VALF;
+    table->portals = (Portal*)PushToMemoryArena(arena, max_int(1, count)*sizeof(Portal));
+    table->first_portal = (int*)PushToMemoryArena(arena, w*h*sizeof(int));
+    if (!table->portals || !table->first_portal)
+    {
+        return 0;
+    }
+
+    for (int i = 0; i < count; ++i)
+    {
+        Portal portal = { entries[i], exits[i], costs[i] };
+        table->portals[i] = portal;
+
+        float cost_to_goal = portal.cost + distance_heuristic(portal.exit % w, portal.exit / w, goal % w, goal / w, weight_baseline);
+        if (cost_to_goal < table->min_cost_to_goal)
+        {
+            table->min_cost_to_goal = cost_to_goal;
+        }
+    }
+    qsort(table->portals, count, sizeof(Portal), compare_portal_entries);
+
+    memset(table->first_portal, 0xff, w*h*sizeof(int));
+    for (int i = count - 1; i >= 0; --i)
+    {
+        table->first_portal[table->portals[i].entry] = i;
+    }
+    return 1;
+}
+
+/*
+Run the astar algorithm with portal edges in addition to the grid.
+Cells that can't be walked on, like the nydus network itself, can still be reached through portals
+but they are only left through portals. The resulting path is saved in the paths of the search buffers.
+Returns the path length.
+*/
+static int run_pathfind_with_portals(SearchBuffers *search, float *weights, int w, int h, int start, int goal, int large,
+                                     const PortalTable *portals, float weight_baseline)
+{
+    int path_length = -1;
+
+    StartSearch(search);
+    PriorityQueue *nodes_to_visit = &search->queue;
+    float *costs = search->costs;
+    int *paths = search->paths;
+
+    Node start_node = { start, 0.0f, 1 };
+    search_touch(search, start);
+    costs[start] = 0;
+
+    queue_push_or_update(nodes_to_visit, start_node);
+
+    int nbrs[8];
+    uint8_t nbr_fits[8];
+
+    while (nodes_to_visit->size > 0)
+    {
+        Node cur = queue_pop(nodes_to_visit);
+        if (cur.idx == goal)
+        {
+            path_length = cur.path_length;
+            break;
+        }
+
+        float cur_cost = costs[cur.idx];
+
+        if (cur.idx == start || weights[cur.idx] < HUGE_VALF)
+        {
+            get_neighbours(weights, w, h, cur.idx, large, nbrs, nbr_fits);
+        }
+        else
+        {
+            memset(nbr_fits, 0, sizeof(nbr_fits));
+        }
+
+        for (int i = 0; i < 8; ++i)
+        {
+            if (nbr_fits[i])
+            {
+                float new_cost = cur_cost + weights[nbrs[i]] * nbr_step_costs[i];
+                search_touch(search, nbrs[i]);
+
+                //Small threshold to not update when the difference is just due to floating point inaccuracy
+                if (new_cost + 0.03f < costs[nbrs[i]])
+                {
+                    float heuristic_cost = distance_heuristic(nbrs[i] % w, nbrs[i] / w, goal % w, goal / w, weight_baseline);
+                    heuristic_cost = min_float(heuristic_cost, portals->min_cost_to_goal);
+
+                    Node new_node = { nbrs[i], new_cost + heuristic_cost, cur.path_length + 1};
+                    queue_push_or_update(nodes_to_visit, new_node);
+
+                    costs[nbrs[i]] = new_cost;
+                    paths[nbrs[i]] = cur.idx;
+                }
+            }
+        }
+
+        for (int i = portals->first_portal[cur.idx]; i >= 0 && i < portals->count && portals->portals[i].entry == cur.idx; ++i)
+        {
+            int exit = portals->portals[i].exit;
+            float new_cost = cur_cost + portals->portals[i].cost;
+            search_touch(search, exit);
+
+            if (new_cost + 0.03f < costs[exit])
+            {
+                float heuristic_cost = distance_heuristic(exit % w, exit / w, goal % w, goal / w, weight_baseline);
+                heuristic_cost = min_float(heuristic_cost, portals->min_cost_to_goal);
+
+                Node new_node = { exit, new_cost + heuristic_cost, cur.path_length + 1};
+                queue_push_or_update(nodes_to_visit, new_node);
+
+                costs[exit] = new_cost;
+                paths[exit] = cur.idx;
+            }
+        }
+    }
+
+    return path_length;
+}
+
+/*
+Check whether the path goes from node to next through a portal rather than walking.
+When a portal connects neighbouring cells, the cost saved for next tells which one the search used.
+*/
+static int is_portal_step(const PortalTable *portals, float *weights, float *costs, int w, int node, int next)
+{
+    float portal_cost = HUGE_VALF;
+    for (int i = portals->first_portal[node]; i >= 0 && i < portals->count && portals->portals[i].entry == node; ++i)
+    {
+        if (portals->portals[i].exit == next)
+        {
+            portal_cost = min_float(portal_cost, portals->portals[i].cost);
+        }
+    }
+    if (portal_cost == HUGE_VALF)
+    {
+        return 0;
+    }
+
+    int dx = abs(node % w - next % w);
+    int dy = abs(node / w - next / w);
+    if (dx > 1 || dy > 1 || weights[next] == HUGE_VALF || weights[node] == HUGE_VALF)
+    {
+        return 1;
+    }
+
+    float walk_cost = weights[next] * ((dx && dy) ? SQRT2 : 1.0f);
+    float step_cost = costs[next] - costs[node];
+    return fabsf(step_cost - portal_cost) < fabsf(step_cost - walk_cost);
+}
+
+/*
+Split a path found with portals into the parts that are walked.
+The step from the end of one segment to the start of the next is a portal.
+Returns the index where each segment starts followed by the length of the path,
+or NULL if the arena ran out of memory.
+*/
+static VecInt* portal_segment_starts(MemoryArena *arena, const PortalTable *portals, float *weights, float *costs, int w,
+                                     VecInt *complete_path)
+{
+    VecInt *segment_starts = InitVecInt(arena, 4);
+    if (!segment_starts)
+    {
+        return NULL;
+    }
+    segment_starts = PushToVecInt(segment_starts, 0);
+    for (int i = 0; i + 1 < complete_path->size; ++i)
+    {
+        if (is_portal_step(portals, weights, costs, w, complete_path->items[i], complete_path->items[i + 1]))
+        {
+            segment_starts = PushToVecInt(segment_starts, i + 1);
+            if (!segment_starts)
+            {
+                return NULL;
+            }
+        }
+    }
+    return PushToVecInt(segment_starts, complete_path->size);
+}
+
+/*
+Estimating a straight line weight over multiple nodes.
+Used in path smoothing where we remove nodes if we can jump
+ahead some nodes in a straight line with a lower cost.
+Returns -1 if the arena ran out of memory.
+*/
+static float calculate_line_weight(MemoryArena *arena, float* weights, int w, int x0, int y0, int x1, int y1)
+{
+    float flight_distance = euclidean_distance(x0, y0, x1, y1);
+    
+    TempAllocation temp_alloc = StartTemporaryAllocation(arena);
+
+    VecInt *line_coords = InitVecInt(arena, (int)flight_distance*2);
+    if (!line_coords)
+    {
+        EndTemporaryAllocation(temp_alloc);
+        return -1.0f;
+    }
+
+    int step_constant = 5;
+    float step_constant_inverse = (float) 1 / step_constant;
+
+    int dots = step_constant*(int)flight_distance;
+
+    float dir_vec[2] = { (x1 - x0) / flight_distance, (y1 - y0) / flight_distance };
+
+    for (int i = 0; i < dots; ++i)
+    {
+        int current_x = (int)(x0 + dir_vec[0]*i*step_constant_inverse);
+        int current_y = (int)(y0 + dir_vec[1]*i*step_constant_inverse);
+
+        int added_already = 0;
+        for (int j = 0; j < line_coords->size; ++j)
+        {
+            if (line_coords->items[j] == w*current_y + current_x)
+            {
+                added_already = 1;
+            }
+        }
+
+        if (!added_already)
+        {
+            line_coords = PushToVecInt(line_coords, w*current_y + current_x);
+            if (!line_coords)
+            {
+                EndTemporaryAllocation(temp_alloc);
+                return -1.0f;
+            }
+        }
+    }
+
+    float norm = 0.0f;
+    if (line_coords->size > 0)
+    {
+        norm = flight_distance / line_coords->size; 
+    }
+
+    float weight_sum = 0.0f;
+    for (int i = 0; i < line_coords->size; ++i)
+    {
+        weight_sum += weights[line_coords->items[i]];
+        if(weight_sum >= HUGE_VALF) break;
+    }
+
+    EndTemporaryAllocation(temp_alloc);
+
+    return weight_sum*norm;
+}
+
+/*
+Smooth the part of complete_path from start_index up to end_index.
+Returns NULL if the arena ran out of memory.
+*/
+static VecInt* create_smoothed_path(MemoryArena *arena, float *weights, VecInt *complete_path, int start_index, int end_index, int w)
+{
+    int path_length = end_index - start_index;
+    
+    int start = complete_path->items[start_index];
+    int goal = complete_path->items[end_index - 1];
+
+    //The smoothed path is never longer than the path, so only creating it can fail
+    VecInt *smoothed_path = InitVecInt(arena, path_length);
+    if (!smoothed_path)
+    {
+        return NULL;
+    }
+    smoothed_path = PushToVecInt(smoothed_path, start);
+    int current_node = goal;
+
+    float segment_total_weight = weights[goal] * distance_heuristic(goal % w, goal / w, current_node % w, current_node / w, 1.0f);
+    for (int i = 1; i < path_length - 1; ++i)
+    {
+        int current_node = complete_path->items[start_index + i];
+        int next_node = complete_path->items[start_index + i + 1];
+        float step_weight = weights[next_node] * distance_heuristic(current_node % w, current_node / w, next_node % w, next_node / w, 1.0f);
+        segment_total_weight += step_weight;
+
+        int last_added_new_path_node = smoothed_path->items[smoothed_path->size - 1];
+        int x0 = last_added_new_path_node % w;
+        int y0 = last_added_new_path_node / w;
+        int x1 = next_node % w;
+        int y1 = next_node / w;
+
+        float line_weight = calculate_line_weight(arena, weights, w, x0, y0, x1, y1);
+        if (line_weight < 0)
+        {
+            return NULL;
+        }
+        if (line_weight > segment_total_weight * 1.002f)
+        {
+            segment_total_weight = step_weight;
+            smoothed_path = PushToVecInt(smoothed_path, current_node);
+        }
+    }
+
+    smoothed_path = PushToVecInt(smoothed_path, goal);
+    
+    return smoothed_path;
+}
+
+/*
+Pathfinding calls get their own arena so they can run without the GIL.
+Room for the queue, costs and paths for every node on the grid,
+with some extra space for reconstructing and smoothing the path.
+*/
+static inline size_t pathfind_arena_size(int w, int h)
+{
+    size_t per_node = sizeof(Node) + 2*sizeof(int) + sizeof(float);
+    return 2*(size_t)w*h*per_node + 1024*1024;
+}
+
+/*
+Searches using search buffers only need the arena for reconstructing and smoothing the path.
+It grows if the path happens to be very long.
+*/
+#define PATH_ARENA_SIZE (256*1024)
+
+/*
+Trace the path back from goal to start and save it in a vector
+in the order from start to goal.
+Returns NULL if the arena ran out of memory.
+*/
+static VecInt* trace_path(MemoryArena *arena, int *paths, int goal, int path_length)
+{
+    VecInt *complete_path = InitVecInt(arena, path_length + 1);
+    if (!complete_path)
+    {
+        return NULL;
+    }
+    complete_path->size = path_length;
+    int current_node = goal;
+    for (int i = 0; i < path_length; ++i)
+    {
+        complete_path->items[path_length - 1 - i] = current_node;
+        current_node = paths[current_node];
+    }
+    return complete_path;
+}
+
+/*
+Keep every sensitivity-th node of the path the way the pather slices paths:
+the start is dropped and the goal is always kept. Does nothing if sensitivity is below 1.
+*/
+static void apply_sensitivity(VecInt *path, int sensitivity)
+{
+    if (sensitivity < 1 || path->size == 0)
+    {
+        return;
+    }
+
+    int goal = path->items[path->size - 1];
+    int kept = 0;
+    for (int i = sensitivity; i < path->size - 1; i += sensitivity)
+    {
+        path->items[kept++] = path->items[i];
+    }
+    path->items[kept++] = goal;
+    path->size = kept;
+}
+
+/*
+Convert node indices into a numpy array of (row, column) pairs.
+Needs the GIL.
+*/
+static PyObject* path_to_pyobject(int *nodes, int count, int w)
+{
+    npy_intp dims[2] = {count, 2};
+    PyArrayObject *path = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_INT32);
+    npy_int32 *path_data = (npy_int32*)path->data;
+
+    for (npy_intp i = 0; i < dims[0]; ++i)
+    {
+        path_data[2*i] = nodes[i] / w;
+        path_data[2*i + 1] = nodes[i] % w;
+    }
+    return PyArray_Return(path);
+}
+
+/*
+Run astar and reconstruct the path, smoothing it if requested.
+weight_baseline is the minimum weight in the grid, used for the heuristic.
+jps selects jump point search: 1 to always use it, 0 to never use it
+and -1 to use it when the grid is uniform. any_angle selects lazy theta* instead,
+which returns waypoints with straight lines between them. Large units always use plain astar.
+uniform says whether the grid has the same weight on every pathable node,
+-1 if the caller doesn't know, then the grid is scanned when jps or any_angle need it.
+With backward search buffers the search runs from both ends instead.
+Returns NULL if no path was found or the arena ran out of memory, which sets out_of_memory.
+Doesn't touch any python objects so it can be called without the GIL.
+*/
+static VecInt* find_path(MemoryArena *arena, SearchBuffers *search, float *weights, int w, int h, int start, int goal, int large, int smoothing, int jps,
+                         int uniform, int any_angle, float weight_baseline, SearchBuffers *backward)
+{
+    int path_length;
+
+    VecInt *line_path = straight_line_path(arena, weights, w, h, start, goal, large, weight_baseline);
+    if (line_path)
+    {
+        if ((smoothing || (!large && any_angle)) && line_path->size > 2)
+        {
+            //The line itself is the smoothed path, only the ends are needed
+            line_path->items[1] = goal;
+            line_path->size = 2;
+        }
+        return line_path;
+    }
+    if (arena->out_of_memory)
+    {
+        return NULL;
+    }
+
+    if (backward)
+    {
+        VecInt *result_path = run_pathfind_bidirectional(arena, search, backward, weights, w, h, start, goal, large, weight_baseline);
+        if (result_path && smoothing && result_path->size >= 3)
+        {
+            result_path = create_smoothed_path(arena, weights, result_path, 0, result_path->size, w);
+        }
+        return result_path;
+    }
+
+    if (!large && any_angle)
+    {
+        //The waypoints are already as straight as they can get, there's nothing to smooth
+        int lazy = (uniform == -1) ? is_uniform_grid(weights, w*h) : uniform;
+        path_length = run_pathfind_any_angle(search, weights, w, h, start, goal, lazy, weight_baseline);
+        return path_length < 0 ? NULL : trace_path(arena, search->paths, goal, path_length);
+    }
+    else if (!large && (jps == 1 || (jps == -1 && (uniform == -1 ? is_uniform_grid(weights, w*h) : uniform))))
+    {
+        path_length = run_pathfind_jps(search, weights, w, h, start, goal, weight_baseline);
+    }
+    else
+    {
+        path_length = run_pathfind(search, weights, w, h, start, goal, large, weight_baseline, NULL, NULL, NULL);
+    }
+
+    if (path_length < 0)
+    {
+        return NULL;
+    }
+
+    VecInt *result_path = trace_path(arena, search->paths, goal, path_length);
+
+    if (result_path && smoothing && path_length >= 3)
+    {
+        result_path = create_smoothed_path(arena, weights, result_path, 0, path_length, w);
+    }
+
+    return result_path;
+}
+
+/*
+Run astar with limits and reconstruct the path, smoothing it if requested.
+If a limit was hit, the path leads to the expanded node closest to the goal.
+The outcome of the search is saved in status.
+Returns NULL if no path was found or the arena ran out of memory, which sets out_of_memory.
+Doesn't touch any python objects so it can be called without the GIL.
+*/
+static VecInt* find_bounded_path(MemoryArena *arena, SearchBuffers *search, float *weights, int w, int h, int start, int goal, int large, int smoothing,
+                                 float weight_baseline, const SearchLimits *limits, int *status)
+{
+    int end_node;
+    int path_length = run_pathfind(search, weights, w, h, start, goal, large, weight_baseline, limits, &end_node, status);
+
+    if (path_length < 0)
+    {
+        return NULL;
+    }
+
+    VecInt *result_path = trace_path(arena, search->paths, end_node, path_length);
+
+    if (result_path && smoothing && path_length >= 3)
+    {
+        result_path = create_smoothed_path(arena, weights, result_path, 0, path_length, w);
+    }
+
+    return result_path;
+}
+
+/*
+Exported function to run astar from python.
+Takes in grid weights, dimensions of the grid, requested start and end,
+whether to smooth the final path, whether to use jump point search
+(1 always, 0 never, -1 when the grid is uniform), the minimum weight of the grid
+if the caller already knows it, whether to search for an any-angle path
+and whether to search from both ends. A sensitivity of 1 or more slices the path like the pather does.
+The last argument says whether the grid is uniform if the caller already knows it, -1 otherwise.
+The weights can be any C-contiguous float32 buffer and aren't copied.
+The search itself runs with the GIL released, so the weights shouldn't
+be modified from another thread during the call.
+*/
+static PyObject* astar(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    int h, w, start, goal, large, smoothing;
+    int jps = -1;
+    float min_weight = 0;
+    int any_angle = 0;
+    int bidirectional = 0;
+    int sensitivity = 0;
+    int uniform = -1;
+    
+    if (!PyArg_ParseTuple(args, "Oiiiiii|ifiiii", &weights_object, &h, &w, &start, &goal, &large, &smoothing, &jps, &min_weight,
+                          &any_angle, &bidirectional, &sensitivity, &uniform))
+    {
+        return NULL;
+    }
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+
+    MemoryArena arena;
+    SearchBuffers *search = AcquireSearchBuffers(w*h);
+    SearchBuffers *backward = (search && bidirectional) ? AcquireSearchBuffers(w*h) : NULL;
+    if (!search || (bidirectional && !backward) || !CreateMemoryArena(&arena, PATH_ARENA_SIZE))
+    {
+        if (search)
+        {
+            ReleaseSearchBuffers(search);
+        }
+        if (backward)
+        {
+            ReleaseSearchBuffers(backward);
+        }
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    VecInt *result_path;
+
+    Py_BEGIN_ALLOW_THREADS
+    float weight_baseline = weight_baseline_or_min(weights, w*h, min_weight);
+    result_path = find_path(&arena, search, weights, w, h, start, goal, large, smoothing, jps, uniform, any_angle,
+                            weight_baseline, backward);
+    if (result_path)
+    {
+        apply_sensitivity(result_path, sensitivity);
+    }
+    Py_END_ALLOW_THREADS
+    
+    PyObject *return_val;
+    if (result_path)
+    {
+        return_val = path_to_pyobject(result_path->items, result_path->size, w);
+    }
+    else if (arena.out_of_memory)
+    {
+        return_val = PyErr_NoMemory();
+    }
+    else
+    {
+        return_val = Py_BuildValue("");
+    }
+
+    FreeMemoryArena(&arena);
+    ReleaseSearchBuffers(search);
+    if (backward)
+    {
+        ReleaseSearchBuffers(backward);
+    }
+    PyBuffer_Release(&weights_view);
+
+    return return_val;
+}
+
+
+/*
+Exported function to run astar with limits from python.
+Takes in grid weights, dimensions of the grid, requested start and end, whether to smooth the final path,
+the minimum weight of the grid (anything below 1 if unknown), the maximum number of expanded nodes (0 for no limit),
+the maximum cost and the maximum distance from the start (negative for no limit),
+and optionally the sensitivity to slice the path with.
+Returns a tuple of the path or None and the outcome of the search.
+When a limit is hit, the path leads to the expanded node that is closest to the goal.
+*/
+static PyObject* astar_bounded(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    int h, w, start, goal, large, smoothing, max_expansions;
+    float min_weight, max_cost, max_distance;
+    int sensitivity = 0;
+
+    if (!PyArg_ParseTuple(args, "Oiiiiiififf|i", &weights_object, &h, &w, &start, &goal, &large, &smoothing, &min_weight,
+                          &max_expansions, &max_cost, &max_distance, &sensitivity))
+    {
+        return NULL;
+    }
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+
+    MemoryArena arena;
+    SearchBuffers *search = AcquireSearchBuffers(w*h);
+    if (!search || !CreateMemoryArena(&arena, PATH_ARENA_SIZE))
+    {
+        if (search)
+        {
+            ReleaseSearchBuffers(search);
+        }
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    SearchLimits limits = { max_int(max_expansions, 0),
+                            max_cost < 0 ? HUGE_VALF : max_cost,
+                            max_distance < 0 ? HUGE_VALF : max_distance };
+    int status = SEARCH_UNREACHABLE;
+    VecInt *result_path;
+
+    Py_BEGIN_ALLOW_THREADS
+    float weight_baseline = weight_baseline_or_min(weights, w*h, min_weight);
+    result_path = find_bounded_path(&arena, search, weights, w, h, start, goal, large, smoothing, weight_baseline, &limits, &status);
+    if (result_path)
+    {
+        apply_sensitivity(result_path, sensitivity);
+    }
+    Py_END_ALLOW_THREADS
+
+    PyObject *return_val;
+    if (result_path)
+    {
+        return_val = Py_BuildValue("(Ni)", path_to_pyobject(result_path->items, result_path->size, w), status);
+    }
+    else if (arena.out_of_memory)
+    {
+        return_val = PyErr_NoMemory();
+    }
+    else
+    {
+        return_val = Py_BuildValue("(Oi)", Py_None, status);
+    }
+
+    FreeMemoryArena(&arena);
+    ReleaseSearchBuffers(search);
+    PyBuffer_Release(&weights_view);
+
+    return return_val;
+}
+
+
+/*
+Exported function to run astar for multiple start and goal pairs on the same grid.
+Takes in grid weights, dimensions of the grid, arrays of start and goal indices,
+whether to smooth the final paths, whether to use jump point search
+and optionally the minimum weight of the grid.
+Returns a list with a path or None for each pair.
+The same arena and search buffers are reused for every search and the GIL is released for each search.
+*/
+static PyObject* astar_many(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    PyArrayObject* starts_object;
+    PyArrayObject* goals_object;
+    int h, w, large, smoothing;
+    int jps = -1;
+    float min_weight = 0;
+
+    if (!PyArg_ParseTuple(args, "OiiOOii|if", &weights_object, &h, &w, &starts_object, &goals_object, &large, &smoothing, &jps, &min_weight))
+    {
+        return NULL;
+    }
+
+    int query_count = (int)starts_object->dimensions[0];
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+    int *starts = (int*)starts_object->data;
+    int *goals = (int*)goals_object->data;
+
+    //Check the grid once instead of for every search
+    int use_jps = (jps == -1) ? is_uniform_grid(weights, w*h) : jps;
+    float weight_baseline = weight_baseline_or_min(weights, w*h, min_weight);
+
+    MemoryArena arena;
+    SearchBuffers *search = AcquireSearchBuffers(w*h);
+    if (!search || !CreateMemoryArena(&arena, PATH_ARENA_SIZE))
+    {
+        if (search)
+        {
+            ReleaseSearchBuffers(search);
+        }
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    PyObject *return_val = PyList_New(query_count);
+
+    for (int i = 0; i < query_count; ++i)
+    {
+        TempAllocation temp_alloc = StartTemporaryAllocation(&arena);
+        VecInt *result_path;
+
+        Py_BEGIN_ALLOW_THREADS
+        result_path = find_path(&arena, search, weights, w, h, starts[i], goals[i], large, smoothing, use_jps, -1, 0,
+                                weight_baseline, NULL);
+        Py_END_ALLOW_THREADS
+
+        if (result_path)
+        {
+            PyList_SetItem(return_val, i, path_to_pyobject(result_path->items, result_path->size, w));
+        }
+        else if (arena.out_of_memory)
+        {
+            Py_DECREF(return_val);
+            return_val = PyErr_NoMemory();
+            break;
+        }
+        else
+        {
+            PyList_SetItem(return_val, i, Py_BuildValue(""));
+        }
+
+        EndTemporaryAllocation(temp_alloc);
+    }
+
+    FreeMemoryArena(&arena);
+    ReleaseSearchBuffers(search);
+    PyBuffer_Release(&weights_view);
+
+    return return_val;
+}
+
+
+/*
+Exported function to run astar from a start to the closest of multiple goals.
+Takes in grid weights, dimensions of the grid, start index, an array of goal indices,
+whether to smooth the final path and optionally the minimum weight of the grid.
+Returns a tuple of (index of the reached goal in the goal array, path, cost of the path) or None.
+*/
+static PyObject* astar_nearest(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    PyArrayObject* goals_object;
+    int h, w, start, large, smoothing;
+    float min_weight = 0;
+
+    if (!PyArg_ParseTuple(args, "OiiiOii|f", &weights_object, &h, &w, &start, &goals_object, &large, &smoothing, &min_weight))
+    {
+        return NULL;
+    }
+
+    int goal_count = (int)goals_object->dimensions[0];
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+    int *goals = (int*)goals_object->data;
+
+    MemoryArena arena;
+    if (!CreateMemoryArena(&arena, pathfind_arena_size(w, h)))
+    {
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    int *paths = (int*) PushToMemoryArena(&arena, w*h*sizeof(int));
+    if (!paths)
+    {
+        FreeMemoryArena(&arena);
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+    int reached_goal = -1;
+    float path_cost = 0;
+    VecInt *result_path = NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    float weight_baseline = weight_baseline_or_min(weights, w*h, min_weight);
+    int path_length = run_pathfind_multi_goal(&arena, weights, paths, w, h, start, goals, goal_count, large, weight_baseline,
+                                              &reached_goal, &path_cost);
+
+    if (path_length >= 0)
+    {
+        result_path = trace_path(&arena, paths, reached_goal, path_length);
+
+        if (result_path && smoothing && path_length >= 3)
+        {
+            result_path = create_smoothed_path(&arena, weights, result_path, 0, path_length, w);
+        }
+    }
+    Py_END_ALLOW_THREADS
+
+    PyObject *return_val;
+    if (result_path)
+    {
+        int goal_index = 0;
+        while (goals[goal_index] != reached_goal)
+        {
+            ++goal_index;
+        }
+
+        return_val = Py_BuildValue("(iNf)", goal_index, path_to_pyobject(result_path->items, result_path->size, w), path_cost);
+    }
+    else if (arena.out_of_memory)
+    {
+        return_val = PyErr_NoMemory();
+    }
+    else
+    {
+        return_val = Py_BuildValue("");
+    }
+
+    FreeMemoryArena(&arena);
+    PyBuffer_Release(&weights_view);
+
+    return return_val;
+}
+
+
+/*
+Exported function to calculate a flow field towards a goal.
+Takes in grid weights, dimensions of the grid, the goal index and whether the unit is large.
+Returns a tuple of a float32 array with the cost to the goal from each point
+and a uint8 array with the direction of the next step (NO_DIRECTION for the goal and unreachable points).
+*/
+static PyObject* dijkstra_field(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    int h, w, goal, large;
+
+    if (!PyArg_ParseTuple(args, "Oiiii", &weights_object, &h, &w, &goal, &large))
+    {
+        return NULL;
+    }
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+
+    MemoryArena arena;
+    if (!CreateMemoryArena(&arena, pathfind_arena_size(w, h)))
+    {
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    npy_intp dims[2] = {h, w};
+    PyArrayObject *costs_object = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_FLOAT32);
+    PyArrayObject *directions_object = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_UINT8);
+    float *costs = (float*)costs_object->data;
+    uint8_t *directions = (uint8_t*)directions_object->data;
+
+    int found;
+
+    Py_BEGIN_ALLOW_THREADS
+    found = run_dijkstra_field(&arena, weights, w, h, goal, large, costs, directions);
+    Py_END_ALLOW_THREADS
+
+    FreeMemoryArena(&arena);
+    PyBuffer_Release(&weights_view);
+
+    if (!found)
+    {
+        Py_DECREF(costs_object);
+        Py_DECREF(directions_object);
+        return PyErr_NoMemory();
+    }
+
+    PyObject *return_tuple = PyTuple_New(2);
+    PyTuple_SetItem(return_tuple, 0, PyArray_Return(costs_object));
+    PyTuple_SetItem(return_tuple, 1, PyArray_Return(directions_object));
+
+    return return_tuple;
+}
+
+/*
+Exported function to find every node reachable from start within a cost budget.
+Takes in grid weights, dimensions of the grid, start index, the budget and whether the unit is large.
+Returns a tuple of an (N, 2) array with the reached nodes, cheapest first, and an array with their costs.
+*/
+static PyObject* reachable(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    int h, w, start, large;
+    float max_cost;
+
+    if (!PyArg_ParseTuple(args, "Oiiifi", &weights_object, &h, &w, &start, &max_cost, &large))
+    {
+        return NULL;
+    }
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+
+    MemoryArena arena;
+    SearchBuffers *search = AcquireSearchBuffers(w*h);
+    if (!search || !CreateMemoryArena(&arena, PATH_ARENA_SIZE))
+    {
+        if (search)
+        {
+            ReleaseSearchBuffers(search);
+        }
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    VecInt *reached;
+
+    Py_BEGIN_ALLOW_THREADS
+    reached = run_reachable(&arena, search, weights, w, h, start, large, max_cost);
+    Py_END_ALLOW_THREADS
+
+    if (!reached)
+    {
+        FreeMemoryArena(&arena);
+        ReleaseSearchBuffers(search);
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    npy_intp dims[1] = {reached->size};
+    PyArrayObject *costs_object = (PyArrayObject*) PyArray_SimpleNew(1, dims, NPY_FLOAT32);
+    float *costs = (float*)costs_object->data;
+    for (int i = 0; i < reached->size; ++i)
+    {
+        costs[i] = search->costs[reached->items[i]];
+    }
+
+    PyObject *return_tuple = PyTuple_New(2);
+    PyTuple_SetItem(return_tuple, 0, path_to_pyobject(reached->items, reached->size, w));
+    PyTuple_SetItem(return_tuple, 1, PyArray_Return(costs_object));
+
+    FreeMemoryArena(&arena);
+    ReleaseSearchBuffers(search);
+    PyBuffer_Release(&weights_view);
+
+    return return_tuple;
+}
+
+
+#define DSTAR_LITE_CAPSULE "mapanalyzerext.DStarLite"
+
+static void dstar_lite_destroy(PyObject *capsule)
+{
+    DStarLite *planner = (DStarLite*) PyCapsule_GetPointer(capsule, DSTAR_LITE_CAPSULE);
+    if (planner)
+    {
+        FreeMemoryArena(&planner->arena);
+        free(planner);
+    }
+}
+
+/*
+Exported function to create an incremental D* Lite planner.
+Takes in grid weights, dimensions of the grid, start and goal indices and whether the unit is large.
+The weights are copied, so the grid can be modified after this call.
+Returns a capsule that is passed to the other dstar_lite functions.
+*/
+static PyObject* dstar_lite_create(PyObject *self, PyObject *args)
+{
+    PyObject* weights_object;
+    int h, w, start, goal, large;
+
+    if (!PyArg_ParseTuple(args, "Oiiiii", &weights_object, &h, &w, &start, &goal, &large))
+    {
+        return NULL;
+    }
+
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+
+    DStarLite *planner = (DStarLite*) malloc(sizeof(DStarLite));
+    size_t per_node = 3*sizeof(float) + sizeof(Node) + sizeof(int);
+    if (!planner || !CreateMemoryArena(&planner->arena, (size_t)w*h*per_node + 1024*1024))
+    {
+        free(planner);
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
+
+    planner->w = w;
+    planner->h = h;
+    planner->large = large;
+    planner->start = start;
+    planner->goal = goal;
+    planner->km = 0;
+    planner->weights = (float*) PushToMemoryArena(&planner->arena, w*h*sizeof(float));
+    planner->g = (float*) PushToMemoryArena(&planner->arena, w*h*sizeof(float));
+    planner->rhs = (float*) PushToMemoryArena(&planner->arena, w*h*sizeof(float));
+    planner->queue = queue_create(&planner->arena, w*h);
+    if (!planner->weights || !planner->g || !planner->rhs || !planner->queue)
+    {
+        FreeMemoryArena(&planner->arena);
+        free(planner);
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
+    }
 
-        if (calculate_line_weight(arena, weights, w, x0, y0, x1, y1) > segment_total_weight * 1.002f)
-        {
-            segment_total_weight = step_weight;
-            smoothed_path = PushToVecInt(smoothed_path, current_node);
-        }
+    memcpy(planner->weights, weights, w*h*sizeof(float));
+    PyBuffer_Release(&weights_view);
+    for (int i = 0; i < w*h; ++i)
+    {
+        planner->g[i] = HUGE_VALF;
+        planner->rhs[i] = HUGE_VALF;
     }
 
-    smoothed_path = PushToVecInt(smoothed_path, goal);
-    
-    return smoothed_path;
+    planner->rhs[goal] = 0;
+    Node goal_node = { goal, dstar_key(planner, goal), 0 };
+    queue_push_or_update(planner->queue, goal_node);
+
+    return PyCapsule_New(planner, DSTAR_LITE_CAPSULE, dstar_lite_destroy);
 }
 
 /*
-Exported function to run astar from python.
-Takes in grid weights, dimensions of the grid, requested start and end
-and whether to smooth the final path.
+Exported function to change weights of a D* Lite planner.
+Takes in the planner, an array of node indices and an array of their new weights.
 */
-static PyObject* astar(PyObject *self, PyObject *args)
+static PyObject* dstar_lite_update(PyObject *self, PyObject *args)
 {
+    PyObject *capsule;
+    PyArrayObject* indices_object;
     PyArrayObject* weights_object;
-    int h, w, start, goal, large, smoothing;
-    
-    
-    if (!PyArg_ParseTuple(args, "Oiiiiii", &weights_object, &h, &w, &start, &goal, &large, &smoothing))
+
+    if (!PyArg_ParseTuple(args, "OOO", &capsule, &indices_object, &weights_object))
     {
         return NULL;
     }
 
-    float *weights = (float *)weights_object->data;
-    int *paths = (int*) PushToMemoryArena(&state.function_arena, w*h*sizeof(int));
+    DStarLite *planner = (DStarLite*) PyCapsule_GetPointer(capsule, DSTAR_LITE_CAPSULE);
+    if (!planner)
+    {
+        return NULL;
+    }
 
-    int path_length = run_pathfind(&state.function_arena, weights, paths, w, h, start, goal, large);
-    
-    PyObject *return_val;
-    if (path_length >= 0)
+    int count = (int)indices_object->dimensions[0];
+    int *indices = (int*)indices_object->data;
+    float *new_weights = (float*)weights_object->data;
+
+    for (int i = 0; i < count; ++i)
     {
-        if (!smoothing || path_length < 3)
-        {
-            npy_intp dims[2] = {path_length, 2};
-            PyArrayObject *path = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_INT32);
-            npy_int32 *path_data = (npy_int32*)path->data;
+        planner->weights[indices[i]] = new_weights[i];
+    }
 
-            int idx = goal;
+    //The moves that can change are the ones starting next to a changed node
+    for (int i = 0; i < count; ++i)
+    {
+        dstar_update_node(planner, indices[i]);
+        dstar_update_predecessors(planner, indices[i]);
+    }
 
-            for (npy_intp i = dims[0] - 1; i >= 0; --i)
-            {
-                path_data[2*i] = idx / w;
-                path_data[2*i + 1] = idx % w;
+    Py_RETURN_NONE;
+}
 
-                idx = paths[idx];
-            }
-            return_val = PyArray_Return(path);
-        }
-        else
-        {
-            VecInt *complete_path = InitVecInt(&state.function_arena, path_length);
-            complete_path->size = path_length;
-            int current_node = goal;
-            for (int i = 0; i < path_length; ++i)
-            {
-                complete_path->items[path_length - 1 - i] = current_node;
-                current_node = paths[current_node];
-            }
+/*
+Exported function to find the current path of a D* Lite planner.
+Takes in the planner and the index of the current start, which can move
+between calls. Only the part of the search affected by the changes since
+the last call is repeated.
+Returns the path as an array of (row, column) pairs or None if the goal can't be reached.
+*/
+static PyObject* dstar_lite_path(PyObject *self, PyObject *args)
+{
+    PyObject *capsule;
+    int start;
 
-            VecInt *smoothed_path = create_smoothed_path(&state.function_arena, weights, complete_path, 0, path_length, w);
+    if (!PyArg_ParseTuple(args, "Oi", &capsule, &start))
+    {
+        return NULL;
+    }
 
-            npy_intp dims[2] = {smoothed_path->size, 2};
-            PyArrayObject *path = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_INT32);
-            npy_int32 *path_data = (npy_int32*)path->data;
+    DStarLite *planner = (DStarLite*) PyCapsule_GetPointer(capsule, DSTAR_LITE_CAPSULE);
+    if (!planner)
+    {
+        return NULL;
+    }
 
-            for (npy_intp i = 0; i < dims[0]; ++i)
-            {
-                path_data[2*i] = smoothed_path->items[i] / w;
-                path_data[2*i + 1] = smoothed_path->items[i] % w;
-            }
-            return_val = PyArray_Return(path);
-        }
+    if (start != planner->start)
+    {
+        planner->km += dstar_heuristic(planner, planner->start, start);
+        planner->start = start;
+    }
+
+    dstar_compute_path(planner);
+
+    //The planner outlives a failed call, so the next one can try again
+    planner->arena.out_of_memory = 0;
+    TempAllocation temp_alloc = StartTemporaryAllocation(&planner->arena);
+    VecInt *path = dstar_trace_path(planner);
+
+    PyObject *return_val;
+    if (path)
+    {
+        return_val = path_to_pyobject(path->items, path->size, planner->w);
+    }
+    else if (planner->arena.out_of_memory)
+    {
+        return_val = PyErr_NoMemory();
     }
     else
     {
         return_val = Py_BuildValue("");
     }
 
-    ClearMemoryArena(&state.function_arena);
-    ClearMemoryArena(&state.temp_arena);
+    EndTemporaryAllocation(temp_alloc);
 
     return return_val;
 }
 
-
 /*
-Exported function to run astar with nyduses from python.
-Takes in grid weights, dimensions of the grid, array with nydus positions as integer indices, requested start and end
-and whether to smooth the final path.
+Exported function to run astar with portal edges from python.
+Takes in grid weights, dimensions of the grid, arrays with the entry and exit indices and costs of the portals,
+requested start and end, whether to smooth the final path and optionally the minimum weight of the grid.
+Returns a list of path segments split where the path goes through a portal, or None if there is no path.
+Like astar, the search runs with the GIL released.
 */
-static PyObject* astar_with_nydus(PyObject *self, PyObject *args)
+static PyObject* astar_with_portals(PyObject *self, PyObject *args)
 {
-    PyArrayObject* weights_object;
-    PyArrayObject* nydus_object;
-    int h, w, start, goal, large, smoothing, nydus_count;
-    
-    if (!PyArg_ParseTuple(args, "OiiOiiii", &weights_object, &h, &w, &nydus_object, &start, &goal, &large, &smoothing))
+    PyObject* weights_object;
+    PyArrayObject* entries_object;
+    PyArrayObject* exits_object;
+    PyArrayObject* costs_object;
+    int h, w, start, goal, large, smoothing;
+    float min_weight = 0;
+
+    if (!PyArg_ParseTuple(args, "OiiOOOiiii|f", &weights_object, &h, &w, &entries_object, &exits_object, &costs_object,
+                          &start, &goal, &large, &smoothing, &min_weight))
     {
         return NULL;
     }
 
-    nydus_count = (int)nydus_object->dimensions[0];
+    int portal_count = (int)entries_object->dimensions[0];
 
-    float *weights = (float *)weights_object->data;
-    int *paths = (int*) PushToMemoryArena(&state.function_arena, w*h*sizeof(int));
-    int *nydus_positions = (int*)nydus_object->data;
-    int path_length;
+    Py_buffer weights_view;
+    float *weights = get_weights_buffer(weights_object, h, w, &weights_view);
+    if (!weights)
+    {
+        return NULL;
+    }
+    int *entries = (int*)entries_object->data;
+    int *exits = (int*)exits_object->data;
+    float *portal_costs = (float*)costs_object->data;
 
-    if (nydus_count > 1)
+    MemoryArena arena;
+    SearchBuffers *search = AcquireSearchBuffers(w*h);
+    if (!search || !CreateMemoryArena(&arena, PATH_ARENA_SIZE))
     {
-        path_length = run_pathfind_with_nydus(&state.function_arena, weights, paths, w, h, start, goal, large, nydus_positions, nydus_count);
+        if (search)
+        {
+            ReleaseSearchBuffers(search);
+        }
+        PyBuffer_Release(&weights_view);
+        return PyErr_NoMemory();
     }
-    else
+
+    PortalTable portals;
+    int path_length = -1;
+    int segment_count = 0;
+    VecInt *complete_path = NULL;
+    VecInt *segment_starts = NULL;
+    VecInt **segments = NULL;
+
+    Py_BEGIN_ALLOW_THREADS
+    float weight_baseline = weight_baseline_or_min(weights, w*h, min_weight);
+    if (create_portal_table(&arena, &portals, w, h, entries, exits, portal_costs, portal_count, goal, weight_baseline))
     {
-        path_length = run_pathfind(&state.function_arena, weights, paths, w, h, start, goal, large);
+        path_length = run_pathfind_with_portals(search, weights, w, h, start, goal, large, &portals, weight_baseline);
     }
-    
-    PyObject *return_val;
+
     if (path_length >= 0)
     {
-        int current_index = goal;
-        int nydus_index = -1;
-        int nyduses_used = 0;
-
-        VecInt *complete_path = InitVecInt(&state.function_arena, path_length + 1);
-        complete_path->size = path_length;
-        
-        for (int i = path_length - 1; i >= 0; --i)
+        complete_path = trace_path(&arena, search->paths, goal, path_length);
+        segment_starts = complete_path ? portal_segment_starts(&arena, &portals, weights, search->costs, w, complete_path) : NULL;
+        if (segment_starts)
         {
-            for (int j = 0; j < nydus_count; ++j)
-            {
-                if (nydus_positions[j] == current_index)
-                {
-                    nydus_index = i;
-                    nyduses_used++;
-                }
-            }
-            complete_path->items[i] = current_index;
-            current_index = paths[current_index];
-        }
-
-        //If we got into a nydus and got out on the other side,
-        //let's add the same nydus node to the path a second time
-        //so it gets handled properly later
-        if (nyduses_used == 1)
-        {
-            complete_path->size++;
-
-            for(int i = path_length; i > nydus_index; --i)
-            {
-                complete_path->items[i] = complete_path->items[i - 1];
-            }
-            path_length++;
+            segment_count = segment_starts->size - 1;
+            segments = (VecInt**)PushToMemoryArena(&arena, segment_count*sizeof(VecInt*));
         }
 
-        if (nydus_index == -1)
+        for (int i = 0; segments && i < segment_count; ++i)
         {
-            return_val = PyList_New(1);
-            if (!smoothing || path_length < 3)
-            {
-                npy_intp dims[2] = {path_length, 2};
-                PyArrayObject *path = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_INT32);
-                npy_int32 *path_data = (npy_int32*)path->data;
-
-                int idx = goal;
-
-                for (npy_intp i = dims[0] - 1; i >= 0; --i)
-                {
-                    path_data[2*i] = idx / w;
-                    path_data[2*i + 1] = idx % w;
-
-                    idx = paths[idx];
-                }
-                PyList_SetItem(return_val, 0, PyArray_Return(path));
-            }
-            else
+            int segment_start = segment_starts->items[i];
+            int segment_end = segment_starts->items[i + 1];
+            segments[i] = NULL;
+            if (smoothing && segment_end - segment_start >= 3)
             {
-                VecInt *smoothed_path = create_smoothed_path(&state.function_arena, weights, complete_path, 0, path_length, w);
-
-                npy_intp dims[2] = {smoothed_path->size, 2};
-                PyArrayObject *path = (PyArrayObject*) PyArray_SimpleNew(2, dims, NPY_INT32);
-                npy_int32 *path_data = (npy_int32*)path->data;
-
-                for (npy_intp i = 0; i < dims[0]; ++i)
+                segments[i] = create_smoothed_path(&arena, weights, complete_path, segment_start, segment_end, w);
+                if (!segments[i])
                 {
-                    path_data[2*i] = smoothed_path->items[i] / w;
-                    path_data[2*i + 1] = smoothed_path->items[i] % w;
+                    segments = NULL;
                 }
-                PyList_SetItem(return_val, 0, PyArray_Return(path));
             }
         }
-        else
+    }
+    Py_END_ALLOW_THREADS
+
+    PyObject *return_val;
+    if (arena.out_of_memory)
+    {
+        return_val = PyErr_NoMemory();
+    }
+    else if (path_length >= 0)
+    {
+        return_val = PyList_New(segment_count);
+        for (int i = 0; i < segment_count; ++i)
         {
-            return_val = PyList_New(2);
-            
-            if (!smoothing)
+            if (segments[i])
             {
-                npy_intp dims1[2] = {nydus_index + 1, 2};
-                PyArrayObject *path1 = (PyArrayObject*) PyArray_SimpleNew(2, dims1, NPY_INT32);
-                npy_int32 *path1_data = (npy_int32*)path1->data;
-
-                for (int i = 0; i <= nydus_index; ++i)
-                {
-                    path1_data[2*i] = complete_path->items[i] / w;
-                    path1_data[2*i + 1] = complete_path->items[i] % w;
-                }
-                PyList_SetItem(return_val, 0, PyArray_Return(path1));
-
-                npy_intp dims2[2] = {path_length - (nydus_index + 1), 2};
-                PyArrayObject *path2 = (PyArrayObject*) PyArray_SimpleNew(2, dims2, NPY_INT32);
-                npy_int32 *path2_data = (npy_int32*)path2->data;
-
-                for (int i = nydus_index + 1; i < path_length; ++i)
-                {
-                    int index_to_set = i - (nydus_index + 1);
-                    path2_data[2*index_to_set] = complete_path->items[i] / w;
-                    path2_data[2*index_to_set + 1] = complete_path->items[i] % w;
-                }
-                PyList_SetItem(return_val, 1, PyArray_Return(path2));
+                PyList_SetItem(return_val, i, path_to_pyobject(segments[i]->items, segments[i]->size, w));
             }
             else
             {
-                VecInt *smoothed_path1 = create_smoothed_path(&state.function_arena, weights, complete_path, 0, nydus_index + 1, w);
-
-                npy_intp dims1[2] = {smoothed_path1->size, 2};
-                PyArrayObject *path1 = (PyArrayObject*) PyArray_SimpleNew(2, dims1, NPY_INT32);
-                npy_int32 *path1_data = (npy_int32*)path1->data;
-
-                for (npy_intp i = 0; i < dims1[0]; ++i)
-                {
-                    path1_data[2*i] = smoothed_path1->items[i] / w;
-                    path1_data[2*i + 1] = smoothed_path1->items[i] % w;
-                }
-                PyList_SetItem(return_val, 0, PyArray_Return(path1));
-
-                VecInt *smoothed_path2 = create_smoothed_path(&state.function_arena, weights, complete_path, nydus_index + 1, path_length, w);
-
-                npy_intp dims2[2] = {smoothed_path2->size, 2};
-                PyArrayObject *path2 = (PyArrayObject*) PyArray_SimpleNew(2, dims2, NPY_INT32);
-                npy_int32 *path2_data = (npy_int32*)path2->data;
-
-                for (npy_intp i = 0; i < dims2[0]; ++i)
-                {
-                    path2_data[2*i] = smoothed_path2->items[i] / w;
-                    path2_data[2*i + 1] = smoothed_path2->items[i] % w;
-                }
-                PyList_SetItem(return_val, 1, PyArray_Return(path2));
+                int segment_start = segment_starts->items[i];
+                PyList_SetItem(return_val, i, path_to_pyobject(complete_path->items + segment_start,
+                                                               segment_starts->items[i + 1] - segment_start, w));
             }
         }
-    }     
+    }
     else
     {
         return_val = Py_BuildValue("");
     }
 
-    ClearMemoryArena(&state.function_arena);
-    ClearMemoryArena(&state.temp_arena);
+    FreeMemoryArena(&arena);
+    ReleaseSearchBuffers(search);
+    PyBuffer_Release(&weights_view);
 
     return return_val;
 }
@@ -1419,9 +3639,18 @@ typedef struct KeyContainer
     VecInt *keys;
 } KeyContainer;
 
+/*
+Fill the area of target_height around x, y and mark or unmark it as an overlord spot.
+The filled points are added to current_set.
+Returns 1 if the area is an overlord spot, 0 if it isn't and -1 if the arena ran out of memory.
+*/
 static int flood_fill_overlord(MemoryArena *arena, uint8_t *heights, uint8_t *point_status, int grid_width, int grid_height, int x, int y, uint8_t target_height, uint8_t replacement, KeyContainer* current_set)
 {
     VecInt *nodes_to_visit = InitVecInt(arena, grid_width*grid_height);
+    if (!nodes_to_visit)
+    {
+        return -1;
+    }
 
     nodes_to_visit = PushToVecInt(nodes_to_visit, y*grid_width + x);
 
@@ -1438,6 +3667,10 @@ static int flood_fill_overlord(MemoryArena *arena, uint8_t *heights, uint8_t *po
         if (point_status[key] & IN_CURRENT_SET) continue;
         
         current_set->keys = PushToVecInt(current_set->keys, key);
+        if (!current_set->keys)
+        {
+            return -1;
+        }
         point_status[key] |= IN_CURRENT_SET;
 
         if (target_height != heights[key])
@@ -1461,24 +3694,44 @@ static int flood_fill_overlord(MemoryArena *arena, uint8_t *heights, uint8_t *po
         if (row > 0)
         {
             nodes_to_visit = PushToVecInt(nodes_to_visit, key - grid_width);
+            if (!nodes_to_visit)
+            {
+                return -1;
+            }
         }
         if (col > 0)
         {
             nodes_to_visit = PushToVecInt(nodes_to_visit, key - 1);
+            if (!nodes_to_visit)
+            {
+                return -1;
+            }
         }
         if (row < grid_height - 1)
         {
             nodes_to_visit = PushToVecInt(nodes_to_visit, key + grid_width);
+            if (!nodes_to_visit)
+            {
+                return -1;
+            }
         }
         if (col < grid_width - 1)
         {
             nodes_to_visit = PushToVecInt(nodes_to_visit, key + 1);
+            if (!nodes_to_visit)
+            {
+                return -1;
+            }
         }
     }
 
     return result;
 }
 
+/*
+Find the nodes that can be reached from x, y within max_distance.
+Returns NULL if the arena ran out of memory.
+*/
 static VecInt* get_nodes_within_distance(MemoryArena *arena, float* weights, int w, int h, int x, int y, float max_distance)
 {
     PriorityQueue *nodes_to_visit = queue_create(arena, w*h);
@@ -1486,6 +3739,11 @@ static VecInt* get_nodes_within_distance(MemoryArena *arena, float* weights, int
     int start = w*y + x;
     Node start_node = { start, 0.0f, 1 };
     float *costs = (float*) PushToMemoryArena(arena, w*h*sizeof(float));
+    VecInt *nodes_within_reach = InitVecInt(arena, min_int(200, (int)(max_distance * max_distance)));
+    if (!nodes_to_visit || !costs || !nodes_within_reach)
+    {
+        return NULL;
+    }
 
     for (int i = 0; i < w*h; ++i)
     {
@@ -1498,14 +3756,16 @@ static VecInt* get_nodes_within_distance(MemoryArena *arena, float* weights, int
 
     int nbrs[8];
 
-    VecInt *nodes_within_reach = InitVecInt(arena, min_int(200, (int)(max_distance * max_distance)));
-
     float nbr_costs[8] = { SQRT2, 1.0f, SQRT2, 1.0f, 1.0f, SQRT2, 1.0f, SQRT2 };
 
     while (nodes_to_visit->size > 0)
     {
         Node cur = queue_pop(nodes_to_visit);
         nodes_within_reach = PushToVecInt(nodes_within_reach, cur.idx);
+        if (!nodes_within_reach)
+        {
+            return NULL;
+        }
 
         int row = cur.idx / w;
         int col = cur.idx % w;
@@ -1547,8 +3807,9 @@ static VecInt* get_nodes_within_distance(MemoryArena *arena, float* weights, int
 
 /*
 Initialize a choke based on a single line
+Returns 0 if the arena ran out of memory.
 */
-static Choke choke_create_based_on_line(IntLine line)
+static int choke_create_based_on_line(Choke *result, IntLine line)
 {
     Choke choke = { 0 };
     choke.main_line.start[0] = (float)line.start[0];
@@ -1557,26 +3818,40 @@ static Choke choke_create_based_on_line(IntLine line)
     choke.main_line.end[1] = (float)line.end[1];
 
     choke.lines = InitVecIntLine(&state.function_arena, 50);
+    choke.side1 = InitVecInt(&state.function_arena, 50);
+    choke.side2 = InitVecInt(&state.function_arena, 50);
+    choke.pixels = InitVecInt(&state.function_arena, 100);
+    if (!choke.lines || !choke.side1 || !choke.side2 || !choke.pixels)
+    {
+        return 0;
+    }
+
+    //The vectors have room for these, so pushing can't fail
     choke.lines = PushToVecIntLine(choke.lines, line);
 
-    choke.side1 = InitVecInt(&state.function_arena, 50);
     choke.side1 = PushToVecInt(choke.side1, line.start[0]);
     choke.side1 = PushToVecInt(choke.side1, line.start[1]);
 
-    choke.side2 = InitVecInt(&state.function_arena, 50);
     choke.side2 = PushToVecInt(choke.side2, line.end[0]);
     choke.side2 = PushToVecInt(choke.side2, line.end[1]);
 
-    choke.pixels = InitVecInt(&state.function_arena, 100);
-
     choke.min_length = euclidean_distance(line.start[0], line.start[1], line.end[0], line.end[1]);
 
-    return choke;
+    *result = choke;
+    return 1;
 }
 
-static void choke_add_line(Choke* choke, IntLine line)
+/*
+Add a line to the choke and its ends to the sides of the choke.
+Returns 0 if the arena ran out of memory.
+*/
+static int choke_add_line(Choke* choke, IntLine line)
 {
     choke->lines = PushToVecIntLine(choke->lines, line);
+    if (!choke->lines)
+    {
+        return 0;
+    }
 
     int side1_contains_start = 0;
     int side1_size = choke->side1->size;
@@ -1593,7 +3868,11 @@ static void choke_add_line(Choke* choke, IntLine line)
     if (side1_contains_start == 0)
     {
         choke->side1 = PushToVecInt(choke->side1, line.start[0]);
-        choke->side1 = PushToVecInt(choke->side1, line.start[1]);
+        choke->side1 = choke->side1 ? PushToVecInt(choke->side1, line.start[1]) : NULL;
+        if (!choke->side1)
+        {
+            return 0;
+        }
     }
 
     int side2_contains_end = 0;
@@ -1611,11 +3890,20 @@ static void choke_add_line(Choke* choke, IntLine line)
     if (side2_contains_end == 0)
     {
         choke->side2 = PushToVecInt(choke->side2, line.end[0]);
-        choke->side2 = PushToVecInt(choke->side2, line.end[1]);
+        choke->side2 = choke->side2 ? PushToVecInt(choke->side2, line.end[1]) : NULL;
+        if (!choke->side2)
+        {
+            return 0;
+        }
     }
+    return 1;
 }
 
-static void chokes_solve(uint8_t *point_status, float* border_weights, uint8_t *walkable, ChokeLines* choke_lines, int w, int h, int x, int y, int x_start, int y_start, int x_end, int y_end)
+/*
+Add the lines that could be part of a choke starting from the border point at x, y to choke_lines.
+Returns 0 if an arena ran out of memory.
+*/
+static int chokes_solve(uint8_t *point_status, float* border_weights, uint8_t *walkable, ChokeLines* choke_lines, int w, int h, int x, int y, int x_start, int y_start, int x_end, int y_end)
 {
     float choke_distance = 13.0f;
     float choke_border_distance = 30.0f;
@@ -1625,6 +3913,11 @@ static void chokes_solve(uint8_t *point_status, float* border_weights, uint8_t *
         TempAllocation temp_alloc = StartTemporaryAllocation(&state.temp_arena);
 
         VecInt* reachable_borders = get_nodes_within_distance(&state.temp_arena, border_weights, w, h, x, y, choke_border_distance);
+        if (!reachable_borders)
+        {
+            EndTemporaryAllocation(temp_alloc);
+            return 0;
+        }
 
         int xmin = x;
         int xmax = min_int(x + (int)choke_distance, x_end);
@@ -1705,21 +3998,38 @@ static void chokes_solve(uint8_t *point_status, float* border_weights, uint8_t *
                     line.end[0] = xnew;
                     line.end[1] = ynew;
                     choke_lines->lines = PushToVecIntLine(choke_lines->lines, line);
+                    if (!choke_lines->lines)
+                    {
+                        EndTemporaryAllocation(temp_alloc);
+                        return 0;
+                    }
                 }
 
             }
         }
         EndTemporaryAllocation(temp_alloc);
     }
+    return 1;
 }
 
-static void choke_remove_excess_lines(Choke* choke)
+/*
+Keep only the lines of the choke that are close to the shortest one.
+Returns 0 if an arena ran out of memory.
+*/
+static int choke_remove_excess_lines(Choke* choke)
 {
     float min_distance = HUGE_VALF;
 
     TempAllocation temp_alloc = StartTemporaryAllocation(&state.temp_arena);
 
+    //Both vectors have room for every line, so only creating them can fail
     VecFloat *distances = InitVecFloat(&state.temp_arena, choke->lines->size);
+    VecIntLine *new_lines = InitVecIntLine(&state.function_arena, choke->lines->size);
+    if (!distances || !new_lines)
+    {
+        EndTemporaryAllocation(temp_alloc);
+        return 0;
+    }
 
     for(int i = 0; i < choke->lines->size; ++i)
     {
@@ -1732,8 +4042,6 @@ static void choke_remove_excess_lines(Choke* choke)
         }
     }
 
-    VecIntLine *new_lines = InitVecIntLine(&state.function_arena, choke->lines->size);
-
     for(int i = 0; i < choke->lines->size; ++i)
     {
         if (distances->items[i] <= min_distance + 2.5f)
@@ -1746,6 +4054,7 @@ static void choke_remove_excess_lines(Choke* choke)
 
     choke->lines = new_lines;
     choke->min_length = min_distance;
+    return 1;
 }
 
 static void choke_calc_final_line(Choke* choke)
@@ -1780,7 +4089,11 @@ static void choke_calc_final_line(Choke* choke)
     choke->main_line.end[1] = point2[1];
 }
 
-static void choke_set_pixels(Choke* choke)
+/*
+Add the points on the lines of the choke to its pixels.
+Returns 0 if the arena ran out of memory.
+*/
+static int choke_set_pixels(Choke* choke)
 {
     for (int l = 0; l < choke->lines->size; ++l)
     {
@@ -1813,12 +4126,21 @@ static void choke_set_pixels(Choke* choke)
             if(!contained)
             {
                 choke->pixels = PushToVecInt(choke->pixels, draw_x);
-                choke->pixels = PushToVecInt(choke->pixels, draw_y);
+                choke->pixels = choke->pixels ? PushToVecInt(choke->pixels, draw_y) : NULL;
+                if (!choke->pixels)
+                {
+                    return 0;
+                }
             }
         }
     }
+    return 1;
 }
 
+/*
+Group the choke lines that are next to each other into chokes.
+Returns NULL if an arena ran out of memory.
+*/
 static VecChoke* chokes_group(ChokeLines* choke_lines)
 {
     VecChoke *list = InitVecChoke(&state.function_arena, 100);
@@ -1826,6 +4148,11 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
     int line_count = choke_lines->lines->size;
     TempAllocation temp_alloc = StartTemporaryAllocation(&state.temp_arena);
     uint8_t *used_indices = (uint8_t*)PushToMemoryArena(&state.temp_arena, line_count*sizeof(uint8_t));
+    if (!list || !used_indices)
+    {
+        EndTemporaryAllocation(temp_alloc);
+        return NULL;
+    }
 
     for (int i = 0; i < line_count; ++i)
     {
@@ -1833,7 +4160,12 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
 
         used_indices[i] = 1;
 
-        Choke current_choke = choke_create_based_on_line(choke_lines->lines->items[i]);
+        Choke current_choke;
+        if (!choke_create_based_on_line(&current_choke, choke_lines->lines->items[i]))
+        {
+            EndTemporaryAllocation(temp_alloc);
+            return NULL;
+        }
 
         int last_line_count = 0;
         int current_line_count = current_choke.lines->size;
@@ -1865,7 +4197,11 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
 
                                 if (distance_heuristic(check_line.start[0], check_line.start[1], point_x, point_y, 1) > 0 || distance_heuristic(check_line.end[0], check_line.end[1], point2_x, point2_y, 1) > 0)
                                 {
-                                    choke_add_line(&current_choke, check_line);
+                                    if (!choke_add_line(&current_choke, check_line))
+                                    {
+                                        EndTemporaryAllocation(temp_alloc);
+                                        return NULL;
+                                    }
                                     added = 1;
                                 }
                                 break;
@@ -1888,7 +4224,11 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
                                 if (distance_heuristic(check_line.end[0], check_line.end[1], point_x, point_y, 1) > 0 && distance_heuristic(check_line.start[0], check_line.start[1], point2_x, point2_y, 1) > 0)
                                 {
                                     IntLine line_to_add = { { check_line.end[0], check_line.end[1] }, { check_line.start[0], check_line.start[1] }};
-                                    choke_add_line(&current_choke, line_to_add);
+                                    if (!choke_add_line(&current_choke, line_to_add))
+                                    {
+                                        EndTemporaryAllocation(temp_alloc);
+                                        return NULL;
+                                    }
                                     added = 1;
                                 }
                                 break;
@@ -1907,6 +4247,11 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
             current_line_count = current_choke.lines->size;
         }
         list = PushToVecChoke(list, current_choke);
+        if (!list)
+        {
+            EndTemporaryAllocation(temp_alloc);
+            return NULL;
+        }
     }
 
     EndTemporaryAllocation(temp_alloc);
@@ -1914,7 +4259,10 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
     int i = 0;
     while(i < list->size)
     {
-        choke_remove_excess_lines(&list->items[i]);
+        if (!choke_remove_excess_lines(&list->items[i]))
+        {
+            return NULL;
+        }
         choke_calc_final_line(&list->items[i]);
 
         if (list->items[i].lines->size < 4)
@@ -1923,7 +4271,10 @@ static VecChoke* chokes_group(ChokeLines* choke_lines)
         }
         else
         {
-            choke_set_pixels(&list->items[i]);
+            if (!choke_set_pixels(&list->items[i]))
+            {
+                return NULL;
+            }
             ++i;
         }
     }
@@ -2041,6 +4392,14 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
 
     uint8_t *point_status = (uint8_t *)PushToMemoryArena(&state.function_arena, w*h*sizeof(uint8_t));
     float *choke_weights = (float *)PushToMemoryArena(&state.function_arena, w*h*sizeof(float));
+    VecFloat *overlord_spot_arr = InitVecFloat(&state.function_arena, 60);
+    ChokeLines choke_lines = { NULL };
+    choke_lines.lines = InitVecIntLine(&state.function_arena, 1000);
+    if (!point_status || !choke_weights || !overlord_spot_arr || !choke_lines.lines)
+    {
+        ClearMemoryArena(&state.function_arena);
+        return PyErr_NoMemory();
+    }
 
     for ( int i = 0; i < w*h; ++i)
     {
@@ -2102,8 +4461,6 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
                 int xdir = dirs[2*d];
                 int ydir = dirs[2*d + 1];
 
-                int x0 = x;
-                int y0 = y;
                 int x1 = x + xdir;
                 int y1 = y + ydir;
                 int x2 = x + xdir * 2;
@@ -2170,17 +4527,13 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
         }
     }
 
-    VecFloat *overlord_spot_arr = InitVecFloat(&state.function_arena, 60);
-
     npy_intp climber_dims[2] = {h, w};
     PyArrayObject *climber_mat = (PyArrayObject*) PyArray_ZEROS(2, climber_dims, NPY_FLOAT32, 0);
 
-    ChokeLines choke_lines = { NULL };
-    choke_lines.lines = InitVecIntLine(&state.function_arena, 1000);
-
-    for (int y = y_start; y < y_end; ++y)
+    int out_of_memory = 0;
+    for (int y = y_start; y < y_end && !out_of_memory; ++y)
     {
-        for (int x = x_start; x < x_end; ++x)
+        for (int x = x_start; x < x_end && !out_of_memory; ++x)
         {
             if (point_status[w*y + x] & CLIMBABLE
                 && (point_status[w*y + x + 1] & CLIMBABLE
@@ -2200,7 +4553,8 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
                 KeyContainer c = { NULL };
                 TempAllocation temp_alloc = StartTemporaryAllocation(&state.temp_arena);
                 c.keys = InitVecInt(&state.temp_arena, 200);
-                if (flood_fill_overlord(&state.temp_arena, heights, point_status, w, h, x, y, target_height, 1, &c) == 1)
+                int filled = c.keys ? flood_fill_overlord(&state.temp_arena, heights, point_status, w, h, x, y, target_height, 1, &c) : -1;
+                if (filled == 1)
                 {
                     float spot[2] = { 0.0f, 0.0f };
                     
@@ -2218,11 +4572,15 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
                     spot[0] = spot[0] / (float)c.keys->size;
                     spot[1] = spot[1] / (float)c.keys->size;
                     overlord_spot_arr = PushToVecFloat(overlord_spot_arr, spot[1]);
-                    overlord_spot_arr = PushToVecFloat(overlord_spot_arr, spot[0]);
+                    overlord_spot_arr = overlord_spot_arr ? PushToVecFloat(overlord_spot_arr, spot[0]) : NULL;
+                    if (!overlord_spot_arr)
+                    {
+                        filled = -1;
+                    }
 
                     c.keys->size = 0;
                 }
-                else
+                else if (filled == 0)
                 {
                     for(int i = 0; i < c.keys->size; ++i)
                     {
@@ -2230,9 +4588,15 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
                     }
                     c.keys->size = 0;
 
-                    flood_fill_overlord(&state.temp_arena, heights, point_status, w, h, x, y, target_height, 0, &c);
+                    filled = flood_fill_overlord(&state.temp_arena, heights, point_status, w, h, x, y, target_height, 0, &c);
                 }
 
+                if (filled == -1)
+                {
+                    EndTemporaryAllocation(temp_alloc);
+                    out_of_memory = 1;
+                    break;
+                }
                
                 for(int i = 0; i < c.keys->size; ++i)
                 {
@@ -2242,11 +4606,21 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
 
             }
 
-            chokes_solve(point_status, choke_weights, walkable, &choke_lines, w, h, x, y, x_start, y_start, x_end, y_end);
+            if (!chokes_solve(point_status, choke_weights, walkable, &choke_lines, w, h, x, y, x_start, y_start, x_end, y_end))
+            {
+                out_of_memory = 1;
+            }
         }
     }
 
-    VecChoke *choke_list = chokes_group(&choke_lines);
+    VecChoke *choke_list = out_of_memory ? NULL : chokes_group(&choke_lines);
+    if (!choke_list)
+    {
+        Py_DECREF(climber_mat);
+        ClearMemoryArena(&state.function_arena);
+        ClearMemoryArena(&state.temp_arena);
+        return PyErr_NoMemory();
+    }
 
     npy_intp overlord_dims[2] = {overlord_spot_arr->size / 2, 2};
 
@@ -2273,10 +4647,92 @@ static PyObject* get_map_data(PyObject *self, PyObject *args)
     return return_tuple;
 }
 
+/*
+Exported function to report the memory held by the extension.
+Returns a dict with the bytes currently held by all arenas, the most held at once since the module
+was loaded or the peak was reset, the number of chunks and the bytes held by the arenas used for map data.
+*/
+static PyObject* memory_stats(PyObject *self, PyObject *args)
+{
+    int reset_peak = 0;
+    if (!PyArg_ParseTuple(args, "|p", &reset_peak))
+    {
+        return NULL;
+    }
+
+    size_t shared = 0;
+    MemoryArena *shared_arenas[2] = { &state.function_arena, &state.temp_arena };
+    for (int i = 0; i < 2; ++i)
+    {
+        for (MemoryChunk *chunk = shared_arenas[i]->chunk; chunk; chunk = chunk->previous)
+        {
+            shared += chunk->size;
+        }
+    }
+
+    PyThread_acquire_lock(memory_stats_lock, WAIT_LOCK);
+    MemoryStats stats = memory_stats_state;
+    if (reset_peak)
+    {
+        memory_stats_state.peak = memory_stats_state.current;
+    }
+    PyThread_release_lock(memory_stats_lock);
+
+    return Py_BuildValue("{s:n,s:n,s:n,s:n}", "current", (Py_ssize_t)stats.current, "peak", (Py_ssize_t)stats.peak,
+                         "chunks", (Py_ssize_t)stats.chunks, "shared", (Py_ssize_t)shared);
+}
+
+/*
+Exported function to release the memory of the arenas used for map data and the pooled search buffers.
+They get new memory the next time they are used.
+*/
+static PyObject* release_memory(PyObject *self, PyObject *args)
+{
+    FreeMemoryArena(&state.function_arena);
+    FreeMemoryArena(&state.temp_arena);
+    FreeSearchBufferPool();
+    return Py_BuildValue("");
+}
+
+/*
+Exported function to change the chunk sizes of the arenas used for map data.
+Takes in the chunk sizes in bytes for the function and temp arenas, the current memory is released.
+*/
+static PyObject* resize_arenas(PyObject *self, PyObject *args)
+{
+    Py_ssize_t function_size, temp_size;
+    if (!PyArg_ParseTuple(args, "nn", &function_size, &temp_size))
+    {
+        return NULL;
+    }
+    if (function_size <= 0 || temp_size <= 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "arena sizes must be positive");
+        return NULL;
+    }
+
+    FreeMemoryArena(&state.function_arena);
+    FreeMemoryArena(&state.temp_arena);
+    InitializeMemoryArena(&state.function_arena, (size_t)function_size);
+    InitializeMemoryArena(&state.temp_arena, (size_t)temp_size);
+    return Py_BuildValue("");
+}
+
 static PyMethodDef cext_methods[] = {
     {"astar", (PyCFunction)astar, METH_VARARGS, "astar"},
-    {"astar_with_nydus", (PyCFunction)astar_with_nydus, METH_VARARGS, "astar_with_nydus"},
+    {"astar_bounded", (PyCFunction)astar_bounded, METH_VARARGS, "astar_bounded"},
+    {"astar_many", (PyCFunction)astar_many, METH_VARARGS, "astar_many"},
+    {"astar_nearest", (PyCFunction)astar_nearest, METH_VARARGS, "astar_nearest"},
+    {"astar_with_portals", (PyCFunction)astar_with_portals, METH_VARARGS, "astar_with_portals"},
+    {"dijkstra_field", (PyCFunction)dijkstra_field, METH_VARARGS, "dijkstra_field"},
+    {"reachable", (PyCFunction)reachable, METH_VARARGS, "reachable"},
+    {"dstar_lite_create", (PyCFunction)dstar_lite_create, METH_VARARGS, "dstar_lite_create"},
+    {"dstar_lite_update", (PyCFunction)dstar_lite_update, METH_VARARGS, "dstar_lite_update"},
+    {"dstar_lite_path", (PyCFunction)dstar_lite_path, METH_VARARGS, "dstar_lite_path"},
     {"get_map_data", (PyCFunction)get_map_data, METH_VARARGS, "get_map_data"},
+    {"memory_stats", (PyCFunction)memory_stats, METH_VARARGS, "memory_stats"},
+    {"release_memory", (PyCFunction)release_memory, METH_NOARGS, "release_memory"},
+    {"resize_arenas", (PyCFunction)resize_arenas, METH_VARARGS, "resize_arenas"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -2285,15 +4741,11 @@ static struct PyModuleDef cext_module = {
 };
 
 PyMODINIT_FUNC PyInit_mapanalyzerext(void) {
-    size_t total_space = 50*1024*1024;
-    uint8_t* extension_memory = (uint8_t*)malloc(total_space);
-    if(!extension_memory) return NULL;
-
-    size_t function_space = (size_t)(0.8*total_space);
-    size_t temp_space = total_space - function_space;
+    memory_stats_lock = PyThread_allocate_lock();
+    if (!memory_stats_lock) return PyErr_NoMemory();
 
-    InitializeMemoryArena(&state.function_arena, function_space, extension_memory);
-    InitializeMemoryArena(&state.temp_arena, temp_space, extension_memory + function_space);
+    InitializeMemoryArena(&state.function_arena, DEFAULT_FUNCTION_ARENA_SIZE);
+    InitializeMemoryArena(&state.temp_arena, DEFAULT_TEMP_ARENA_SIZE);
     
     import_array();
     return PyModule_Create(&cext_module);
@@ -1,11 +1,22 @@
 import numpy as np
 
 try:
-    from .mapanalyzerext import astar as ext_astar, astar_with_nydus as ext_astar_nydus, get_map_data as ext_get_map_data
+    from .mapanalyzerext import (astar as ext_astar, astar_bounded as ext_astar_bounded, astar_many as ext_astar_many,
+                                 astar_nearest as ext_astar_nearest, astar_with_portals as ext_astar_portals,
+                                 dijkstra_field as ext_dijkstra_field, dstar_lite_create as ext_dstar_lite_create,
+                                 dstar_lite_path as ext_dstar_lite_path, dstar_lite_update as ext_dstar_lite_update,
+                                 get_map_data as ext_get_map_data, memory_stats, reachable as ext_reachable,
+                                 release_memory, resize_arenas)
 except ImportError:
-    from mapanalyzerext import astar as ext_astar, astar_with_nydus as ext_astar_nydus, get_map_data as ext_get_map_data
+    from mapanalyzerext import (astar as ext_astar, astar_bounded as ext_astar_bounded, astar_many as ext_astar_many,
+                                astar_nearest as ext_astar_nearest, astar_with_portals as ext_astar_portals,
+                                dijkstra_field as ext_dijkstra_field, dstar_lite_create as ext_dstar_lite_create,
+                                dstar_lite_path as ext_dstar_lite_path, dstar_lite_update as ext_dstar_lite_update,
+                                get_map_data as ext_get_map_data, memory_stats, reachable as ext_reachable,
+                                release_memory, resize_arenas)
 
-from typing import Optional, Tuple, Union, List, Set
+from enum import IntEnum
+from typing import Optional, Sequence, Tuple, Union, List, Set
 from sc2.position import Point2, Rect
 
 
@@ -41,6 +52,30 @@ class CMapChoke:
         return f"[{self.id}]CMapChoke; {len(self.pixels)}"
 
 
+# offsets to add to a grid point to take a step in the direction found in a flow field
+# NO_DIRECTION marks the goal and points that can't reach it
+FLOW_FIELD_OFFSETS = np.array([
+    [-1, -1], [-1, 0], [-1, 1],
+    [0, -1], [0, 1],
+    [1, -1], [1, 0], [1, 1]
+], dtype=np.int32)
+NO_DIRECTION = 255
+
+
+class PathStatus(IntEnum):
+    """
+    Outcome of a path search
+    FOUND the path reaches the goal
+    UNREACHABLE the goal can't be reached
+    EXPANSION_LIMIT, COST_LIMIT, DISTANCE_LIMIT the search was stopped by one of its limits
+    before reaching the goal, the path leads to the point closest to the goal that was found
+    """
+    FOUND = 0
+    UNREACHABLE = 1
+    EXPANSION_LIMIT = 2
+    COST_LIMIT = 3
+    DISTANCE_LIMIT = 4
+
 # each map can have a list of exceptions, each
 # exception should be a type where we can index into a grid
 # grid[ex[0], ex[1]] = ...
@@ -54,18 +89,66 @@ climber_grid_exceptions = {
 }
 
 
+def _jps_flag(jps: Optional[bool]) -> int:
+    # the c extension takes -1 for choosing automatically
+    return -1 if jps is None else int(jps)
+
+
+def _prepare_weights(weights: np.ndarray, min_weight: Optional[float] = None) -> Tuple[np.ndarray, float]:
+    # The c extension reads the grid in place, so only grids that aren't
+    # C-contiguous float32 already get copied.
+    # The minimum is needed both for validation and as the heuristic baseline,
+    # callers that reuse a grid can pass it in to skip scanning the grid.
+    # A minimum that is passed in isn't checked, so it has to match the grid as it is now.
+    weights = np.ascontiguousarray(weights, dtype=np.float32)
+    if min_weight is None:
+        min_weight = float(weights.min(axis=None))
+    # For the heuristic to be valid, each move must have a positive cost.
+    # Demand costs above 1 so floating point inaccuracies aren't a problem
+    # when comparing costs
+    if min_weight < 1:
+        raise ValueError("Minimum cost to move must be above or equal to 1, but got %f" % min_weight)
+    return weights, min_weight
+
+
 def astar_path(
         weights: np.ndarray,
         start: Tuple[int, int],
         goal: Tuple[int, int],
         large: bool = False,
-        smoothing: bool = False) -> Union[np.ndarray, None]:
-    # For the heuristic to be valid, each move must have a positive cost.
-    # Demand costs above 1 so floating point inaccuracies aren't a problem
-    # when comparing costs
-    if weights.min(axis=None) < 1:
-        raise ValueError("Minimum cost to move must be above or equal to 1, but got %f" % (
-            weights.min(axis=None)))
+        smoothing: bool = False,
+        jps: Optional[bool] = None,
+        min_weight: Optional[float] = None,
+        max_expansions: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        max_distance: Optional[float] = None,
+        return_status: bool = False,
+        any_angle: bool = False,
+        bidirectional: bool = False,
+        sensitivity: int = 0,
+        uniform: Optional[bool] = None) -> Union[np.ndarray, None, Tuple[Optional[np.ndarray], PathStatus]]:
+    # jps selects jump point search, which only expands a few nodes on grids
+    # where every pathable point has the same weight. By default it's used when
+    # the grid is uniform, True forces it and treats every pathable point as the same weight.
+    # Large units always use the regular search.
+    # min_weight is the minimum of the grid if the caller already knows it.
+    # max_expansions, max_cost and max_distance (from the start) bound the search,
+    # if one of them stops it the path leads to the expanded point closest to the goal.
+    # Bounded searches always use the regular search.
+    # With return_status a tuple of the path and its PathStatus is returned.
+    # any_angle searches with lazy theta*, which returns waypoints that have
+    # a straight line of sight between them, like smoothing but without a second pass.
+    # It isn't used for large units or combined with the limits.
+    # bidirectional runs the search from both ends until they meet, which expands
+    # fewer points on long paths. It replaces jps and can't be combined with the limits or any_angle.
+    # A sensitivity of 1 or more slices the path like MapAnalyzerPather does,
+    # the start is dropped, every sensitivity-th point and the goal are kept.
+    # uniform says whether every pathable point of the grid has the same weight if the caller already knows it,
+    # otherwise the extension scans the grid when jps is None or any_angle needs to pick lazy theta*.
+    weights, min_weight = _prepare_weights(weights, min_weight)
+    for name, limit in (("max_expansions", max_expansions), ("max_cost", max_cost), ("max_distance", max_distance)):
+        if limit is not None and limit < 0:
+            raise ValueError(f"{name} can't be negative, but got {limit}")
     # Ensure start is within bounds.
     if (start[0] < 0 or start[0] >= weights.shape[0] or
             start[1] < 0 or start[1] >= weights.shape[1]):
@@ -79,24 +162,216 @@ def astar_path(
     start_idx = np.ravel_multi_index(start, (height, width))
     goal_idx = np.ravel_multi_index(goal, (height, width))
 
-    path = ext_astar(
-        weights.flatten(), height, width, start_idx, goal_idx, large, smoothing
-    )
+    bounded = max_expansions is not None or max_cost is not None or max_distance is not None
+    if bounded and any_angle:
+        raise ValueError("any_angle searches can't be combined with max_expansions, max_cost or max_distance")
+    if bidirectional and (bounded or any_angle):
+        raise ValueError("bidirectional searches can't be combined with any_angle, max_expansions, max_cost "
+                         "or max_distance")
 
+    if not bounded:
+        path = ext_astar(
+            weights, height, width, start_idx, goal_idx, large, smoothing, _jps_flag(jps), min_weight, any_angle,
+            bidirectional, sensitivity, _jps_flag(uniform)
+        )
+        status = PathStatus.FOUND if path is not None else PathStatus.UNREACHABLE
+    else:
+        # the extension takes 0 for no expansion limit and negative values for no cost or distance limit
+        path, status = ext_astar_bounded(
+            weights, height, width, start_idx, goal_idx, large, smoothing, min_weight,
+            max_expansions or 0, -1 if max_cost is None else max_cost, -1 if max_distance is None else max_distance,
+            sensitivity
+        )
+        status = PathStatus(status)
+
+    if return_status:
+        return path, status
     return path
 
-def astar_path_with_nyduses(weights: np.ndarray,
+def astar_path_many(
+        weights: np.ndarray,
+        starts: np.ndarray,
+        goals: np.ndarray,
+        large: bool = False,
+        smoothing: bool = False,
+        jps: Optional[bool] = None,
+        min_weight: Optional[float] = None) -> List[Optional[np.ndarray]]:
+    """
+    Find paths for multiple start and goal pairs in a single call to the c extension.
+    starts and goals are arrays of shape (N, 2). The grid is validated only once.
+    jps works like in astar_path, the grid is only checked for uniformity once.
+    Returns a list with a path for each pair, or None if the pair has no path.
+    """
+    starts = np.asarray(starts, dtype=np.int64).reshape((-1, 2))
+    goals = np.asarray(goals, dtype=np.int64).reshape((-1, 2))
+    if starts.shape != goals.shape:
+        raise ValueError(f"Got {starts.shape[0]} starts but {goals.shape[0]} goals.")
+
+    weights, min_weight = _prepare_weights(weights, min_weight)
+
+    height, width = weights.shape
+    for name, points in (("Start", starts), ("Goal", goals)):
+        outside = (points[:, 0] < 0) | (points[:, 0] >= height) | (points[:, 1] < 0) | (points[:, 1] >= width)
+        if np.any(outside):
+            raise ValueError(f"{name} of {tuple(points[np.argmax(outside)])} lies outside grid.")
+
+    start_indices = np.ravel_multi_index((starts[:, 0], starts[:, 1]), (height, width)).astype(np.int32)
+    goal_indices = np.ravel_multi_index((goals[:, 0], goals[:, 1]), (height, width)).astype(np.int32)
+
+    return ext_astar_many(weights, height, width, start_indices, goal_indices, large, smoothing,
+                          _jps_flag(jps), min_weight)
+
+
+def astar_path_to_nearest(
+        weights: np.ndarray,
         start: Tuple[int, int],
+        goals: np.ndarray,
+        large: bool = False,
+        smoothing: bool = False,
+        min_weight: Optional[float] = None) -> Optional[Tuple[int, np.ndarray, float]]:
+    """
+    Find the cheapest path from start to any of the goals with a single search.
+    goals is an array of shape (K, 2).
+    Returns a tuple of (index of the reached goal in goals, path, cost of the path) or None.
+    """
+    goals = np.asarray(goals, dtype=np.int64).reshape((-1, 2))
+    if goals.shape[0] == 0:
+        raise ValueError("At least one goal is required.")
+
+    weights, min_weight = _prepare_weights(weights, min_weight)
+    # Ensure start is within bounds.
+    if (start[0] < 0 or start[0] >= weights.shape[0] or
+            start[1] < 0 or start[1] >= weights.shape[1]):
+        raise ValueError(f"Start of {start} lies outside grid.")
+
+    height, width = weights.shape
+    outside = (goals[:, 0] < 0) | (goals[:, 0] >= height) | (goals[:, 1] < 0) | (goals[:, 1] >= width)
+    if np.any(outside):
+        raise ValueError(f"Goal of {tuple(goals[np.argmax(outside)])} lies outside grid.")
+
+    start_idx = np.ravel_multi_index(start, (height, width))
+    goal_indices = np.ravel_multi_index((goals[:, 0], goals[:, 1]), (height, width)).astype(np.int32)
+
+    return ext_astar_nearest(weights, height, width, start_idx, goal_indices, large, smoothing, min_weight)
+
+
+def flow_field(
+        weights: np.ndarray,
         goal: Tuple[int, int],
-        nydus_positions: List[Point2],
         large: bool = False,
-        smoothing: bool = False) -> Union[List[np.ndarray], None]:
-    # For the heuristic to be valid, each move must have a positive cost.
-    # Demand costs above 1 so floating point inaccuracies aren't a problem
-    # when comparing costs
-    if weights.min(axis=None) < 1:
-        raise ValueError("Minimum cost to move must be above or equal to 1, but got %f" % (
-            weights.min(axis=None)))
+        min_weight: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run a single dijkstra search from the goal over the whole grid.
+    Returns a float32 array with the cost of reaching the goal from each point (inf if it can't be reached)
+    and a uint8 array with the index into FLOW_FIELD_OFFSETS of the next step towards the goal.
+    min_weight is the minimum of the grid if the caller already knows it, it's only used for validation.
+    """
+    weights, _ = _prepare_weights(weights, min_weight)
+    # Ensure goal is within bounds.
+    if (goal[0] < 0 or goal[0] >= weights.shape[0] or
+            goal[1] < 0 or goal[1] >= weights.shape[1]):
+        raise ValueError(f"Goal of {goal} lies outside grid.")
+
+    height, width = weights.shape
+    goal_idx = np.ravel_multi_index(goal, (height, width))
+
+    return ext_dijkstra_field(weights, height, width, goal_idx, large)
+
+
+
+def reachable_within(
+        weights: np.ndarray,
+        start: Tuple[int, int],
+        max_cost: float,
+        large: bool = False,
+        min_weight: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Run a single dijkstra search from start that stops at max_cost.
+    Returns an (N, 2) int32 array with every point that can be reached within max_cost,
+    cheapest first, and a float32 array with the cost of reaching each of them.
+    min_weight is the minimum of the grid if the caller already knows it, it's only used for validation.
+    """
+    if max_cost < 0:
+        raise ValueError(f"max_cost of {max_cost} can't be negative.")
+    weights, _ = _prepare_weights(weights, min_weight)
+    # Ensure start is within bounds.
+    if (start[0] < 0 or start[0] >= weights.shape[0] or
+            start[1] < 0 or start[1] >= weights.shape[1]):
+        raise ValueError(f"Start of {start} lies outside grid.")
+
+    height, width = weights.shape
+    start_idx = np.ravel_multi_index(start, (height, width))
+
+    return ext_reachable(weights, height, width, start_idx, max_cost, large)
+
+class DStarLitePlanner:
+    """
+    Incremental planner for a single goal, backed by a D* Lite search in the c extension.
+    The planner keeps its own copy of the grid. When weights change, only the changed points
+    are given to update, and the next find_path call repeats only the affected part of the search.
+    The start can move between calls, for example to the current position of the unit.
+    Not safe to use from multiple threads at the same time.
+    """
+
+    def __init__(self, weights: np.ndarray, start: Tuple[int, int], goal: Tuple[int, int], large: bool = False,
+                 min_weight: Optional[float] = None):
+        weights, _ = _prepare_weights(weights, min_weight)
+        self.shape = weights.shape
+        self.start = self._check_point(start, "Start")
+        self.goal = self._check_point(goal, "Goal")
+        self.large = large
+
+        self._planner = ext_dstar_lite_create(weights, self.shape[0], self.shape[1],
+                                              np.ravel_multi_index(self.start, self.shape),
+                                              np.ravel_multi_index(self.goal, self.shape), large)
+
+    def _check_point(self, point: Tuple[int, int], name: str) -> Tuple[int, int]:
+        if (point[0] < 0 or point[0] >= self.shape[0] or
+                point[1] < 0 or point[1] >= self.shape[1]):
+            raise ValueError(f"{name} of {point} lies outside grid.")
+        return int(point[0]), int(point[1])
+
+    def update(self, points: np.ndarray, weights: Union[float, np.ndarray]) -> None:
+        """
+        Change the weights of the points, an array of shape (N, 2).
+        weights is either a single weight for all the points or one for each point.
+        """
+        points = np.asarray(points, dtype=np.int64).reshape((-1, 2))
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float32), (points.shape[0],))
+        if weights.size and weights.min() < 1:
+            raise ValueError("Minimum cost to move must be above or equal to 1, but got %f" % weights.min())
+        outside = ((points[:, 0] < 0) | (points[:, 0] >= self.shape[0]) |
+                   (points[:, 1] < 0) | (points[:, 1] >= self.shape[1]))
+        if np.any(outside):
+            raise ValueError(f"Point of {tuple(points[np.argmax(outside)])} lies outside grid.")
+
+        indices = np.ravel_multi_index((points[:, 0], points[:, 1]), self.shape).astype(np.int32)
+        ext_dstar_lite_update(self._planner, indices, np.ascontiguousarray(weights))
+
+    def find_path(self, start: Optional[Tuple[int, int]] = None) -> Optional[np.ndarray]:
+        """
+        Returns the path from start (or the previous start) to the goal
+        like astar_path does, or None if the goal can't be reached.
+        """
+        if start is not None:
+            self.start = self._check_point(start, "Start")
+        return ext_dstar_lite_path(self._planner, np.ravel_multi_index(self.start, self.shape))
+
+
+def astar_path_with_portals(weights: np.ndarray,
+        start: Tuple[int, int],
+        goal: Tuple[int, int],
+        portals: Sequence[Tuple[Tuple[int, int], Tuple[int, int], float]],
+        large: bool = False,
+        smoothing: bool = False,
+        min_weight: Optional[float] = None) -> Optional[List[np.ndarray]]:
+    """
+    Find a path where, besides walking on the grid, the search can take portals.
+    A portal is a tuple of (entry cell, exit cell, cost) and works like a one way
+    edge between the two cells. Exits can be unpathable cells, those are left through portals only.
+    Returns the path split into segments where it goes through a portal, or None.
+    """
+    weights, min_weight = _prepare_weights(weights, min_weight)
     # Ensure start is within bounds.
     if (start[0] < 0 or start[0] >= weights.shape[0] or
             start[1] < 0 or start[1] >= weights.shape[1]):
@@ -107,18 +382,82 @@ def astar_path_with_nyduses(weights: np.ndarray,
         raise ValueError(f"Goal of {goal} lies outside grid.")
 
     height, width = weights.shape
+    cells = np.array([(entry[0], entry[1], exit[0], exit[1]) for entry, exit, _ in portals],
+                     dtype=np.int64).reshape((-1, 4))
+    costs = np.array([cost for _, _, cost in portals], dtype=np.float32)
+    outside = ((cells[:, 0::2] < 0) | (cells[:, 0::2] >= height)
+               | (cells[:, 1::2] < 0) | (cells[:, 1::2] >= width)).any(axis=1)
+    if np.any(outside):
+        raise ValueError(f"Portal of {portals[int(np.argmax(outside))]} lies outside grid.")
+    if not np.all(np.isfinite(costs) & (costs >= 0)):
+        raise ValueError("Portal costs must be finite and not negative.")
+
     start_idx = np.ravel_multi_index(start, (height, width))
     goal_idx = np.ravel_multi_index(goal, (height, width))
-    nydus_array = np.zeros((len(nydus_positions),), dtype=np.int32)
+    entries = np.ravel_multi_index((cells[:, 0], cells[:, 1]), (height, width)).astype(np.int32)
+    exits = np.ravel_multi_index((cells[:, 2], cells[:, 3]), (height, width)).astype(np.int32)
 
-    for index, pos in enumerate(nydus_positions):
-        nydus_idx = np.ravel_multi_index((int(pos.x), int(pos.y)), (height, width))
-        nydus_array[index] = nydus_idx
+    return ext_astar_portals(weights, height, width, entries, exits, costs,
+                             start_idx, goal_idx, large, smoothing, min_weight)
 
-    path = ext_astar_nydus(weights.flatten(), height, width, nydus_array.flatten(),
-                           start_idx, goal_idx, large, smoothing)
 
-    return path
+# Nydus networks are 3x3 buildings, units enter them from up to two cells away
+# and come out of the other ones at one of the 8 cells two steps away from the center
+_NYDUS_ENTRANCES = [(row, col) for row in range(-2, 3) for col in range(-2, 3) if row or col]
+_NYDUS_EXITS = [(row, col) for row in (-2, 0, 2) for col in (-2, 0, 2) if row or col]
+
+
+def _nydus_portals(weights: np.ndarray, nydus_cells: List[Tuple[int, int]],
+                   min_weight: float) -> List[Tuple[Tuple[int, int], Tuple[int, int], float]]:
+    height, width = weights.shape
+    portals = []
+    if len(nydus_cells) < 2:
+        return portals
+
+    def pathable(row: int, col: int) -> bool:
+        return 0 <= row < height and 0 <= col < width and weights[row, col] < np.inf
+
+    # Going into a nydus and getting out should take a bit more time than a single step on the grid,
+    # so those steps are scaled with 4
+    for center in nydus_cells:
+        for d_row, d_col in _NYDUS_ENTRANCES:
+            cell = (center[0] + d_row, center[1] + d_col)
+            if pathable(*cell):
+                portals.append((cell, center, 4 * float(weights[cell])))
+        for d_row, d_col in _NYDUS_EXITS:
+            cell = (center[0] + d_row, center[1] + d_col)
+            if pathable(*cell):
+                step = np.sqrt(2) if d_row and d_col else 1
+                portals.append((center, cell, 4 * float(weights[cell]) * step))
+        for other in nydus_cells:
+            if other != center:
+                portals.append((center, other, 4 * min_weight))
+    return portals
+
+
+def astar_path_with_nyduses(weights: np.ndarray,
+        start: Tuple[int, int],
+        goal: Tuple[int, int],
+        nydus_positions: List[Point2],
+        large: bool = False,
+        smoothing: bool = False,
+        min_weight: Optional[float] = None) -> Union[List[np.ndarray], None]:
+    """
+    astar_path_with_portals with portals between the given nydus networks.
+    Returns a single path segment if no nydus was used, otherwise one segment
+    ending at the nydus to go into and one starting at the nydus to come out from.
+    """
+    weights, min_weight = _prepare_weights(weights, min_weight)
+    nydus_cells = [(int(pos.x), int(pos.y)) for pos in nydus_positions]
+    portals = _nydus_portals(weights, nydus_cells, min_weight)
+
+    paths = astar_path_with_portals(weights, start, goal, portals, large, smoothing, min_weight)
+    if paths is None or len(paths) == 1:
+        return paths
+
+    # The segments are the walk to the entrance, the entrance itself, the exit and the walk from it.
+    # Coming out of the same nydus that was entered leaves out the exit segment.
+    return [np.concatenate(paths[:2]), np.concatenate(paths[-2:])]
 
 
 class CMapInfo:
@@ -1,15 +1,18 @@
 import lzma
 import os
 import pickle
+from collections import namedtuple
+
 import numpy as np
 
-from typing import List, Optional, TYPE_CHECKING, Union
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING, Union
 
 from s2clientprotocol.sc2api_pb2 import Response, ResponseObservation
 from sc2.bot_ai import BotAI
 from sc2.game_data import GameData
 from sc2.game_info import GameInfo, Ramp
 from sc2.game_state import GameState
+from sc2.ids.unit_typeid import UnitTypeId
 from sc2.position import Point2
 from sc2.unit import Unit
 
@@ -22,107 +25,148 @@ if TYPE_CHECKING:
     from MapAnalyzer.MapData import MapData
 
 
+# offset from the position of a unit to the corner of its footprint,
+# and the points of the footprint relative to that corner
+FootprintStamp = Tuple[Tuple[float, float], np.ndarray]
+
+
+def _rectangle_stamp(w: int, h: int) -> FootprintStamp:
+    return (w / 2, h / 2), np.argwhere(np.ones((w, h), dtype=bool))
+
+
+def _diagonal_stamp(bottom_left_to_upper_right: bool) -> FootprintStamp:
+    # the start and length of each row of the footprint, from the top row down for rocks going
+    # from the bottom left to the upper right and from the bottom row up for the other ones
+    rows = [(6, 2), (5, 4), (4, 6), (3, 7), (2, 7), (1, 7), (0, 7), (0, 6), (1, 4), (2, 2)]
+    mask = np.zeros((10, 10), dtype=bool)
+    for i, (start, length) in enumerate(rows):
+        mask[start:(start + length), (9 - i) if bottom_left_to_upper_right else i] = True
+    # the row of the position is the sixth one from the bottom
+    return (5, 0), np.argwhere(mask) - (0, 5)
+
+
+# footprints compiled into arrays, so the footprints of many units are stamped at once
+# index gives the row of each key, or -1 for keys without a footprint
+FootprintStamps = namedtuple("FootprintStamps", ["index", "offsets", "xs", "ys", "valid", "low", "high"])
+
+# this is checked with name because the id of the small mineral destructables
+# has changed over patches and may cause problems
+_MINERAL_FIELD_450 = max(type_id.value for type_id in UnitTypeId) + 1
+
+
+def _compile_stamps(stamps: Dict[int, FootprintStamp], default: Optional[FootprintStamp] = None) -> FootprintStamps:
+    rows = [default] if default is not None else []
+    index = np.full(_MINERAL_FIELD_450 + 1, 0 if default is not None else -1, dtype=int)
+    for key, stamp in stamps.items():
+        # the units that share a stamp share a row
+        row = next((i for i, row in enumerate(rows) if row is stamp), None)
+        if row is None:
+            row = len(rows)
+            rows.append(stamp)
+        index[key] = row
+
+    # the points of smaller footprints are padded and left out with valid
+    size = max(len(points) for _, points in rows)
+    offsets = np.array([offset for offset, _ in rows], dtype=float)
+    points = np.zeros((len(rows), size, 2), dtype=np.int32)
+    valid = np.zeros((len(rows), size), dtype=bool)
+    for i, (_, row_points) in enumerate(rows):
+        points[i, :len(row_points)] = row_points
+        valid[i, :len(row_points)] = True
+    low = np.array([row_points.min(axis=0) for _, row_points in rows])
+    high = np.array([row_points.max(axis=0) for _, row_points in rows])
+    return FootprintStamps(index, offsets, points[..., 0], points[..., 1], valid, low, high)
+
+
+def _get_structure_stamps() -> FootprintStamps:
+    stamps = {}
+    for type_ids, size in ((buildings_2x2, 2), (buildings_3x3, 3)):
+        for type_id in type_ids:
+            stamps[type_id.value] = _rectangle_stamp(size, size)
+    # townhall sized buildings should have their corner spots pathable
+    townhall_mask = np.ones((5, 5), dtype=bool)
+    townhall_mask[[0, 0, -1, -1], [0, -1, 0, -1]] = False
+    townhall_stamp = ((2.5, 2.5), np.argwhere(townhall_mask))
+    for type_id in buildings_5x5:
+        stamps[type_id.value] = townhall_stamp
+    # other structures take up a single point
+    return _compile_stamps(stamps, default=_rectangle_stamp(1, 1))
+
+
+def _get_destructable_stamps() -> FootprintStamps:
+    # for some reason on some maps like death aura the 6x6 rocks have a bit weird sizes,
+    # on golden wall this is an exact match, on death aura the height is one coordinate off
+    # and it varies whether the position is centered too high or too low, so the corners are left out
+    rocks_mask = np.ones((6, 6), dtype=bool)
+    rocks_mask[[0, 0, -1, -1], [0, -1, 0, -1]] = False
+    stamps = {_MINERAL_FIELD_450: ((1, 0), np.array([[0, 0], [1, 0]]))}
+    for type_ids, stamp in (
+            (destructable_2x2, _rectangle_stamp(2, 2)),
+            (destructable_2x4, _rectangle_stamp(2, 4)),
+            (destructable_2x6, _rectangle_stamp(2, 6)),
+            (destructable_4x2, _rectangle_stamp(4, 2)),
+            (destructable_4x4, _rectangle_stamp(4, 4)),
+            (destructable_6x2, _rectangle_stamp(6, 2)),
+            (destructable_6x6, ((3, 3), np.argwhere(rocks_mask))),
+            (destructable_12x4, _rectangle_stamp(12, 4)),
+            (destructable_4x12, _rectangle_stamp(4, 12)),
+            (destructable_BLUR, _diagonal_stamp(bottom_left_to_upper_right=True)),
+            (destructable_ULBR, _diagonal_stamp(bottom_left_to_upper_right=False)),
+    ):
+        for type_id in type_ids:
+            stamps[type_id.value] = stamp
+    return _compile_stamps(stamps)
+
+
+STRUCTURE_STAMPS = _get_structure_stamps()
+DESTRUCTABLE_STAMPS = _get_destructable_stamps()
+
+
+def get_footprint_points(positions: np.ndarray, keys: np.ndarray, stamps: FootprintStamps,
+                         shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the x and y indices of the points covered by the footprints of units at ``positions``,
+    ``keys`` picks the footprint of each unit from ``stamps``. Units without a footprint are skipped.
+    Points can repeat when footprints overlap.
+    """
+    positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+    rows = stamps.index[np.asarray(keys, dtype=int)]
+    positions, rows = positions[rows >= 0], rows[rows >= 0]
+
+    corners = (positions - stamps.offsets[rows]).astype(np.int32)
+    xs = corners[:, 0, None] + stamps.xs[rows]
+    ys = corners[:, 1, None] + stamps.ys[rows]
+    valid = stamps.valid[rows]
+    # the points are only checked one by one when a footprint crosses the edge of the grid
+    if np.any((corners + stamps.low[rows] < 0) | (corners + stamps.high[rows] >= shape)):
+        valid = valid & (xs >= 0) & (xs < shape[0]) & (ys >= 0) & (ys < shape[1])
+    return xs[valid], ys[valid]
+
+
+def get_structure_footprint_points(positions: np.ndarray, type_ids: np.ndarray,
+                                   shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Points covered by structures with the ``UnitTypeId`` values ``type_ids`` at ``positions``."""
+    return get_footprint_points(positions, type_ids, STRUCTURE_STAMPS, shape)
+
+
+def change_destructables_status_in_grid(grid: np.ndarray, units: Iterable[Unit], status: int):
+    """
+    Set destructable positions to status, modifies the grid in place
+    """
+    units = list(units)
+    if not units:
+        return
+    positions = [unit.position for unit in units]
+    keys = [_MINERAL_FIELD_450 if unit.name == "MineralField450" else unit.type_id.value for unit in units]
+    grid[get_footprint_points(positions, keys, DESTRUCTABLE_STAMPS, grid.shape)] = status
+
+
 def change_destructable_status_in_grid(grid: np.ndarray, unit: Unit, status: int):
     """
     Set destructable positions to status, modifies the grid in place
     """
-    type_id = unit.type_id
-    pos = unit.position
-    name = unit.name
-
-    # this is checked with name because the id of the small mineral destructables
-    # has changed over patches and may cause problems
-    if name == "MineralField450":
-        x = int(pos[0]) - 1
-        y = int(pos[1])
-        grid[x:(x + 2), y] = status
-    elif type_id in destructable_2x2:
-        w = 2
-        h = 2
-        x = int(pos[0] - w/2)
-        y = int(pos[1] - h/2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_2x4:
-        w = 2
-        h = 4
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_2x6:
-        w = 2
-        h = 6
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_4x2:
-        w = 4
-        h = 2
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_4x4:
-        w = 4
-        h = 4
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_6x2:
-        w = 6
-        h = 2
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_6x6:
-        # for some reason on some maps like death aura
-        # these rocks have a bit weird sizes
-        # on golden wall this is an exact match
-        # on death aura the height is one coordinate off
-        # and it varies whether the position is centered too high or too low
-        w = 6
-        h = 6
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), (y + 1):(y + h - 1)] = status
-        grid[(x + 1):(x + w - 1), y:(y + h)] = status
-    elif type_id in destructable_12x4:
-        w = 12
-        h = 4
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_4x12:
-        w = 4
-        h = 12
-        x = int(pos[0] - w / 2)
-        y = int(pos[1] - h / 2)
-        grid[x:(x + w), y:(y + h)] = status
-    elif type_id in destructable_BLUR:
-        x_ref = int(pos[0] - 5)
-        y_pos = int(pos[1])
-        grid[(x_ref + 6):(x_ref + 6 + 2), y_pos + 4] = status
-        grid[(x_ref + 5):(x_ref + 5 + 4), y_pos + 3] = status
-        grid[(x_ref + 4):(x_ref + 4 + 6), y_pos + 2] = status
-        grid[(x_ref + 3):(x_ref + 3 + 7), y_pos + 1] = status
-        grid[(x_ref + 2):(x_ref + 2 + 7), y_pos] = status
-        grid[(x_ref + 1):(x_ref + 1 + 7), y_pos - 1] = status
-        grid[(x_ref + 0):(x_ref + 0 + 7), y_pos - 2] = status
-        grid[(x_ref + 0):(x_ref + 0 + 6), y_pos - 3] = status
-        grid[(x_ref + 1):(x_ref + 1 + 4), y_pos - 4] = status
-        grid[(x_ref + 2):(x_ref + 2 + 2), y_pos - 5] = status
-
-    elif type_id in destructable_ULBR:
-        x_ref = int(pos[0] - 5)
-        y_pos = int(pos[1])
-        grid[(x_ref + 6):(x_ref + 6 + 2), y_pos - 5] = status
-        grid[(x_ref + 5):(x_ref + 5 + 4), y_pos - 4] = status
-        grid[(x_ref + 4):(x_ref + 4 + 6), y_pos - 3] = status
-        grid[(x_ref + 3):(x_ref + 3 + 7), y_pos - 2] = status
-        grid[(x_ref + 2):(x_ref + 2 + 7), y_pos - 1] = status
-        grid[(x_ref + 1):(x_ref + 1 + 7), y_pos] = status
-        grid[(x_ref + 0):(x_ref + 0 + 7), y_pos + 1] = status
-        grid[(x_ref + 0):(x_ref + 0 + 6), y_pos + 2] = status
-        grid[(x_ref + 1):(x_ref + 1 + 4), y_pos + 3] = status
-        grid[(x_ref + 2):(x_ref + 2 + 2), y_pos + 4] = status
+    change_destructables_status_in_grid(grid, [unit], status)
+
 
 def fix_map_ramps(bot: BotAI):
     """
@@ -130,8 +174,7 @@ def fix_map_ramps(bot: BotAI):
     to fix burnysc2 ramp objects by removing destructables
     """
     pathing_grid = bot.game_info.pathing_grid.data_numpy.T.copy()
-    for dest in bot.destructables:
-        change_destructable_status_in_grid(pathing_grid, dest, 1)
+    change_destructables_status_in_grid(pathing_grid, bot.destructables, 1)
 
     pathing = np.ndenumerate(pathing_grid.T)
 
@@ -1,5 +1,12 @@
-from MapAnalyzer.cext import CMapInfo, astar_path, astar_path_with_nyduses
+from concurrent.futures import ThreadPoolExecutor
+
+from MapAnalyzer.cext import (CMapInfo, DStarLitePlanner, astar_path, astar_path_many, astar_path_to_nearest,
+                              astar_path_with_nyduses, astar_path_with_portals, flow_field, memory_stats,
+                              reachable_within, release_memory, resize_arenas,
+                              PathStatus, FLOW_FIELD_OFFSETS, NO_DIRECTION)
+from MapAnalyzer.cext.wrapper import ext_astar
 import numpy as np
+import pytest
 from sc2.position import Rect, Point2
 import os
 
@@ -28,6 +35,11 @@ def load_pathing_grid(file_name):
     return res.astype(np.uint8)
 
 
+def path_cost(weights, path):
+    steps = np.linalg.norm(np.diff(path, axis=0), axis=1)
+    return float(np.sum(weights[path[1:, 0], path[1:, 1]] * steps))
+
+
 def test_c_extension():
     script_dir = os.path.dirname(__file__)
     abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
@@ -71,3 +83,482 @@ def test_c_extension():
     for choke in map_info.chokes:
         assert(choke.main_line[0] != choke.main_line[1])
 
+
+
+def test_c_extension_threads():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    goals = [(33, 38), (10, 30), (24, 30), (30, 5)] * 4
+    expected = [astar_path(pathing_grid, (3, 3), goal, False, False) for goal in goals]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda goal: astar_path(pathing_grid, (3, 3), goal, False, False), goals))
+
+    for result, path in zip(results, expected):
+        assert (result is not None and np.array_equal(result, path))
+
+
+def test_c_extension_many():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    starts = np.array([[3, 3], [3, 3], [33, 38], [3, 3]])
+    goals = np.array([[33, 38], [10, 30], [3, 3], [20, 20]])
+    paths = astar_path_many(pathing_grid, starts, goals, False, False)
+
+    assert (len(paths) == 4)
+    for i in range(3):
+        expected = astar_path(pathing_grid, tuple(starts[i]), tuple(goals[i]), False, False)
+        assert (paths[i].dtype == np.int32 and np.array_equal(paths[i], expected))
+    # unwalkable goal
+    assert (paths[3] is None)
+
+
+def test_c_extension_flow_field():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    pathing_grid[21:28, 5:20] = 100
+    goal = (33, 38)
+    costs, directions = flow_field(pathing_grid, goal, False)
+
+    assert (costs.dtype == np.float32 and directions.dtype == np.uint8)
+    assert (costs[goal] == 0 and directions[goal] == NO_DIRECTION)
+    assert (np.all(directions[pathing_grid == np.inf] == NO_DIRECTION))
+
+    # following the field should take the same number of steps as the astar path
+    point = np.array([3, 3])
+    steps = 1
+    while directions[tuple(point)] != NO_DIRECTION:
+        point = point + FLOW_FIELD_OFFSETS[directions[tuple(point)]]
+        steps += 1
+    path = astar_path(pathing_grid, (3, 3), goal, False, False)
+    assert (tuple(point) == goal and steps == path.shape[0])
+
+
+def test_c_extension_flow_field_costs():
+    # seeded so one of the grids has a decrease-key on the node that queue_pop moved to the top of the heap
+    rng = np.random.default_rng(17)
+    for _ in range(10):
+        grid = rng.uniform(1, 10, (39, 34)).astype(np.float32)
+        grid[rng.random(grid.shape) < 0.15] = np.inf
+        walkable = np.argwhere(grid < np.inf)
+
+        for large in (False, True):
+            goal = tuple(walkable[rng.integers(len(walkable))])
+            costs, _ = flow_field(grid, goal, large)
+            for start in rng.choice(walkable, 10):
+                start = tuple(start)
+                path = astar_path(grid, start, goal, large, jps=False)
+                if path is None:
+                    assert (costs[start] == np.inf)
+                else:
+                    # the field gives the cost of the cheapest path to the goal, like astar
+                    assert (costs[start] == pytest.approx(path_cost(grid, path), abs=0.1))
+
+
+def test_c_extension_nearest_goal():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    goals = np.array([[33, 38], [10, 30], [30, 5]])
+    goal_index, path, cost = astar_path_to_nearest(pathing_grid, (3, 3), goals, False, False)
+
+    expected_paths = [astar_path(pathing_grid, (3, 3), tuple(goal), False, False) for goal in goals]
+    expected_costs = [path_cost(pathing_grid, p) for p in expected_paths]
+    assert (goal_index == int(np.argmin(expected_costs)))
+    assert (tuple(path[0]) == (3, 3) and tuple(path[-1]) == tuple(goals[goal_index]))
+    assert (abs(cost - expected_costs[goal_index]) < 0.01)
+
+    # unreachable goals are just never reached
+    goals = np.array([[20, 20], [30, 5]])
+    goal_index, path, cost = astar_path_to_nearest(pathing_grid, (3, 3), goals, False, False)
+    assert (goal_index == 1)
+
+
+def test_c_extension_jps():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    walkable = np.argwhere(pathing_grid < np.inf)
+    rng = np.random.default_rng(0)
+
+    for start, goal in zip(rng.choice(walkable, 30), rng.choice(walkable, 30)):
+        start, goal = tuple(start), tuple(goal)
+        jps_path = astar_path(pathing_grid, start, goal, False, False, True)
+        astar_only_path = astar_path(pathing_grid, start, goal, False, False, False)
+        assert ((jps_path is None) == (astar_only_path is None))
+        if jps_path is None:
+            continue
+
+        assert (tuple(jps_path[0]) == start and tuple(jps_path[-1]) == goal)
+        steps = np.diff(jps_path, axis=0)
+        assert (np.all(np.abs(steps).max(axis=1) == 1))
+        assert (np.all(pathing_grid[jps_path[:, 0], jps_path[:, 1]] < np.inf))
+        # diagonal steps can't cut corners
+        for point, step in zip(jps_path[:-1], steps):
+            if step[0] != 0 and step[1] != 0:
+                assert (pathing_grid[point[0] + step[0], point[1]] < np.inf)
+                assert (pathing_grid[point[0], point[1] + step[1]] < np.inf)
+        assert (abs(path_cost(pathing_grid, jps_path) - path_cost(pathing_grid, astar_only_path)) < 0.1)
+
+    # weighted grids fall back to the regular search by default
+    weighted_grid = pathing_grid.copy()
+    weighted_grid[10:20, 10:30] *= 5
+    path = astar_path(weighted_grid, (3, 3), (33, 38), False, False)
+    expected = astar_path(weighted_grid, (3, 3), (33, 38), False, False, False)
+    assert (abs(path_cost(weighted_grid, path) - path_cost(weighted_grid, expected)) < 0.1)
+
+
+def test_c_extension_dstar_lite():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    walkable = np.argwhere(pathing_grid < np.inf)
+    rng = np.random.default_rng(0)
+
+    for large in (False, True):
+        grid = pathing_grid.copy()
+        start, goal = (3, 3), (33, 38)
+        planner = DStarLitePlanner(grid, start, goal, large)
+
+        for _ in range(10):
+            path = planner.find_path(start)
+            costs, _ = flow_field(grid, goal, large)
+            if path is None:
+                assert (costs[start] == np.inf)
+                break
+
+            assert (tuple(path[0]) == start and tuple(path[-1]) == goal)
+            assert (abs(path_cost(grid, path) - costs[start]) < 0.1)
+
+            # block and weight some points, some of them on the path, and move along the path
+            points = np.concatenate([walkable[rng.integers(len(walkable), size=10)], path[len(path) // 2:][:3]])
+            weights = rng.choice([1, 5, np.inf], size=len(points)).astype(np.float32)
+            grid[points[:, 0], points[:, 1]] = weights
+            planner.update(points, weights)
+            if len(path) > 3 and grid[tuple(path[2])] < np.inf:
+                start = tuple(path[2])
+
+
+def test_c_extension_weight_buffers():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    expected = astar_path(pathing_grid, (3, 3), (33, 38))
+
+    # other dtypes and layouts are converted before calling the extension
+    assert (np.array_equal(astar_path(pathing_grid.astype(np.float64), (3, 3), (33, 38)), expected))
+    transposed = astar_path(np.asfortranarray(pathing_grid.T).T, (3, 3), (33, 38))
+    assert (np.array_equal(transposed, expected))
+
+    # a known minimum skips scanning the grid
+    assert (np.array_equal(astar_path(pathing_grid, (3, 3), (33, 38), min_weight=1), expected))
+    with pytest.raises(ValueError):
+        astar_path(pathing_grid, (3, 3), (33, 38), min_weight=0.5)
+
+    # the extension reads any float32 buffer in place, but checks its type and size
+    height, width = pathing_grid.shape
+    path = ext_astar(memoryview(pathing_grid), height, width, 3 * width + 3, 33 * width + 38, False, False)
+    assert (np.array_equal(path, expected))
+    with pytest.raises(TypeError):
+        ext_astar(pathing_grid.astype(np.float64), height, width, 0, 1, False, False)
+    with pytest.raises(ValueError):
+        ext_astar(pathing_grid[:-1], height, width, 0, 1, False, False)
+
+
+def test_c_extension_bounded_search():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    start, goal = (3, 3), (33, 38)
+    full_path, status = astar_path(pathing_grid, start, goal, return_status=True)
+    assert (status == PathStatus.FOUND)
+
+    # limits that aren't hit don't change the path
+    path, status = astar_path(pathing_grid, start, goal, max_expansions=100000, max_cost=1000, return_status=True)
+    assert (status == PathStatus.FOUND)
+    assert (abs(path_cost(pathing_grid, path) - path_cost(pathing_grid, full_path)) < 0.1)
+
+    goal_distance = np.max(np.abs(np.array(goal) - start))
+    for limits, expected_status in (({"max_expansions": 20}, PathStatus.EXPANSION_LIMIT),
+                                     ({"max_cost": 10}, PathStatus.COST_LIMIT),
+                                     ({"max_distance": 8}, PathStatus.DISTANCE_LIMIT)):
+        path, status = astar_path(pathing_grid, start, goal, return_status=True, **limits)
+        assert (status == expected_status)
+        # the partial path is a valid path from the start towards the goal
+        assert (tuple(path[0]) == start and tuple(path[-1]) != goal)
+        assert (np.all(np.abs(np.diff(path, axis=0)).max(axis=1) == 1))
+        assert (np.max(np.abs(path[-1] - np.array(goal))) < goal_distance)
+        if "max_cost" in limits:
+            assert (path_cost(pathing_grid, path) <= limits["max_cost"])
+        if "max_distance" in limits:
+            assert (np.all(np.linalg.norm(path - np.array(start), axis=1) <= limits["max_distance"]))
+
+    # without limits an unreachable goal still gives no path
+    walled_grid = pathing_grid.copy()
+    walled_grid[30:37, 35:42] = np.inf
+    walled_grid[33, 38] = 1
+    assert (astar_path(walled_grid, start, goal, return_status=True) == (None, PathStatus.UNREACHABLE))
+    with pytest.raises(ValueError):
+        astar_path(pathing_grid, start, goal, max_cost=-1)
+
+
+def test_c_extension_memory():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+    height_map = np.where(walkable_grid == 0, 24, 8).astype(np.uint8)
+    playable_area = Rect([1, 1, 38, 38])
+
+    expected = CMapInfo(walkable_grid, height_map, playable_area, "CExtensionTest")
+    memory_stats(True)
+    stats = memory_stats()
+    assert (stats["shared"] > 0 and stats["current"] >= stats["shared"] and stats["peak"] == stats["current"])
+
+    # the arenas keep adding chunks when they run out of space
+    resize_arenas(1024, 1024)
+    assert (memory_stats()["shared"] == 0)
+    map_info = CMapInfo(walkable_grid, height_map, playable_area, "CExtensionTest")
+    assert (map_info.overlord_spots == expected.overlord_spots)
+    assert ([choke.pixels for choke in map_info.chokes] == [choke.pixels for choke in expected.chokes])
+    # only the first chunks are kept after the call
+    assert (0 < memory_stats()["shared"] < 16 * 1024)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    # search buffers are kept for the next search, the arena for the path is released
+    assert (astar_path(pathing_grid, (3, 3), (33, 38)) is not None)
+    before = memory_stats()["current"]
+    assert (astar_path(pathing_grid, (3, 3), (33, 38)) is not None)
+    stats = memory_stats()
+    assert (stats["current"] == before and stats["peak"] > before)
+
+    release_memory()
+    assert (memory_stats()["shared"] == 0)
+    resize_arenas(8 * 1024 * 1024, 2 * 1024 * 1024)
+
+
+def test_c_extension_search_buffer_reuse():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    pathing_grid[10:20, 10:30] *= 3
+    other_grid = np.ones((20, 30), dtype=np.float32)
+    walkable = np.argwhere(pathing_grid < np.inf)
+    rng = np.random.default_rng(1)
+    goal = (33, 38)
+    costs, _ = flow_field(pathing_grid, goal)
+
+    # searches reuse buffers, switching between grids and sizes must not leave stale costs behind
+    for start in rng.choice(walkable, 20):
+        start = tuple(start)
+        path = astar_path(pathing_grid, start, goal)
+        assert ((path is None) == (costs[start] == np.inf))
+        if path is not None:
+            assert (abs(path_cost(pathing_grid, path) - costs[start]) < 0.1)
+        assert (len(astar_path(other_grid, (0, 0), (19, 29))) == 30)
+
+
+def line_is_clear(weights, a, b):
+    # same line walk as the extension, without cutting corners on diagonal steps
+    (x, y), (x1, y1) = a, b
+    dx, dy = abs(x1 - x), abs(y1 - y)
+    sx, sy = (1 if x < x1 else -1), (1 if y < y1 else -1)
+    error = dx - dy
+    for _ in range(max(dx, dy)):
+        step_x, step_y = 2 * error > -dy, 2 * error < dx
+        if step_x and step_y and (weights[x + sx, y] == np.inf or weights[x, y + sy] == np.inf):
+            return False
+        if step_x:
+            error -= dy
+            x += sx
+        if step_y:
+            error += dx
+            y += sy
+        if weights[x, y] == np.inf:
+            return False
+    return True
+
+
+def test_c_extension_any_angle():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    walkable = np.argwhere(pathing_grid < np.inf)
+    rng = np.random.default_rng(0)
+
+    for start, goal in zip(rng.choice(walkable, 50), rng.choice(walkable, 50)):
+        start, goal = tuple(start), tuple(goal)
+        waypoints = astar_path(pathing_grid, start, goal, any_angle=True)
+        grid_path = astar_path(pathing_grid, start, goal, jps=False)
+        assert ((waypoints is None) == (grid_path is None))
+        if waypoints is None:
+            continue
+
+        assert (tuple(waypoints[0]) == start and tuple(waypoints[-1]) == goal)
+        assert (len(waypoints) <= len(grid_path))
+        assert (all(line_is_clear(pathing_grid, tuple(a), tuple(b)) for a, b in zip(waypoints[:-1], waypoints[1:])))
+        # on a uniform grid straight lines are never longer than the grid path
+        assert (path_cost(pathing_grid, waypoints) <= path_cost(pathing_grid, grid_path) + 0.1)
+
+    # weighted grids check the lines during the search
+    weighted_grid = pathing_grid.copy()
+    weighted_grid[10:20, 10:30] *= 5
+    waypoints = astar_path(weighted_grid, (3, 3), (33, 38), any_angle=True)
+    assert (all(line_is_clear(weighted_grid, tuple(a), tuple(b)) for a, b in zip(waypoints[:-1], waypoints[1:])))
+
+    with pytest.raises(ValueError):
+        astar_path(pathing_grid, (3, 3), (33, 38), any_angle=True, max_expansions=10)
+
+
+def test_c_extension_portals():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    start, goal = (3, 3), (33, 38)
+    path = astar_path(pathing_grid, start, goal, jps=False)
+
+    # no portals is a normal search
+    paths = astar_path_with_portals(pathing_grid, start, goal, [])
+    assert (len(paths) == 1 and np.array_equal(paths[0], path))
+
+    # a cheap portal is taken and splits the path
+    entry, exit = (4, 4), (32, 37)
+    paths = astar_path_with_portals(pathing_grid, start, goal, [(entry, exit, 2)])
+    assert (len(paths) == 2)
+    assert (tuple(paths[0][0]) == start and tuple(paths[0][-1]) == entry)
+    assert (tuple(paths[1][0]) == exit and tuple(paths[1][-1]) == goal)
+
+    # portals only go one way and expensive ones are ignored
+    paths = astar_path_with_portals(pathing_grid, start, goal, [(exit, entry, 2), (entry, exit, 1000)])
+    assert (len(paths) == 1 and path_cost(pathing_grid, paths[0]) == pytest.approx(path_cost(pathing_grid, path)))
+
+    # unpathable cells can be passed through with portals
+    blocked_grid = pathing_grid.copy()
+    blocked_grid[20, :] = np.inf
+    assert (astar_path(blocked_grid, start, goal) is None)
+    paths = astar_path_with_portals(blocked_grid, start, goal, [((19, 10), (20, 10), 1), ((20, 10), (21, 10), 1)])
+    assert (len(paths) == 3 and tuple(paths[1][0]) == (20, 10) and len(paths[1]) == 1)
+
+    with pytest.raises(ValueError):
+        astar_path_with_portals(pathing_grid, start, goal, [(entry, exit, -1)])
+    with pytest.raises(ValueError):
+        astar_path_with_portals(pathing_grid, start, goal, [(entry, (50, 50), 1)])
+
+
+def test_c_extension_reachable():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    start = (3, 3)
+    points, costs = reachable_within(pathing_grid, start, 12)
+
+    assert (tuple(points[0]) == start and costs[0] == 0)
+    assert (np.all(np.diff(costs) >= 0) and np.all(costs <= 12))
+
+    # on a uniform grid the cost from the start is the same as the cost to it
+    field_costs, _ = flow_field(pathing_grid, start)
+    assert (len(points) == np.count_nonzero(field_costs <= 12))
+    assert (np.allclose(costs, field_costs[points[:, 0], points[:, 1]]))
+
+    assert (len(reachable_within(pathing_grid, start, 0)[0]) == 1)
+    with pytest.raises(ValueError):
+        reachable_within(pathing_grid, start, -1)
+
+
+def test_c_extension_straight_line():
+    grid = np.ones((40, 40), dtype=np.float32)
+    start, goal = (2, 3), (30, 17)
+
+    # a clear line on a uniform grid is returned without searching
+    path = astar_path(grid, start, goal, jps=False)
+    assert (len(path) == 29 and tuple(path[0]) == start and tuple(path[-1]) == goal)
+    assert (np.all(np.abs(np.diff(path, axis=0)) <= 1))
+    assert (path_cost(grid, path) == pytest.approx(path_cost(grid, astar_path(grid, start, goal, jps=True))))
+    assert (np.array_equal(astar_path(grid, start, goal, smoothing=True), [start, goal]))
+    assert (np.array_equal(astar_path(grid, start, goal, any_angle=True), [start, goal]))
+
+    # more expensive or blocked points on the line need a search
+    weighted_grid = grid.copy()
+    weighted_grid[16, 10] = 5
+    path = astar_path(weighted_grid, start, goal)
+    assert (not np.any(np.all(path == (16, 10), axis=1)))
+
+    blocked_grid = grid.copy()
+    blocked_grid[5:25, 10] = np.inf
+    path = astar_path(blocked_grid, start, goal)
+    assert (path is not None and np.all(blocked_grid[path[:, 0], path[:, 1]] < np.inf))
+
+
+def test_c_extension_bidirectional():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    influenced_grid = pathing_grid.copy()
+    influenced_grid[10:25, 5:30] *= 4
+    walkable = np.argwhere(pathing_grid < np.inf)
+    rng = np.random.default_rng(0)
+
+    for grid in (pathing_grid, influenced_grid):
+        for large in (False, True):
+            for start, goal in zip(rng.choice(walkable, 25), rng.choice(walkable, 25)):
+                start, goal = tuple(start), tuple(goal)
+                path = astar_path(grid, start, goal, large, bidirectional=True)
+                grid_path = astar_path(grid, start, goal, large, jps=False)
+                assert ((path is None) == (grid_path is None))
+                if path is None:
+                    continue
+
+                assert (tuple(path[0]) == start and tuple(path[-1]) == goal)
+                assert (np.all(np.abs(np.diff(path, axis=0)) <= 1))
+                assert (path_cost(grid, path) == pytest.approx(path_cost(grid, grid_path), abs=0.1))
+
+    with pytest.raises(ValueError):
+        astar_path(pathing_grid, (3, 3), (33, 38), bidirectional=True, any_angle=True)
+
+
+def test_c_extension_sensitivity():
+    script_dir = os.path.dirname(__file__)
+    abs_file_path = os.path.join(script_dir, "pathing_grid.txt")
+    walkable_grid = load_pathing_grid(abs_file_path)
+
+    pathing_grid = np.where(walkable_grid == 0, np.inf, walkable_grid).astype(np.float32)
+    path = astar_path(pathing_grid, (3, 3), (33, 38))
+
+    for sensitivity in (1, 2, 5, 100):
+        sliced_path = astar_path(pathing_grid, (3, 3), (33, 38), sensitivity=sensitivity)
+        # the start is dropped and the goal is always kept
+        assert (np.array_equal(sliced_path, np.concatenate((path[sensitivity:-1:sensitivity], path[-1:]))))
+        assert (sliced_path.dtype == np.int32)
+
+    sliced_path, status = astar_path(pathing_grid, (3, 3), (33, 38), max_expansions=20, return_status=True,
+                                     sensitivity=3)
+    partial_path = astar_path(pathing_grid, (3, 3), (33, 38), max_expansions=20)
+    assert (np.array_equal(sliced_path, np.concatenate((partial_path[3:-1:3], partial_path[-1:]))))
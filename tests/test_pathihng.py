@@ -1,6 +1,8 @@
+import asyncio
 import os
 
 import numpy as np
+import pytest
 from _pytest.logging import LogCaptureFixture
 from _pytest.python import Metafunc
 from sc2.position import Point2
@@ -8,7 +10,10 @@ from sc2.position import Point2
 from MapAnalyzer import Region
 from MapAnalyzer.destructibles import *
 from MapAnalyzer.MapData import MapData
-from MapAnalyzer.utils import get_map_file_list, get_map_files_folder, mock_map_data
+from MapAnalyzer.cext import PathStatus
+from MapAnalyzer.utils import (change_destructable_status_in_grid, change_destructables_status_in_grid,
+                               get_map_file_list, get_map_files_folder, get_structure_footprint_points,
+                               mock_map_data)
 from tests.mocksetup import get_map_datas, get_random_point, logger
 
 logger = logger
@@ -120,6 +125,337 @@ def test_minerals_walls() -> None:
     assert (path is not None)
 
 
+def test_hierarchical_pathfinding() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start = map_data.bot.townhalls[0].position
+    goal = map_data.bot.enemy_start_locations[0]
+    grid = map_data.get_pyastar_grid()
+
+    def path_length(p):
+        return sum(p[i].distance_to(p[i + 1]) for i in range(len(p) - 1))
+
+    full_path = map_data.pathfind(start, goal, grid=grid)
+    path = map_data.pathfind_hierarchical(start, goal, grid=grid)
+    assert (path is not None and path[-1] == full_path[-1])
+    assert (len(path) < len(full_path))
+
+    # refining every segment gives a complete path that is close to the optimal one
+    refined_path = map_data.pathfind_hierarchical(start, goal, grid=grid, refined_segments=len(map_data.map_chokes) + 1)
+    assert (all(refined_path[i].distance_to(refined_path[i + 1]) < 1.5 for i in range(len(refined_path) - 1)))
+    assert (path_length(refined_path) < 1.1 * path_length(full_path))
+
+    # points in the same region use the regular search
+    region = map_data.where_all(start)[0]
+    assert (map_data.pathfind_hierarchical(start, region.center, grid=grid)
+            == map_data.pathfind(start, region.center, grid=grid))
+
+
+def test_ground_distance() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    bases = map_data.base_locations
+    grid = map_data.get_pyastar_grid()
+
+    assert (map_data.ground_distance(bases[0], bases[0]) == 0)
+    for base in bases[1:]:
+        distance = map_data.ground_distance(bases[0], base)
+        assert (distance == map_data.ground_distance(base, bases[0]))
+        path = map_data.pathfind(bases[0], base, grid=grid)
+        if path is None:
+            assert (distance == np.inf)
+        else:
+            assert (distance <= 1.5 * len(path))
+
+        # following the next hops leads to the destination
+        current = bases[0]
+        for _ in range(len(map_data.pather.ground_graph_nodes)):
+            current = map_data.ground_next_hop(current, base)
+            if current is None or current is base:
+                break
+        assert (current is (None if distance == np.inf else base))
+
+    # the distances are updated when destructables are removed
+    blocked = [base for base in bases if map_data.ground_distance(bases[0], base) == np.inf]
+    assert (blocked)
+    map_data.bot.destructables = map_data.bot.destructables.filter(lambda x: x.distance_to((46, 41)) > 5)
+    map_data.get_pyastar_grid()
+    assert (any(map_data.ground_distance(bases[0], base) < np.inf for base in blocked))
+
+
+def test_path_cache() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    expected = map_data.pathfind(start, goal, grid=grid)
+    assert (map_data.path_cache_info().misses == 0)
+
+    map_data.set_path_cache_size(2)
+    assert (map_data.pathfind(start, goal, grid=grid) == expected)
+    assert (map_data.pathfind((50.3, 74.8), goal, grid=grid) == expected)
+    assert (map_data.path_cache_info() == (1, 1, 2, 1))
+
+    # other arguments and other grids are cached separately
+    map_data.pathfind(start, goal, grid=grid, sensitivity=3)
+    map_data.pathfind(start, goal, grid=grid.copy())
+    assert (map_data.path_cache_info() == (1, 3, 2, 2))
+
+    # adding cost to the grid makes the cached paths unused
+    map_data.pathfind(start, goal, grid=grid)
+    grid = map_data.add_cost((75, 87), 10, grid)
+    influenced = map_data.pathfind(start, goal, grid=grid)
+    assert (influenced != expected)
+    assert (map_data.path_cache_info().misses == 5)
+
+    map_data.clear_path_cache()
+    assert (map_data.path_cache_info().currsize == 0)
+    map_data.set_path_cache_size(0)
+    map_data.pathfind(start, goal, grid=grid)
+    assert (map_data.path_cache_info().misses == 5)
+
+
+def test_grid_changed_in_place() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    expected = map_data.pathfind(start, goal, grid=grid)
+
+    # the second search on the same grid sees the weights that were changed with numpy
+    x, y = map(int, expected[len(expected) // 2])
+    block = grid[x - 6:x + 7, y - 6:y + 7]
+    block[block < np.inf] = 500
+    influenced = map_data.pathfind(start, goal, grid=grid)
+    assert (influenced != expected)
+    assert (influenced == map_data.pathfind(start, goal, grid=grid.copy()))
+
+    grid[grid < np.inf] = 0.5
+    with pytest.raises(ValueError):
+        map_data.pathfind(start, goal, grid=grid)
+
+
+def test_bounded_pathfinding() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    expected, status = map_data.pathfind(start, goal, grid=grid, return_status=True)
+    assert (status == PathStatus.FOUND)
+
+    partial, status = map_data.pathfind(start, goal, grid=grid, max_expansions=100, return_status=True)
+    assert (status == PathStatus.EXPANSION_LIMIT)
+    assert (partial[-1] != expected[-1])
+    assert (partial[-1].distance_to(Point2(goal)) < Point2(start).distance_to(Point2(goal)))
+
+    partial = map_data.pathfind(start, goal, grid=grid, max_distance=20)
+    assert (all(point.distance_to(Point2(start)) <= 20 for point in partial))
+
+
+def test_any_angle_pathfinding() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    grid_path = map_data.pathfind(start, goal, grid=grid, jps=False)
+    waypoints = map_data.pathfind(start, goal, grid=grid, any_angle=True)
+    assert (waypoints[-1] == grid_path[-1])
+    assert (len(waypoints) < len(grid_path))
+
+    def length(points):
+        return sum(a.distance_to(b) for a, b in zip([Point2(start), *points[:-1]], points))
+
+    assert (length(waypoints) <= length(grid_path))
+
+
+
+def test_portal_pathfinding() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    walked = map_data.pathfind_with_portals(start, goal, portals=[], grid=grid)
+    assert (len(walked) == 1 and walked[0] == map_data.pathfind(start, goal, grid=grid, jps=False))
+
+    entry, exit = (52, 75), (98, 100)
+    segments = map_data.pathfind_with_portals(start, goal, portals=[(entry, exit, 4)], grid=grid, sensitivity=3)
+    assert (len(segments) == 2)
+    assert (segments[0][-1] == Point2(entry) and segments[1][0] == Point2(exit) and segments[1][-1] == Point2(goal))
+
+
+def test_reachable_within() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start = (50, 75)
+    grid = map_data.get_pyastar_grid()
+    points, costs = map_data.reachable_within(start, 20, grid=grid)
+    assert (len(points) == len(costs) and np.all(costs <= 20))
+
+    goal = tuple(points[-1])
+    path = map_data.pathfind(start, goal, grid=grid)
+    assert (path is not None and path[-1] == Point2(goal))
+
+
+def test_unit_radius_pathfinding() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    clearance = map_data.get_clearance_grid(grid)
+    assert (np.all(clearance[grid == np.inf] == 0) and np.all(clearance[grid < np.inf] >= 0.5))
+    assert (map_data.get_clearance_grid(grid) is clearance)
+
+    thor_path = map_data.pathfind(start, goal, grid=grid, unit_radius=1.25)
+    assert (thor_path is not None and thor_path[-1].distance_to(Point2(goal)) < 3)
+    assert (all(clearance[point.rounded] >= 1.25 for point in thor_path))
+
+    # adding cost changes the grid, so the clearance is computed again
+    map_data.add_cost(position=(75, 85), radius=3, grid=grid, weight=np.inf)
+    new_clearance = map_data.get_clearance_grid(grid)
+    assert (new_clearance is not clearance and new_clearance[75, 85] == 0)
+
+
+def test_bidirectional_pathfinding() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (150, 140)
+    grid = map_data.get_pyastar_grid()
+    map_data.add_cost(position=(100, 100), radius=10, grid=grid, weight=20)
+    path = map_data.pathfind(start, goal, grid=grid, jps=False)
+    bidirectional_path = map_data.pathfind(start, goal, grid=grid, bidirectional=True)
+    assert (bidirectional_path[-1] == path[-1])
+
+    def cost(points):
+        return sum(grid[b.rounded] * a.distance_to(b) for a, b in zip([Point2(start), *points[:-1]], points))
+
+    assert (abs(cost(bidirectional_path) - cost(path)) < 0.5)
+
+
+def test_pathfind_as_array() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    start, goal = (50, 75), (100, 100)
+    grid = map_data.get_pyastar_grid()
+    map_data.add_cost(position=(75, 85), radius=5, grid=grid, weight=10)
+    for sensitivity in (1, 4):
+        path = map_data.pathfind(start, goal, grid=grid, sensitivity=sensitivity)
+        array_path = map_data.pathfind(start, goal, grid=grid, sensitivity=sensitivity, as_array=True)
+        assert (isinstance(array_path, np.ndarray) and array_path.dtype == np.int32)
+        assert (list(map(Point2, array_path)) == path)
+
+def test_find_eligible_point() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    pather = map_data.pather
+    grid = map_data.get_pyastar_grid()
+    terrain_height = pather.terrain_height.astype(int)
+
+    def closest_pathable(point):
+        # brute force over every pathable point, preferring the ones on the same level
+        points = np.argwhere(grid < np.inf)
+        distances = np.sum((points - point) ** 2, axis=1)
+        same_height = np.abs(terrain_height[points[:, 0], points[:, 1]] - terrain_height[point]) < 8
+        if np.any(same_height & (distances <= 100)):
+            distances = np.where(same_height, distances, np.inf)
+        return distances.min() if distances.min() <= 100 else None
+
+    for mineral in map_data.bot.mineral_field:
+        point = mineral.position.rounded
+        assert (grid[point] == np.inf)
+        eligible_point = pather.find_eligible_point(point, grid, pather.terrain_height, 10)
+        assert (grid[eligible_point] < np.inf)
+        assert (np.sum((np.array(eligible_point) - point) ** 2) == closest_pathable(point))
+
+    # blocking the grid moves the point out of the new obstacle
+    map_data.add_cost(position=(75, 85), radius=4, grid=grid, weight=np.inf)
+    eligible_point = pather.find_eligible_point((75, 85), grid, pather.terrain_height, 10)
+    assert (grid[eligible_point] < np.inf and np.sum((np.array(eligible_point) - (75, 85)) ** 2) == closest_pathable((75, 85)))
+
+
+def test_pathfind_async() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    grid = map_data.get_pyastar_grid()
+    map_data.add_cost(position=(75, 85), radius=5, grid=grid, weight=10)
+    requests = [((50, 75), (100, 100)), ((50.2, 75.1), (100, 100)), ((50, 75), (150, 140)), ((60, 60), (100, 100))]
+    map_data.set_path_cache_size(10)
+
+    async def request_paths():
+        futures = [map_data.pathfind_async(start, goal, grid=grid) for start, goal in requests]
+        await map_data.wait_for_paths()
+        assert (all(future.done() for future in futures))
+        return await asyncio.gather(*futures)
+
+    paths = asyncio.run(request_paths())
+    # the two requests with the same rounded points were calculated once
+    info = map_data.path_cache_info()
+    assert (info.hits + info.misses == 3)
+    assert (paths[0] == paths[1] and paths[0] is not paths[1])
+    map_data.set_path_cache_size(0)
+    assert (paths == [map_data.pathfind(start, goal, grid=grid) for start, goal in requests])
+    map_data.pather.pathing_service.shutdown()
+
+
+def test_grid_manager() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    townhall = map_data.bot.townhalls[0]
+    grid = map_data.get_pyastar_grid()
+    assert (grid[townhall.position.rounded] == np.inf)
+
+    # the grids are copies, changing one doesn't change the next
+    map_data.add_cost(position=(50, 75), radius=3, grid=map_data.get_pyastar_grid(), weight=np.inf)
+    assert (map_data.get_pyastar_grid()[50, 75] == 1)
+
+    structures = map_data.bot.structures
+    map_data.bot.structures = structures.filter(lambda s: s.tag != townhall.tag)
+    assert (map_data.get_pyastar_grid()[townhall.position.rounded] == 1)
+    assert (map_data.get_climber_grid()[townhall.position.rounded] == 1)
+    map_data.bot.structures = structures
+    assert (np.array_equal(map_data.get_pyastar_grid(), grid))
+    assert (map_data.get_pyastar_grid(default_weight=5)[townhall.position.rounded] == np.inf)
+
+
+def test_footprint_stamps() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    destructables = map_data.bot.destructables
+    grid = np.ones(map_data.pather.default_grid.shape, dtype=np.uint8)
+    change_destructables_status_in_grid(grid, destructables, 0)
+    for dest in destructables:
+        single_grid = np.ones_like(grid)
+        change_destructable_status_in_grid(single_grid, dest, 0)
+        assert (np.all(grid[single_grid == 0] == 0))
+    assert (np.sum(grid == 0) > 0)
+
+    # townhalls leave their corners pathable, unknown structures take up a single point
+    townhall = map_data.bot.townhalls[0]
+    xs, ys = get_structure_footprint_points([townhall.position, (10.5, 10.5)],
+                                            [townhall.type_id.value, UnitTypeId.CREEPTUMOR.value], grid.shape)
+    assert (len(xs) == 22 and (10, 10) in zip(xs, ys))
+    assert (townhall.position.rounded in zip(xs, ys))
+
+
+def test_add_costs() -> None:
+    path = os.path.join(get_map_files_folder(), 'GoldenWallLE.xz')
+    map_data = mock_map_data(path)
+    positions = np.array([(50.5, 75.2), (52, 78), (110.7, 40.1), (0.2, 0.4), (150, 95.5)])
+    radii = np.array([5, 3.5, 0.3, 2, 8])
+    weights = np.array([10, 20, 5, 30, 2.5])
+    for initial_default_weights in (0, 5):
+        grid = map_data.get_pyastar_grid()
+        for position, radius, weight in zip(positions, radii, weights):
+            grid = map_data.add_cost(position=position, radius=radius, grid=grid, weight=weight,
+                                     initial_default_weights=initial_default_weights)
+        batched_grid = map_data.add_costs(positions=positions, radii=radii, grid=map_data.get_pyastar_grid(),
+                                          weights=weights, initial_default_weights=initial_default_weights)
+        assert (np.allclose(batched_grid, grid))
+
+    # safe keeps the weights at 1 or more
+    grid = map_data.add_costs(positions=positions, radii=4, grid=map_data.get_pyastar_grid(), weights=-10)
+    assert (grid.min() == 1)
+
+
 class TestPathing:
     """
     Test DocString